@@ -0,0 +1,265 @@
+"""
+Offline benchmarks of loading, parsing, filtering, search, statistics and export
+
+Workbooks are generated synthetically and served by the fake Drive/Sheets backend, so runs need
+no credentials or network and are repeatable. Run from the repository root:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --scenario tall --scale 0.1 --compare results.json
+
+Results are written as JSON; --compare prints the change of every benchmark's median against
+an earlier results file and exits with status 1 when one is slower than --max-slowdown.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from benchmarks.workbooks import SCENARIOS, generate_workbook, scaled
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='workbook shape to run (repeatable, default: all)')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the rows of every scenario')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake API call')
+    parser.add_argument('--per-cell-latency', type=float, default=0.0,
+                        help='seconds added per cell returned by a fake values call')
+    parser.add_argument('--quota', type=int, default=None, help='fake API calls allowed per minute')
+    parser.add_argument('--workers', type=int, default=8, help='fetch engine worker threads')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help='with --compare, fail when a median grows by more than this factor')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The app reads its settings at import time: use a throwaway disk cache and no tracing
+    cache_dir = tempfile.mkdtemp(prefix='spreadsheet-explorer-bench-')
+    os.environ['WORKBOOK_CACHE_DIR'] = cache_dir
+    os.environ.setdefault('TRACING_ENABLED', 'false')
+    try:
+        results = run_benchmarks(args)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    report = {'environment': environment(), 'settings': vars(args), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Wrote {len(results)} results to {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 0 if compare(baseline['results'], results, args.max_slowdown) else 1
+    return 0
+
+
+def run_benchmarks(args):
+    from services.fetch_engine import FetchEngine
+    from tests.fake_google import FakeGoogleBackend
+
+    backend = FakeGoogleBackend(latency=args.latency, per_cell_latency=args.per_cell_latency,
+                                quota_per_minute=args.quota)
+    engine = FetchEngine(max_workers=args.workers, max_retries=8)
+    results = []
+    for scenario in args.scenario or list(SCENARIOS):
+        shape = scaled(scenario, args.scale)
+        print(f"{scenario}: {shape['tabs']} tabs of {shape['rows']} rows x {shape['columns']} columns")
+        workbook = generate_workbook(**shape)
+        for name, run, details in scenario_benchmarks(backend, engine, scenario, workbook):
+            if args.filter not in name:
+                continue
+            seconds = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                run()
+                seconds.append(time.perf_counter() - start)
+            result = {'scenario': scenario, 'benchmark': name, 'shape': shape, 'seconds': seconds,
+                      'median': statistics.median(seconds), 'min': min(seconds), **details()}
+            results.append(result)
+            print(f"  {name:<32} median {result['median'] * 1000:9.1f} ms   min {result['min'] * 1000:9.1f} ms")
+    return results
+
+
+def scenario_benchmarks(backend, engine, scenario, workbook):
+    """
+    (name, run, details) for every benchmark of a workbook; run() is timed and details() returns
+    extra result fields, such as API calls made by the last run
+    """
+    import utils.data_processing as data_processing
+    import utils.workbook_loader as workbook_loader
+    from utils.column_profile import SheetProfile
+    from utils.data_processing import filter_rows, get_numeric_stats, values_to_dataframe
+    from utils.file_operations import (create_download_csv_zip, create_download_excel,
+                                       create_download_parquet_zip)
+    from utils.workbook_loader import GOOGLE_SHEETS_MIME_TYPE, load_workbook
+
+    folder_id = backend.add_folder(scenario)
+    sheet_id = backend.add_spreadsheet(f'{scenario} sheet', folder_id, workbook)
+    frames = {title: values_to_dataframe(values) for title, values in workbook.items()}
+    excel_id = backend.add_blob(f'{scenario}.xlsx', folder_id, XLSX_MIME_TYPE, create_download_excel(frames, ''))
+    drive_service, sheets_service = backend.drive_service(), backend.sheets_service()
+
+    def load(file_id, file_type, new_revision, ingestion='values'):
+        last = {}
+
+        def run():
+            if new_revision:
+                # A new revision misses both the in-memory store and the disk cache
+                backend.update_file(file_id)
+            else:
+                # An empty in-memory store leaves the disk cache to serve the revision loaded before
+                workbook_loader.get_workbook_store.clear()
+            calls_before = sum(backend.calls.values())
+            with sheets_ingestion(workbook_loader, ingestion):
+                lease, load_stats = load_workbook(drive_service, sheets_service, file_id, file_type, engine=engine)
+            sheets_data = lease.workbook['sheets_data']
+            sheets_data.ensure_loaded()
+            last.update(api_calls=sum(backend.calls.values()) - calls_before, source=load_stats['source'])
+            lease.release()
+        return run, lambda: dict(last)
+
+    def export(create_export):
+        last = {}
+
+        def run():
+            last['bytes'] = len(create_export(frames, ''))
+        return run, lambda: dict(last)
+
+    benchmarks = [
+        ('load.google_sheets', *load(sheet_id, GOOGLE_SHEETS_MIME_TYPE, True)),
+        ('load.google_sheets.disk_cache', *load(sheet_id, GOOGLE_SHEETS_MIME_TYPE, False)),
+        ('load.google_sheets.export', *load(sheet_id, GOOGLE_SHEETS_MIME_TYPE, True, 'export')),
+        ('load.excel', *load(excel_id, XLSX_MIME_TYPE, True)),
+        ('parse.values_to_dataframe', lambda: [values_to_dataframe(values) for values in workbook.values()],
+         lambda: {'rows': sum(len(values) - 1 for values in workbook.values())}),
+    ]
+
+    # Filters and search on the largest tab, with and without the query engine, and statistics
+    title = max(frames, key=lambda name: frames[name].size)
+    df = frames[title]
+    category_column = next(col for col in df.columns if str(col).startswith('category'))
+    search_term = workbook[title][min(123, len(df))][0]
+    for query_engine_name in query_engine_names():
+        def with_engine(fn, query_engine_name=query_engine_name):
+            def run():
+                with query_engine(data_processing, query_engine_name):
+                    fn()
+            return run
+        benchmarks += [
+            (f'filter.values.{query_engine_name}',
+             with_engine(lambda: filter_rows(df, {category_column: ['North', 'Online']})), dict),
+            (f'filter.search.{query_engine_name}', with_engine(lambda: filter_rows(df, {}, search_term)), dict),
+        ]
+    # Statistics come from the column profiles: built in one pass over the rows, then read, and
+    # merged from the row chunks' profiles for a filtered view
+    filtered_df = filter_rows(df, {category_column: ['North', 'Online']})
+    benchmarks += [
+        ('stats.profile', lambda: SheetProfile(df).describe(list(df.columns)), dict),
+        ('stats.profiled', lambda: get_numeric_stats(df, list(df.columns)), dict),
+        ('stats.filtered', lambda: get_numeric_stats(filtered_df, list(df.columns), df), dict),
+    ]
+
+    benchmarks += [
+        ('export.xlsx', *export(create_download_excel)),
+        ('export.csv_zip', *export(create_download_csv_zip)),
+        ('export.parquet_zip', *export(create_download_parquet_zip)),
+    ]
+    return benchmarks
+
+
+XLSX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def query_engine_names():
+    """'pandas', plus 'duckdb' when DuckDB is installed"""
+    from utils.query_engine import duckdb_available
+    return ['pandas'] + (['duckdb'] if duckdb_available() else [])
+
+
+_query_engines = {}
+
+
+@contextmanager
+def query_engine(data_processing, name):
+    """
+    Run filter_rows with the given query engine
+    The app's getter returns the one engine configured for the process, so both are measured by
+    swapping it for an engine kept per name
+    """
+    from utils.query_engine import QueryEngine
+    if name == 'duckdb' and name not in _query_engines:
+        _query_engines[name] = QueryEngine()
+    original = data_processing.get_query_engine
+    data_processing.get_query_engine = lambda: _query_engines.get(name)
+    try:
+        yield
+    finally:
+        data_processing.get_query_engine = original
+
+
+@contextmanager
+def sheets_ingestion(workbook_loader, ingestion):
+    """Load Google Sheets with the given SHEETS_INGESTION, so both modes are measured whatever 'auto' picks"""
+    original = workbook_loader.SHEETS_INGESTION
+    workbook_loader.SHEETS_INGESTION = ingestion
+    try:
+        yield
+    finally:
+        workbook_loader.SHEETS_INGESTION = original
+
+
+def environment():
+    """Versions and machine details recorded with the results"""
+    import numpy
+    import pandas
+    import pyarrow
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'pyarrow': pyarrow.__version__,
+    }
+
+
+def compare(baseline, results, max_slowdown):
+    """Print each benchmark's median against the baseline; False if any grew beyond max_slowdown"""
+    before = {(result['scenario'], result['benchmark']): result['median'] for result in baseline}
+    ok = True
+    print(f"\n{'benchmark':<48} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    for result in results:
+        key = (result['scenario'], result['benchmark'])
+        if key not in before:
+            continue
+        ratio = result['median'] / before[key] if before[key] else float('inf')
+        slower = ratio > max_slowdown
+        ok = ok and not slower
+        print(f"{'/'.join(key):<48} {before[key] * 1000:>10.1f} {result['median'] * 1000:>10.1f} "
+              f"{ratio:>7.2f}x" + ('  SLOWER' if slower else ''))
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(main())
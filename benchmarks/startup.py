@@ -0,0 +1,132 @@
+"""
+Cold start benchmark: importing the app and its first script runs in a fresh process
+
+Each repeat starts a new Python process that imports main.py and renders the app with
+Streamlit's AppTest against the fake Drive/Sheets backend, so no credentials or network are
+needed. Run from the repository root:
+
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --latency 0.05 --compare startup.json
+
+Timed: importing main, the first script run of the first session (including the rerun that
+selects the first folder) and that of a second session, with the warm-up on and off.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.run import compare, environment
+
+# Folders and files of the fake Drive tree rendered by the app
+FOLDERS = 8
+FILES_PER_FOLDER = 10
+
+# Seconds a script run may take
+RUN_TIMEOUT = 120
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='fresh processes per configuration')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake API call')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help='with --compare, fail when a median grows by more than this factor')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(child(args.latency)))
+        return 0
+
+    results = []
+    for warm_up in (True, False):
+        scenario = 'startup' if warm_up else 'startup.no_warm_up'
+        print(f'{scenario}:')
+        runs = [run_child(args.latency, warm_up) for _ in range(args.repeat)]
+        for name in runs[0]:
+            seconds = [run[name] for run in runs]
+            result = {'scenario': scenario, 'benchmark': name, 'seconds': seconds,
+                      'median': statistics.median(seconds), 'min': min(seconds)}
+            results.append(result)
+            print(f"  {name:<32} median {result['median'] * 1000:9.1f} ms   min {result['min'] * 1000:9.1f} ms")
+
+    report = {'environment': environment(), 'settings': vars(args), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Wrote {len(results)} results to {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 0 if compare(baseline['results'], results, args.max_slowdown) else 1
+    return 0
+
+
+def run_child(latency, warm_up):
+    """Timings of one cold start, each measured in a fresh process"""
+    env = dict(os.environ, WARM_UP_ON_START='true' if warm_up else 'false', TRACING_ENABLED='false',
+               METRICS_PORT='0', GOOGLE_DRIVE_PARENT_FOLDER_ID='root')
+    import_seconds = subprocess.run(
+        [sys.executable, '-c', 'import time; start = time.perf_counter(); import main; '
+                               'print(time.perf_counter() - start)'],
+        env=env, capture_output=True, text=True, check=True).stdout
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child', '--latency', str(latency)],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return {'import_main': float(import_seconds.strip().splitlines()[-1]),
+            **json.loads(output.strip().splitlines()[-1])}
+
+
+def child(latency):
+    """Render the app for two sessions against the fake backend"""
+    # The fake backend replaces the service getters before any component imports them
+    import services.google_service as google_service
+    from benchmarks.workbooks import generate_workbook
+    from services.fetch_engine import FetchEngine
+    from tests.fake_google import FakeGoogleBackend
+
+    backend = FakeGoogleBackend(latency=latency)
+    for i in range(FOLDERS):
+        folder_id = backend.add_folder(f'Folder {i + 1}')
+        for j in range(FILES_PER_FOLDER):
+            backend.add_spreadsheet(f'Workbook {j + 1}', folder_id, generate_workbook(2, 20, 4, seed=j))
+    services = (backend.drive_service(), backend.sheets_service())
+    engine = FetchEngine()
+    google_service.get_google_services = lambda: services
+    google_service.get_fetch_engine = lambda: engine
+    # Imported before the runs so they time rendering only
+    import main  # noqa: F401
+
+    first_run = render()
+    timings = {'first_run': first_run, 'second_session': render()}
+    # Let the warm-up finish, so its log lines come before the timings
+    for thread in threading.enumerate():
+        if thread.name == 'warm-up':
+            thread.join(RUN_TIMEOUT)
+    return timings
+
+
+def render():
+    """Seconds taken by the first script run of a new session"""
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_string('import main\nmain.setup_page_config = lambda: None\nmain.main()',
+                              default_timeout=RUN_TIMEOUT)
+    start = time.perf_counter()
+    app.run()
+    seconds = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    return seconds
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import numpy as np
+
+# Workbook shapes the benchmarks run against: tabs per workbook, data rows per tab, columns per tab
+SCENARIOS = {
+    'many_tabs': {'tabs': 40, 'rows': 500, 'columns': 8},
+    'wide': {'tabs': 1, 'rows': 2000, 'columns': 200},
+    'tall': {'tabs': 1, 'rows': 200000, 'columns': 8},
+}
+
+# Column kinds, cycled across the columns of a tab
+COLUMN_KINDS = ['id', 'integer', 'decimal', 'date', 'category', 'text', 'sparse']
+
+CATEGORIES = ['North', 'South', 'East', 'West', 'Central', 'Online', 'Partner', 'Retail']
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet',
+         'kilo', 'lima', 'mike', 'november', 'oscar', 'papa']
+
+
+def scaled(scenario, scale=1.0):
+    """A scenario's shape with its rows multiplied by scale (at least one row)"""
+    shape = dict(SCENARIOS[scenario])
+    shape['rows'] = max(1, int(shape['rows'] * scale))
+    return shape
+
+
+def generate_column(kind, rows, rng):
+    """Formatted cell strings for one column, as the Sheets API returns them; '' is a blank cell"""
+    if kind == 'id':
+        return np.char.add('CUST-', np.char.zfill(rng.permutation(rows).astype(str), 7))
+    if kind == 'integer':
+        return rng.integers(-1000, 100000, rows).astype(str)
+    if kind == 'decimal':
+        # Formatted with thousands separators, like a currency column
+        return np.array([f'{value:,.2f}' for value in rng.uniform(0, 2000000, rows)], dtype=object)
+    if kind == 'date':
+        days = np.datetime64('2020-01-01') + rng.integers(0, 1800, rows).astype('timedelta64[D]')
+        return days.astype(str)
+    if kind == 'category':
+        return np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), rows)]
+    if kind == 'text':
+        words = np.array(WORDS, dtype=object)
+        return words[rng.integers(0, len(WORDS), rows)] + ' ' + words[rng.integers(0, len(WORDS), rows)] + \
+            ' ' + rng.integers(0, 10 ** 6, rows).astype(str).astype(object)
+    # Mostly blank numbers
+    values = rng.integers(0, 1000, rows).astype(str).astype(object)
+    values[rng.random(rows) < 0.8] = ''
+    return values
+
+
+def generate_tab(rows, columns, seed=0):
+    """
+    Values of one tab as the Sheets API returns them: a header row, then rows of cell strings
+    with trailing blank cells dropped
+    """
+    rng = np.random.default_rng(seed)
+    kinds = [COLUMN_KINDS[i % len(COLUMN_KINDS)] for i in range(columns)]
+    header = [f'{kind}_{i}' for i, kind in enumerate(kinds)]
+    grid = np.empty((rows, columns), dtype=object)
+    for i, kind in enumerate(kinds):
+        grid[:, i] = generate_column(kind, rows, rng)
+
+    values = [header]
+    for row in grid.tolist():
+        while row and row[-1] == '':
+            row.pop()
+        values.append(row)
+    return values
+
+
+def generate_workbook(tabs, rows, columns, seed=0):
+    """{tab title: values} for a synthetic workbook; the same seed always gives the same workbook"""
+    return {f'Tab {i + 1}': generate_tab(rows, columns, seed + i) for i in range(tabs)}
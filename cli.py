@@ -0,0 +1,113 @@
+"""
+Command line access to Drive folders and spreadsheets through the app's loaders, without Streamlit
+
+    python cli.py folders [PARENT_ID]
+    python cli.py files FOLDER_ID
+    python cli.py sheets FILE_ID
+    python cli.py export FILE_ID [--sheet NAME ...] [--format arrow|ndjson|parquet] [--output PATH]
+    python cli.py serve [--host HOST] [--port PORT]
+    python cli.py prefetch [--interval SECONDS] [--once]
+
+Listings are printed as JSON. Exports go to standard output unless --output is given, so they
+can be piped into another program as they are produced; log lines go to standard error.
+Credentials and settings are read from the same environment variables as the app. `prefetch`
+runs the prefetch scheduler as a worker beside the app, filling the shared disk cache.
+"""
+import argparse
+import contextlib
+import json
+import sys
+
+from config import API_HOST, API_PORT, PREFETCH_INTERVAL_SECONDS, setup_logging
+from services.google_service import CredentialsError
+from utils import headless
+from utils.http_api import start_api_server
+from utils.prefetch import create_prefetch_scheduler
+
+# Port of `serve` when API_PORT is not set
+DEFAULT_API_PORT = 8502
+
+# Seconds between `prefetch` cycles when PREFETCH_INTERVAL_SECONDS is not set
+DEFAULT_PREFETCH_INTERVAL = 600
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    folders = commands.add_parser('folders', help='list the folders of the base folder or of PARENT_ID')
+    folders.add_argument('parent_id', nargs='?')
+
+    files = commands.add_parser('files', help='list the spreadsheet files of a folder')
+    files.add_argument('folder_id')
+
+    sheets = commands.add_parser('sheets', help="show a workbook's name, revision and tabs")
+    sheets.add_argument('file_id')
+
+    export = commands.add_parser('export', help='stream tabs of a workbook')
+    export.add_argument('file_id')
+    export.add_argument('--sheet', action='append', help='tab to export (repeatable, default: all)')
+    export.add_argument('--format', default='ndjson', choices=sorted(headless.STREAM_FORMATS))
+    export.add_argument('--output', help='file to write instead of standard output')
+
+    serve = commands.add_parser('serve', help='serve the HTTP API')
+    serve.add_argument('--host', default=API_HOST)
+    serve.add_argument('--port', type=int, default=API_PORT or DEFAULT_API_PORT)
+
+    prefetch = commands.add_parser('prefetch', help='keep hot workbooks in the disk cache')
+    prefetch.add_argument('--interval', type=int, default=PREFETCH_INTERVAL_SECONDS or DEFAULT_PREFETCH_INTERVAL,
+                          help='seconds between cycles')
+    prefetch.add_argument('--once', action='store_true', help='run a single cycle and print its outcome')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging()
+    stdout = sys.stdout
+    # Log lines go to standard error; keep standard output for the results should a library print
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            run(args, stdout)
+        except (CredentialsError, KeyError, TimeoutError, ValueError) as e:
+            # KeyError quotes its message; args[0] is the message as raised
+            print(f'Error: {e.args[0] if e.args else e}', file=sys.stderr)
+            return 1
+    return 0
+
+
+def run(args, stdout):
+    """Run one command, writing its results to stdout"""
+    if args.command == 'folders':
+        print_json(headless.list_folders(args.parent_id), stdout)
+    elif args.command == 'files':
+        print_json(headless.list_files(args.folder_id), stdout)
+    elif args.command == 'sheets':
+        with headless.open_workbook(args.file_id) as workbook:
+            print_json({'file_id': workbook.file_id, 'file_name': workbook.file_name,
+                        'revision': workbook.revision, 'sheets': workbook.sheet_names}, stdout)
+    elif args.command == 'export':
+        with headless.open_workbook(args.file_id) as workbook:
+            if args.output:
+                with open(args.output, 'wb') as f:
+                    workbook.export(f, args.format, args.sheet)
+            else:
+                workbook.export(stdout.buffer, args.format, args.sheet)
+                stdout.buffer.flush()
+    elif args.command == 'serve':
+        start_api_server(args.host, args.port, block=True)
+    else:
+        scheduler = create_prefetch_scheduler()
+        scheduler.interval = args.interval
+        if args.once:
+            print_json(scheduler.run_cycle(), stdout)
+        else:
+            scheduler.run()
+
+
+def print_json(value, file):
+    file.write(json.dumps(value, indent=2, default=str) + '\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
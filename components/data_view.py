@@ -1,8 +1,21 @@
 import streamlit as st
 import pandas as pd
-from services.google_service import get_google_services, get_file_details
-from utils.data_processing import apply_filters, apply_search, get_numeric_stats
+from services.drive_index import get_drive_index
+from config import DATA_PAGE_SIZE, SHEET_PREFETCH_NEIGHBOURS, WINDOWED_FETCH_MIN_CELLS
+from services.google_service import get_derive_executor, get_google_services, get_fetch_engine, get_file_details
+from utils.column_index import get_sheet_index
+from utils.column_profile import get_sheet_profile
+from utils.data_processing import filter_rows, get_numeric_stats
+from utils.derivation_cache import EXPORT_CACHE_MAX_BYTES, filter_state_key, get_derivation_cache
 from utils.file_operations import create_download_csv, create_download_sheet_excel
+from utils.query_engine import get_query_engine
+from utils.sheet_window import fetch_header, fetch_window
+from utils.tracing import span
+from utils.workbook_loader import get_workbook_cache, get_workbook_store
+
+# Page sizes offered by the data grid; DATA_PAGE_SIZE is added when it is not one of them
+PAGE_SIZE_OPTIONS = sorted({100, 500, 1000, 5000, DATA_PAGE_SIZE})
+
 
 def render_data_sheet(sheet_name, df):
     """Render the data view for a single sheet"""
@@ -18,6 +31,9 @@ def render_data_sheet(sheet_name, df):
     with col2:
         st.write(f"Number of columns: {len(df.columns)}")
 
+    cache = get_derivation_cache()
+    sheet_key = sheet_cache_key(sheet_name)
+
     # Filters - using session state with sheet-specific keys
     filter_key = f"filter_{sheet_name}"
     if filter_key not in st.session_state:
@@ -39,13 +55,14 @@ def render_data_sheet(sheet_name, df):
 
         if filter_column != 'None':
             with col2:
-                unique_values = df[filter_column].dropna().unique()
-                if len(unique_values) > 0 and len(unique_values) <= 30:
+                unique_values = cache.get_or_compute(sheet_key + ('unique', filter_column),
+                                                     lambda: sorted_unique_values(df, filter_column))
+                if unique_values:
                     # Only offer multi-select for reasonable number of options
                     filter_values = st.multiselect(
                         "Select values",
-                        options=sorted(unique_values),
-                        default=list(unique_values),
+                        options=unique_values,
+                        default=unique_values,
                         key=f"filter_values_{sheet_name}_{filter_column}"
                     )
                     if filter_values:
@@ -77,16 +94,19 @@ def render_data_sheet(sheet_name, df):
             else:
                 st.write(f"- **{col}**: contains '{values}'")
 
-    # Apply filters to dataframe
-    filtered_df = apply_filters(df, st.session_state[filter_key])
-
     # Display data
     st.subheader(f"Data from {sheet_name}")
 
     # Add search functionality
     search_term = st.text_input("Search across all columns", "", key=f"search_{sheet_name}")
-    if search_term:
-        filtered_df = apply_search(filtered_df, search_term)
+
+    # Apply filters and search to dataframe, using the sheet's column index
+    view_key = sheet_key + (filter_state_key(st.session_state[filter_key]), search_term)
+    if st.session_state[filter_key] or search_term:
+        filtered_df = cache.get_or_compute(view_key + ('rows',),
+                                           lambda: filter_rows(df, st.session_state[filter_key], search_term))
+    else:
+        filtered_df = df
 
     # Select columns to display
     all_columns = list(filtered_df.columns)
@@ -100,62 +120,305 @@ def render_data_sheet(sheet_name, df):
     if not selected_columns:
         selected_columns = all_columns
 
-    # Display the data
-    st.dataframe(filtered_df[selected_columns], hide_index=True, use_container_width=True)
+    # Display the data, one page at a time
+    render_data_page(sheet_name, filtered_df, selected_columns, cache, view_key)
 
     # Download options for this sheet
     st.subheader("Download Sheet Data")
 
+    # Export files are only built when asked for, then kept for repeated downloads unless they are large
     col1, col2 = st.columns(2)
     with col1:
         # CSV Download
-        csv = create_download_csv(filtered_df, st.session_state.file_name, sheet_name)
-        st.download_button(
-            label="Download as CSV",
-            data=csv,
-            file_name=f"{st.session_state.file_name}_{sheet_name}.csv",
-            mime='text/csv',
-            key=f"download_csv_{sheet_name}"
-        )
+        csv_key = view_key + ('csv',)
+        csv = cache.get(csv_key)
+        if csv is None and st.button("Prepare CSV", key=f"prepare_csv_{sheet_name}"):
+            with st.spinner("Preparing CSV..."):
+                csv = cache.get_or_compute(csv_key, lambda: create_download_csv(
+                    filtered_df, st.session_state.file_name, sheet_name), EXPORT_CACHE_MAX_BYTES)
+        if csv is not None:
+            st.download_button(
+                label="Download as CSV",
+                data=csv,
+                file_name=f"{st.session_state.file_name}_{sheet_name}.csv",
+                mime='text/csv',
+                key=f"download_csv_{sheet_name}"
+            )
 
     with col2:
         # Excel Download for this sheet
-        buffer = create_download_sheet_excel(filtered_df, st.session_state.file_name, sheet_name)
-        st.download_button(
-            label="Download as Excel",
-            data=buffer,
-            file_name=f"{st.session_state.file_name}_{sheet_name}.xlsx",
-            mime='application/vnd.ms-excel',
-            key=f"download_excel_{sheet_name}"
-        )
+        excel_key = view_key + ('xlsx',)
+        excel = cache.get(excel_key)
+        if excel is None and st.button("Prepare Excel", key=f"prepare_excel_{sheet_name}"):
+            with st.spinner("Preparing Excel file..."):
+                excel = cache.get_or_compute(excel_key, lambda: create_download_sheet_excel(
+                    filtered_df, st.session_state.file_name, sheet_name), EXPORT_CACHE_MAX_BYTES)
+        if excel is not None:
+            st.download_button(
+                label="Download as Excel",
+                data=excel,
+                file_name=f"{st.session_state.file_name}_{sheet_name}.xlsx",
+                mime='application/vnd.ms-excel',
+                key=f"download_excel_{sheet_name}"
+            )
 
     # Data summary stats
     if st.checkbox("Show summary statistics", key=f"stats_checkbox_{sheet_name}"):
         st.subheader("Summary Statistics")
-        stats_df = get_numeric_stats(filtered_df, selected_columns)
+        stats_df = cache.get_or_compute(view_key + ('stats', tuple(selected_columns)),
+                                        lambda: get_numeric_stats(filtered_df, selected_columns, df))
         if stats_df is not None:
             st.write(stats_df)
         else:
             st.write("No numeric columns available for statistics.")
 
+def sheet_cache_key(sheet_name):
+    """
+    Key prefix of a sheet's derived data, cached per workbook revision and sheet and shared between
+    sessions; a tab carried over unchanged by a refresh keeps the revision it was loaded at
+    """
+    lease = st.session_state.workbook_lease
+    tab_revisions = lease.workbook.get('tab_revisions', {}) if lease is not None else {}
+    return (st.session_state.selected_file, tab_revisions.get(sheet_name, st.session_state.workbook_revision),
+            sheet_name)
+
+
+def is_windowed(sheets_data, sheet_name, grid):
+    """Whether a sheet is shown from fetched row windows: a large Google Sheet tab neither loaded nor cached yet"""
+    if not WINDOWED_FETCH_MIN_CELLS or not grid or not hasattr(sheets_data, 'is_loaded'):
+        return False
+    if grid['rowCount'] * grid['columnCount'] < WINDOWED_FETCH_MIN_CELLS or sheets_data.is_loaded(sheet_name):
+        return False
+    return not get_workbook_cache().has_tab(st.session_state.selected_file, st.session_state.workbook_revision,
+                                            sheet_name)
+
+
+def render_sheet_window(sheet_name, grid):
+    """
+    Show a large tab from the rows on screen while the whole tab loads in the background
+    Only the header row and the selected columns of the visible page are fetched, a page at a time.
+    Filters, search, sorting and statistics need the whole tab and appear once it has loaded.
+    """
+    cache = get_derivation_cache()
+    sheet_key = sheet_cache_key(sheet_name)
+    _, sheets_service = get_google_services()
+    file_id = st.session_state.selected_file
+    header = cache.get_or_compute(sheet_key + ('header',), lambda: fetch_header(
+        sheets_service, file_id, sheet_name, grid['columnCount']))
+
+    st.info(f"{sheet_name} has {grid['rowCount']:,} × {grid['columnCount']:,} cells and is loading in the "
+            "background. Meanwhile the selected columns are fetched a page at a time; filters, search, sorting "
+            "and statistics appear once the whole sheet has loaded.")
+    st.button("Check again", key=f"window_check_{sheet_name}")
+
+    # Fetching every column would fetch the whole sheet, so an empty selection shows the first columns
+    selected_columns = st.multiselect("Select columns to display", options=header, default=header[:10],
+                                      key=f"window_columns_{sheet_name}") or header[:10]
+    data_rows = max(0, grid['rowCount'] - 1)
+    col1, col2 = st.columns(2)
+    with col1:
+        page_size = st.selectbox("Rows per page", options=PAGE_SIZE_OPTIONS,
+                                 index=PAGE_SIZE_OPTIONS.index(DATA_PAGE_SIZE), key=f"window_page_size_{sheet_name}")
+    with col2:
+        page = st.number_input("Page", min_value=1, max_value=max(1, -(-data_rows // page_size)), value=1, step=1,
+                               key=f"window_page_{sheet_name}_{page_size}")
+
+    first_row = (page - 1) * page_size
+    window = cache.get_or_compute(sheet_key + ('window', tuple(selected_columns), first_row, page_size),
+                                  lambda: fetch_window(sheets_service, file_id, sheet_name, header, selected_columns,
+                                                       first_row, page_size))
+    st.dataframe(window, hide_index=True, use_container_width=True)
+    st.caption(f"Rows {first_row + 1 if len(window) else 0:,}–{first_row + len(window):,} of up to {data_rows:,}")
+
+
+def render_data_page(sheet_name, df, columns, cache, view_key):
+    """
+    Show one page of rows, sorted on the server
+    Only the page is sent to the browser, so reruns cost the same whatever the number of rows
+    """
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        sort_column = st.selectbox("Sort by", options=['None'] + list(df.columns), key=f"sort_column_{sheet_name}")
+    with col2:
+        descending = st.checkbox("Descending", key=f"sort_descending_{sheet_name}")
+    with col3:
+        page_size = st.selectbox("Rows per page", options=PAGE_SIZE_OPTIONS,
+                                 index=PAGE_SIZE_OPTIONS.index(DATA_PAGE_SIZE), key=f"page_size_{sheet_name}")
+    page_count = max(1, -(-len(df) // page_size))
+    with col4:
+        # The page number starts over whenever the number of rows or pages changes
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1,
+                               key=f"page_{sheet_name}_{len(df)}_{page_size}")
+
+    sort_key = view_key + ('order', sort_column, descending)
+    page_key = sort_key + ('page', page, page_size, tuple(columns))
+    page_df = cache.get(page_key)
+    if page_df is None:
+        with span('render.page', sorted=sort_column != 'None'):
+            start = (page - 1) * page_size
+            if sort_column == 'None':
+                rows = df.iloc[start:start + page_size]
+            else:
+                order = cache.get_or_compute(sort_key, lambda: sort_order(df[sort_column], descending))
+                rows = df.iloc[order[start:start + page_size]]
+            page_df = rows[columns]
+            cache.put(page_key, page_df)
+
+    st.dataframe(page_df, hide_index=True, use_container_width=True)
+    if len(page_df):
+        first_row = (page - 1) * page_size + 1
+        st.caption(f"Rows {first_row:,}–{first_row + len(page_df) - 1:,} of {len(df):,}")
+    else:
+        st.caption("No rows")
+
+
+def sort_order(column, descending=False):
+    """Row positions that sort a column, blanks last; mixed-type columns are sorted as text"""
+    column = column.reset_index(drop=True)
+    try:
+        ordered = column.sort_values(ascending=not descending, kind='stable', na_position='last')
+    except TypeError:
+        ordered = column.astype(str).where(column.notna()).sort_values(
+            ascending=not descending, kind='stable', na_position='last')
+    return ordered.index.to_numpy()
+
+
+def sorted_unique_values(df, column, max_values=30):
+    """
+    Distinct non-blank values of a column sorted for the filter selector, or [] when there are too many
+    Read from the column's profile, so no pass over the rows is needed once the tab is profiled
+    """
+    unique_values = get_sheet_profile(df).unique_values(column, max_values)
+    return sorted(unique_values) if unique_values is not None else []
+
+
+def format_sheet_label(sheet_name, grid):
+    """Sheet selector label, with the grid size from the spreadsheet metadata when known"""
+    if not grid:
+        return sheet_name
+    return f"{sheet_name} ({grid['rowCount']:,} × {grid['columnCount']:,})"
+
+
+def render_sheet_load_stats(sheet_name):
+    """Show how a lazily loaded sheet was materialised: source, parse time and memory"""
+    sheet_stats = getattr(st.session_state.sheets_data, 'sheet_stats', {}).get(sheet_name)
+    if not sheet_stats:
+        return
+    details = [f"{sheet_stats['source']} in {sheet_stats['seconds']:.2f}s"]
+    if 'bytes' in sheet_stats:
+        details.append(f"{sheet_stats['bytes'] / 2 ** 20:.1f} MB in memory")
+    if sheet_stats.get('peak_rss_growth') is not None:
+        details.append(f"peak memory +{sheet_stats['peak_rss_growth'] / 2 ** 20:.1f} MB")
+    st.caption("Loaded from " + ", ".join(details))
+
+
+def sql_tables():
+    """
+    Loaded sheets the SQL panel can query: the open workbook's by sheet name, and those of other
+    workbooks held in memory as "file name/sheet name"
+    """
+    tables = {}
+    lease = st.session_state.workbook_lease
+    for key, workbook in get_workbook_store().workbooks().items():
+        if lease is not None and key == lease.key:
+            continue
+        for sheet_name in workbook['sheet_names']:
+            if is_sheet_loaded(workbook['sheets_data'], sheet_name):
+                tables[f"{workbook['file_name']}/{sheet_name}"] = workbook['sheets_data'][sheet_name]
+    for sheet_name in st.session_state.sheet_names:
+        if is_sheet_loaded(st.session_state.sheets_data, sheet_name):
+            tables[sheet_name] = st.session_state.sheets_data[sheet_name]
+    return tables
+
+
+def is_sheet_loaded(sheets_data, sheet_name):
+    return sheets_data.is_loaded(sheet_name) if hasattr(sheets_data, 'is_loaded') else sheet_name in sheets_data
+
+
+def render_sql_panel():
+    """SQL over every loaded sheet, for group-bys and joins across sheets and workbooks"""
+    with st.expander("SQL query"):
+        query_engine = get_query_engine()
+        if query_engine is None:
+            st.info("Install duckdb (and leave QUERY_ENGINE unset) to query loaded sheets with SQL.")
+            return
+
+        sheets_data = st.session_state.sheets_data
+        if hasattr(sheets_data, 'ensure_loaded') and \
+                st.button("Load all sheets of this workbook", key="sql_load_all_sheets"):
+            with st.spinner("Loading sheets..."):
+                sheets_data.ensure_loaded()
+
+        tables = sql_tables()
+        st.caption("Tables: " + ", ".join(f'"{name}"' for name in tables))
+        sql = st.text_area("SQL", key="sql_query",
+                           placeholder='SELECT "Region", count(*) FROM "Sheet1" GROUP BY "Region"')
+        if sql and st.button("Run query", key="sql_run"):
+            try:
+                with st.spinner("Running query..."):
+                    result = query_engine.user_query(sql, tables)
+            except Exception as e:
+                st.error(f"Query failed: {str(e)}")
+                return
+            st.caption(f"{len(result):,} rows" + (f", showing the first {DATA_PAGE_SIZE:,}"
+                                                   if len(result) > DATA_PAGE_SIZE else ""))
+            st.dataframe(result.head(DATA_PAGE_SIZE), hide_index=True, use_container_width=True)
+
+
 def render_data_view():
     """Render the main data view component"""
     try:
-        # Get current folder and file names for display
-        drive_service, _ = get_google_services()
-        folder = get_file_details(drive_service, st.session_state.selected_folder)
+        # Get current folder name for display, from the Drive index when it has been listed
+        folder_name = get_drive_index().get_name(st.session_state.selected_folder)
+        if folder_name is None:
+            drive_service, _ = get_google_services()
+            folder_name = get_file_details(drive_service, st.session_state.selected_folder)['name']
 
         # Display navigation breadcrumbs
-        st.markdown(f"📁 **{folder['name']}** / 📊 **{st.session_state.file_name}**")
+        st.markdown(f"📁 **{folder_name}** / 📊 **{st.session_state.file_name}**")
+
+        # Sheet selector in place of st.tabs, which would render (and load) every tab on each rerun
+        sheet_names = st.session_state.sheet_names
+        sheet_properties = st.session_state.sheet_properties
+        selected_sheet = st.radio(
+            "Sheet",
+            options=sheet_names,
+            format_func=lambda name: format_sheet_label(name, sheet_properties.get(name)),
+            horizontal=True,
+            label_visibility="collapsed",
+            key=f"sheet_selector_{st.session_state.selected_file}"
+        )
+        st.session_state.selected_sheet = selected_sheet
+
+        # A very large tab is shown from the rows on screen until it has loaded in the background
+        sheets_data = st.session_state.sheets_data
+        if is_windowed(sheets_data, selected_sheet, sheet_properties.get(selected_sheet)):
+            sheets_data.prefetch([selected_sheet], get_fetch_engine().submit)
+            render_sheet_window(selected_sheet, sheet_properties[selected_sheet])
+            render_sql_panel()
+            return
+
+        # Load only the selected sheet
+        with st.spinner(f"Loading {selected_sheet}..."):
+            df = sheets_data[selected_sheet]
+
+        # Warm up the neighbouring sheets in the background
+        if hasattr(sheets_data, 'prefetch'):
+            index = sheet_names.index(selected_sheet)
+            neighbours = sheet_names[max(0, index - SHEET_PREFETCH_NEIGHBOURS):index + SHEET_PREFETCH_NEIGHBOURS + 1]
+            sheets_data.prefetch(neighbours, get_fetch_engine().submit)
 
-        # Create tabs for each sheet
-        sheet_tabs = st.tabs(st.session_state.sheet_names)
+        # Without the query engine, build the sheet's filter index while the first render happens; search
+        # indexes are built per column on its first search
+        if get_query_engine() is None:
+            get_sheet_index(df).warm_in_background(get_derive_executor().submit)
+        # Profile the sheet's columns for the summary statistics and filter selector
+        get_sheet_profile(df).build_in_background(get_derive_executor().submit)
 
-        # Display data for each sheet in its respective tab
-        for i, sheet_name in enumerate(st.session_state.sheet_names):
-            with sheet_tabs[i]:
-                df = st.session_state.sheets_data[sheet_name]
-                render_data_sheet(sheet_name, df)
+        render_sheet_load_stats(selected_sheet)
+        with span('render.sheet', rows=len(df)):
+            render_data_sheet(selected_sheet, df)
+        render_sql_panel()
 
     except Exception as e:
         st.error(f"Error displaying spreadsheet data: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,35 @@
+import pandas as pd
+import streamlit as st
+
+from services.google_service import get_fetch_engine
+from utils.derivation_cache import get_derivation_cache
+from utils.tracing import METRICS
+from utils.workbook_loader import get_workbook_flights, get_workbook_store
+
+
+def render_debug_panel(run_trace):
+    """Sidebar panel with the spans of this script run and the server's totals per span"""
+    with st.sidebar.expander("Performance"):
+        st.caption(f"This run: {run_trace.seconds * 1000:.0f} ms so far, {len(run_trace.spans)} spans")
+        if run_trace.spans:
+            spans = pd.DataFrame(run_trace.spans)
+            # Nested spans finish first; indent them under their parent
+            spans['name'] = ['  ' * depth + name for depth, name in zip(spans['depth'], spans['name'])]
+            spans['ms'] = (spans.pop('seconds') * 1000).round(1)
+            st.dataframe(spans.drop(columns='depth'), hide_index=True, use_container_width=True)
+
+        totals = METRICS.snapshot()
+        if totals:
+            st.caption("Since server start")
+            table = pd.DataFrame.from_dict(totals, orient='index').sort_values('seconds', ascending=False)
+            table['seconds'] = table['seconds'].round(3)
+            st.dataframe(table, use_container_width=True)
+
+        engine_stats = get_fetch_engine().stats
+        st.caption(f"API calls: {engine_stats['api_calls']}, retries: {engine_stats['retries']}, "
+                   f"throttled: {engine_stats['throttled_seconds']:.1f}s")
+        flight_stats = get_workbook_flights().stats
+        st.caption(f"Workbook loads: {flight_stats['flights']}, duplicates avoided: {flight_stats['coalesced']}, "
+                   f"timed out: {flight_stats['timeouts']}, cancelled: {flight_stats['cancelled']}")
+        st.caption(f"Workbook store: {get_workbook_store().total_bytes() / 2 ** 20:.1f} MB, "
+                   f"derived data cache: {get_derivation_cache().total_bytes() / 2 ** 20:.1f} MB")
@@ -0,0 +1,49 @@
+import pandas as pd
+import streamlit as st
+
+from services.google_service import get_google_services
+from utils.folder_index import get_folder_index
+
+
+def render_folder_search():
+    """Index every spreadsheet of the selected folder and search all their tabs at once"""
+    folder_id = st.session_state.selected_folder
+    service = get_folder_index()
+
+    with st.expander("Search all files in this folder"):
+        job = service.job(folder_id)
+        progress = job.progress() if job is not None else None
+        folder_stats = service.index.folder_stats(folder_id)
+        st.caption(f"{folder_stats['files']} files with {folder_stats['rows']:,} rows indexed")
+
+        if progress is not None and progress['running']:
+            done = progress['indexed'] + progress['skipped'] + progress['failed']
+            st.progress(done / progress['total'] if progress['total'] else 0.0,
+                        text=f"Indexing: {done} of {progress['total'] or '?'} files in {progress['seconds']:.0f}s")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("Refresh progress", key="folder_index_refresh")
+            with col2:
+                if st.button("Stop indexing", key="folder_index_stop"):
+                    job.cancel()
+        else:
+            if progress is not None:
+                st.caption(f"Last run: {progress['indexed']} files indexed ({progress['rows']:,} rows), "
+                           f"{progress['skipped']} up to date, {progress['failed']} failed in "
+                           f"{progress['seconds']:.1f}s" + (" (stopped)" if progress['cancelled'] else ""))
+                for name, error in progress['errors'].items():
+                    st.caption(f"{name}: {error}")
+            # Files already indexed at their current revision are skipped, so this also resumes
+            if st.button("Index folder" if not folder_stats['files'] else "Update index", key="folder_index_start"):
+                drive_service, sheets_service = get_google_services()
+                service.start(drive_service, sheets_service, folder_id)
+                st.rerun()
+
+        term = st.text_input("Search term", key="folder_search_term")
+        if term:
+            matches = service.index.search(folder_id, term)
+            st.write(f"{len(matches)} matching rows" + (" (first 1000 shown)" if len(matches) == 1000 else ""))
+            if matches:
+                st.dataframe(pd.DataFrame(matches).drop(columns='file_id').rename(columns={
+                    'file_name': 'File', 'sheet': 'Tab', 'row': 'Row', 'text': 'Values'}),
+                    use_container_width=True, hide_index=True)
@@ -1,8 +1,16 @@
 import streamlit as st
-from services.google_service import get_google_services, list_folders, list_files, get_spreadsheet_metadata
-from utils.file_operations import download_excel_file, read_excel_sheets, create_download_excel
-from utils.data_processing import get_all_sheets_data
+from googleapiclient.errors import HttpError
+from services.drive_index import get_drive_index
+from services.google_service import CredentialsError, get_file_revision, get_google_services, get_fetch_engine
+from utils.file_operations import download_excel_file, export_google_sheet, WORKBOOK_EXPORT_FORMATS
+from utils.derivation_cache import EXPORT_CACHE_MAX_BYTES, get_derivation_cache
+from utils.prefetch import get_access_stats
+from utils.session_state import release_workbook, set_workbook
+from utils.workbook_loader import load_workbook, get_workbook_store, refresh_workbook
 import io
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def render_sidebar():
@@ -13,9 +21,16 @@ def render_sidebar():
         try:
             # Get Google services
             drive_service, sheets_service = get_google_services()
+            engine = get_fetch_engine()
+            drive_index = get_drive_index()
 
-            # List folders
-            folders = list_folders(drive_service, st.session_state.base_folder_id)
+            # List folders, and the files of an already selected folder, from the shared Drive index;
+            # listings not indexed yet are fetched concurrently
+            folders_future = engine.submit(drive_index.list_folders, st.session_state.base_folder_id)
+            files_future = None
+            if st.session_state.selected_folder:
+                files_future = engine.submit(drive_index.list_files, st.session_state.selected_folder)
+            folders = folders_future.result()
 
             folder_names = [folder['name'] for folder in folders]
             folder_ids = [folder['id'] for folder in folders]
@@ -31,19 +46,24 @@ def render_sidebar():
             if selected_folder_index is not None and folder_ids:
                 selected_folder_id = folder_ids[selected_folder_index]
                 if st.session_state.selected_folder != selected_folder_id:
+                    release_workbook()
                     st.session_state.selected_folder = selected_folder_id
                     st.session_state.selected_file = None
                     st.session_state.selected_file_type = None
                     st.session_state.selected_sheet = None
                     st.session_state.sheets_data = {}
                     st.session_state.sheet_names = []
+                    st.session_state.sheet_properties = {}
                     st.session_state.filter_columns = {}
                     st.session_state.file_name = ""
+                    st.session_state.workbook_revision = None
+                    st.session_state.load_stats = None
+                    st.session_state.refresh_stats = None
                     st.rerun()
 
             # If folder is selected, list files
             if st.session_state.selected_folder:
-                files = list_files(drive_service, st.session_state.selected_folder)
+                files = files_future.result()
 
                 file_names = [file['name'] for file in files]
                 file_ids = [file['id'] for file in files]
@@ -64,58 +84,127 @@ def render_sidebar():
 
                     if (st.session_state.selected_file != selected_file_id or
                             st.session_state.selected_file_type != selected_file_type):
+                        release_workbook()
                         st.session_state.selected_file = selected_file_id
                         st.session_state.selected_file_type = selected_file_type
                         st.session_state.selected_sheet = None
                         st.session_state.sheets_data = {}
                         st.session_state.sheet_names = []
+                        st.session_state.sheet_properties = {}
                         st.session_state.filter_columns = {}
                         st.session_state.file_name = selected_file_name
+                        st.session_state.workbook_revision = None
+                        st.session_state.load_stats = None
+                        st.session_state.refresh_stats = None
                         st.rerun()
 
                 # If file is selected, load sheet data
                 if st.session_state.selected_file and st.session_state.selected_file_type:
                     # Load data if not already loaded
                     if not st.session_state.sheets_data:
-                        with st.spinner("Loading spreadsheet data..."):
-                            if st.session_state.selected_file_type == 'application/vnd.google-apps.spreadsheet':
-                                # Google Sheets
-                                sheet_names, file_title = get_spreadsheet_metadata(sheets_service,
-                                                                                   st.session_state.selected_file)
-                                sheets_data = get_all_sheets_data(sheets_service, st.session_state.selected_file,
-                                                                  sheet_names)
-                                st.session_state.sheet_names = sheet_names
-                                st.session_state.sheets_data = sheets_data
-                                st.session_state.file_name = file_title
-                            else:
-                                # Excel file
-                                excel_buffer = download_excel_file(drive_service, st.session_state.selected_file)
-                                sheets_data, sheet_names = read_excel_sheets(excel_buffer)
-                                st.session_state.sheet_names = sheet_names
-                                st.session_state.sheets_data = sheets_data
-
-                    # Download entire spreadsheet button
+                        with st.spinner("Opening spreadsheet..."):
+                            lease, load_stats = load_workbook(drive_service, sheets_service,
+                                                              st.session_state.selected_file,
+                                                              st.session_state.selected_file_type,
+                                                              st.session_state.file_name)
+                            # The session only references the shared workbook, it never copies it
+                            set_workbook(lease, load_stats)
+                            # Often opened files are kept loaded by the prefetch scheduler
+                            get_access_stats().record(st.session_state.selected_file,
+                                                      st.session_state.selected_file_type,
+                                                      st.session_state.file_name)
+
+                    # Pick up changes made since loading, fetching only what changed
+                    if st.button("Refresh") and st.session_state.workbook_lease is not None:
+                        with st.spinner("Checking for changes..."):
+                            lease, refresh_stats = refresh_workbook(drive_service, sheets_service,
+                                                                    st.session_state.workbook_lease)
+                            set_workbook(lease, st.session_state.load_stats)
+                            st.session_state.refresh_stats = refresh_stats
+                    refresh_stats = st.session_state.refresh_stats
+                    if refresh_stats:
+                        changes = ', '.join(f'{name}: {outcome}' for name, outcome in refresh_stats['tabs'].items())
+                        st.caption(f"Refreshed ({refresh_stats.get('source', 'changes found')}) with "
+                                   f"{refresh_stats['api_calls']} API calls, {refresh_stats['bytes'] / 1024:.0f} KB "
+                                   f"in {refresh_stats['seconds']:.1f}s" + (f" - {changes}" if changes else ''))
+
+                    # Show where the workbook came from and its API usage
+                    if st.session_state.load_stats:
+                        load_stats = st.session_state.load_stats
+                        st.caption(f"Loaded from {load_stats['source']} with {load_stats['api_calls']} API calls, "
+                                   f"{load_stats['bytes'] / 1024:.0f} KB in {load_stats['seconds']:.1f}s")
+
+                    # Memory held by workbooks shared across all sessions, for sizing the server
+                    resident = get_workbook_store().resident_bytes()
+                    st.caption(f"Shared workbook memory: {sum(w['bytes'] for w in resident.values()) / 2 ** 20:.1f} MB "
+                               f"in {len(resident)} workbooks")
+
+                    # Download entire spreadsheet, in the chosen format
+                    is_google_sheet = st.session_state.selected_file_type == 'application/vnd.google-apps.spreadsheet'
+                    export_formats = list(WORKBOOK_EXPORT_FORMATS) if is_google_sheet else \
+                        ['Original file'] + list(WORKBOOK_EXPORT_FORMATS)
+                    export_format = st.selectbox("Download format", options=export_formats, key="export_format")
                     if st.button("Download Entire Spreadsheet"):
-                        if st.session_state.selected_file_type == 'application/vnd.google-apps.spreadsheet':
-                            # For Google Sheets, export as Excel
+                        cache = get_derivation_cache()
+                        workbook_key = (st.session_state.selected_file, st.session_state.workbook_revision)
+                        if export_format == 'Original file':
+                            # For Excel files, just download the original
                             with st.spinner("Preparing download..."):
-                                output = create_download_excel(st.session_state.sheets_data, st.session_state.file_name)
-
+                                excel_buffer = cache.get_or_compute(
+                                    workbook_key + ('original',),
+                                    lambda: download_excel_file(drive_service, st.session_state.selected_file).getvalue(),
+                                    EXPORT_CACHE_MAX_BYTES)
                                 st.download_button(
                                     label="Download Excel File",
-                                    data=output,
-                                    file_name=f"{st.session_state.file_name}.xlsx",
+                                    data=excel_buffer,
+                                    file_name=st.session_state.file_name,
                                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                                 )
                         else:
-                            # For Excel files, just download the original
+                            # Export the loaded sheets, streamed through a spooled temporary file
+                            extension, mime, create_export = WORKBOOK_EXPORT_FORMATS[export_format]
+                            base_name = st.session_state.file_name if is_google_sheet else \
+                                st.session_state.file_name.rsplit('.', 1)[0]
                             with st.spinner("Preparing download..."):
-                                excel_buffer = download_excel_file(drive_service, st.session_state.selected_file)
+                                output = cache.get(workbook_key + (export_format,))
+                                if output is None and is_google_sheet and extension == 'xlsx':
+                                    output = export_google_sheet_as_loaded(drive_service)
+                                if output is None:
+                                    output = export_workbook(create_export)
+                                cache.put(workbook_key + (export_format,), output, EXPORT_CACHE_MAX_BYTES)
                                 st.download_button(
-                                    label="Download Excel File",
-                                    data=excel_buffer,
-                                    file_name=st.session_state.file_name,
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                                    label=f"Download {export_format}",
+                                    data=output,
+                                    file_name=f"{base_name}.{extension}",
+                                    mime=mime
                                 )
+        except CredentialsError as e:
+            st.error(str(e))
+            st.stop()
+        except TimeoutError as e:
+            st.error(f"The spreadsheet is taking too long to open, please try again: {e}")
         except Exception as e:
-            st.error(f"Error connecting to Google Drive API: {str(e)}")
\ No newline at end of file
+            st.error(f"Error connecting to Google Drive API: {str(e)}")
+
+
+def export_google_sheet_as_loaded(drive_service):
+    """
+    The open Google Sheet as .xlsx bytes exported by Google in one Drive call, without re-encoding
+    the loaded sheets; None when the file changed since it was loaded or is too large to export
+    """
+    file_id = st.session_state.selected_file
+    if get_file_revision(drive_service, file_id) != st.session_state.workbook_revision:
+        return None
+    try:
+        return export_google_sheet(drive_service, file_id).getvalue()
+    except HttpError as e:
+        logger.warning(f'Drive export of {file_id} failed, exporting the loaded sheets: {e}')
+        return None
+
+
+def export_workbook(create_export):
+    """Export every sheet of the open workbook with one of the WORKBOOK_EXPORT_FORMATS exporters"""
+    # Fetch every tab not viewed yet in batched calls rather than one by one
+    if hasattr(st.session_state.sheets_data, 'ensure_loaded'):
+        st.session_state.sheets_data.ensure_loaded()
+    return create_export(st.session_state.sheets_data, st.session_state.file_name)
@@ -1,6 +1,7 @@
+import logging
 import os
+import tempfile
 
-import streamlit as st
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -9,9 +10,121 @@ load_dotenv()
 # Default base folder ID from environment variables
 DEFAULT_BASE_FOLDER_ID = os.environ.get('GOOGLE_DRIVE_PARENT_FOLDER_ID')
 
+# Sheets values.batchGet tuning: max ranges per request, max encoded length of
+# the ranges in one request URL, and retries per chunk on transient errors
+BATCH_GET_MAX_RANGES = int(os.environ.get('BATCH_GET_MAX_RANGES', '25'))
+BATCH_GET_MAX_URL_CHARS = int(os.environ.get('BATCH_GET_MAX_URL_CHARS', '6000'))
+API_MAX_RETRIES = int(os.environ.get('API_MAX_RETRIES', '5'))
+
+# Fetch engine: worker threads for concurrent API calls and per-user quotas per minute
+FETCH_MAX_WORKERS = int(os.environ.get('FETCH_MAX_WORKERS', '8'))
+SHEETS_READS_PER_MINUTE = int(os.environ.get('SHEETS_READS_PER_MINUTE', '60'))
+DRIVE_QUERIES_PER_MINUTE = int(os.environ.get('DRIVE_QUERIES_PER_MINUTE', '12000'))
+
+# Seconds the Drive folder index serves listings before replaying the Drive changes feed
+DRIVE_INDEX_TTL_SECONDS = int(os.environ.get('DRIVE_INDEX_TTL_SECONDS', '60'))
+
+# On-disk workbook cache shared by all sessions; a size cap of 0 disables it
+WORKBOOK_CACHE_DIR = os.environ.get('WORKBOOK_CACHE_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'spreadsheet-explorer-cache'))
+WORKBOOK_CACHE_MAX_MB = int(os.environ.get('WORKBOOK_CACHE_MAX_MB', '2048'))
+
+# How Google Sheets are read: 'values' (Sheets API, one values call per tab or batch of tabs), 'export' (the
+# whole spreadsheet in one Drive export as .xlsx, parsed like an Excel file) or 'auto', which exports spreadsheets
+# with at least SHEETS_EXPORT_MIN_TABS tabs, whose values would take several calls against the Sheets read quota,
+# and at most SHEETS_EXPORT_MAX_CELLS grid cells (Drive refuses exports over 10 MB)
+SHEETS_INGESTION = os.environ.get('SHEETS_INGESTION', 'auto')
+SHEETS_EXPORT_MIN_TABS = int(os.environ.get('SHEETS_EXPORT_MIN_TABS', '50'))
+SHEETS_EXPORT_MAX_CELLS = int(os.environ.get('SHEETS_EXPORT_MAX_CELLS', '1000000'))
+
+# Sheets on each side of the selected one that are loaded in the background
+SHEET_PREFETCH_NEIGHBOURS = int(os.environ.get('SHEET_PREFETCH_NEIGHBOURS', '1'))
+
+# Google Sheet tabs with at least this many grid cells are shown from the header row and the selected columns of the
+# visible rows, fetched on demand, while the whole tab loads in the background (0 to always wait for the whole tab)
+WINDOWED_FETCH_MIN_CELLS = int(os.environ.get('WINDOWED_FETCH_MIN_CELLS', '1000000'))
+
+# Rows gathered per columnar batch when streaming Excel sheets
+EXCEL_BATCH_ROWS = int(os.environ.get('EXCEL_BATCH_ROWS', '50000'))
+
+# Memory budget of the in-process workbook store shared by all sessions
+WORKBOOK_STORE_MAX_MB = int(os.environ.get('WORKBOOK_STORE_MAX_MB', '1024'))
+
+# Seconds a session waits for a workbook to open, alone or together with sessions opening the same
+# revision, before giving up (0 waits indefinitely)
+WORKBOOK_LOAD_TIMEOUT_SECONDS = int(os.environ.get('WORKBOOK_LOAD_TIMEOUT_SECONDS', '300'))
+
+# Memory budget for filtered views, unique values, statistics and export files derived from sheets
+DERIVATION_CACHE_MAX_MB = int(os.environ.get('DERIVATION_CACHE_MAX_MB', '256'))
+
+# Rows shown per page of the data grid; only the visible page is sent to the browser
+DATA_PAGE_SIZE = int(os.environ.get('DATA_PAGE_SIZE', '1000'))
+
+# Query engine behind filters, search and the SQL panel: 'duckdb' or 'pandas' (also used when DuckDB is missing),
+# with DuckDB's worker threads (0 for all cores), memory limit and spill directory
+QUERY_ENGINE = os.environ.get('QUERY_ENGINE', 'duckdb')
+QUERY_THREADS = int(os.environ.get('QUERY_THREADS', '0'))
+QUERY_MEMORY_LIMIT_MB = int(os.environ.get('QUERY_MEMORY_LIMIT_MB', '1024'))
+QUERY_TEMP_DIR = os.environ.get('QUERY_TEMP_DIR', os.path.join(tempfile.gettempdir(), 'spreadsheet-explorer-duckdb'))
+
+# Rows converted and written per chunk when exporting, and the size beyond which exports spool to disk
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '10000'))
+EXPORT_SPOOL_MAX_MB = int(os.environ.get('EXPORT_SPOOL_MAX_MB', '32'))
+
+
+# SQLite full-text index of every row of the folders indexed for folder-wide search
+FOLDER_INDEX_PATH = os.environ.get('FOLDER_INDEX_PATH',
+                                   os.path.join(tempfile.gettempdir(), 'spreadsheet-explorer-index.sqlite'))
+
+# Files indexed at the same time by folder-wide indexing jobs, on a pool of their own
+FOLDER_INDEX_WORKERS = int(os.environ.get('FOLDER_INDEX_WORKERS', '2'))
+
+# Threads building indexes and profiles of loaded tabs, on a pool of their own so API fetches never wait behind them
+DERIVE_WORKERS = int(os.environ.get('DERIVE_WORKERS', '1'))
+
+
+# Performance tracing: spans of API calls, parsing, filtering, exports and rendering shown in a debug
+# panel, optionally logged as one JSON line per script run, and totals served on a Prometheus port (0 for off)
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+TRACE_LOG = os.environ.get('TRACE_LOG', 'false').lower() in ('1', 'true', 'yes')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))
+
+# Warm up a fresh server process in the background on its first script run: import modules loaded on
+# first use, build the Google clients and query engine, and list the base folder into the Drive index
+WARM_UP_ON_START = os.environ.get('WARM_UP_ON_START', 'true').lower() in ('1', 'true', 'yes')
+
+# HTTP API streaming folders, files and tabs to automated consumers from the app's process (port 0 for off),
+# the address it listens on, and an optional bearer token it requires
+API_PORT = int(os.environ.get('API_PORT', '0'))
+API_HOST = os.environ.get('API_HOST', '127.0.0.1')
+API_TOKEN = os.environ.get('API_TOKEN', '')
+
+# Background prefetch of hot workbooks into the workbook store and disk cache: seconds between cycles (0 for off),
+# comma-separated folders (default the base folder, with their subfolders) and files kept hot, how many of the
+# most opened files are added to them, and the most files handled per cycle
+PREFETCH_INTERVAL_SECONDS = int(os.environ.get('PREFETCH_INTERVAL_SECONDS', '0'))
+PREFETCH_FOLDERS = [folder_id.strip() for folder_id in
+                    os.environ.get('PREFETCH_FOLDERS', DEFAULT_BASE_FOLDER_ID or '').split(',') if folder_id.strip()]
+PREFETCH_FILES = [file_id.strip() for file_id in os.environ.get('PREFETCH_FILES', '').split(',') if file_id.strip()]
+PREFETCH_TOP_FILES = int(os.environ.get('PREFETCH_TOP_FILES', '20'))
+PREFETCH_MAX_FILES = int(os.environ.get('PREFETCH_MAX_FILES', '50'))
+
+# JSON file counting how often each file is opened, read by the prefetch scheduler to find the most opened files
+ACCESS_STATS_PATH = os.environ.get('ACCESS_STATS_PATH',
+                                   os.path.join(tempfile.gettempdir(), 'spreadsheet-explorer-access.json'))
+
+# Level of the log lines the app's modules write to standard error, e.g. DEBUG, INFO or WARNING
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+
+def setup_logging():
+    """Send the app's log lines to standard error at LOG_LEVEL; does nothing once logging is configured"""
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
 
 def setup_page_config():
     """Configure the Streamlit page settings"""
+    import streamlit as st
     st.set_page_config(
         page_title="Google Sheets Explorer",
         page_icon="📊",
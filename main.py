@@ -1,13 +1,20 @@
 import streamlit as st
 from dotenv import load_dotenv
 import os
-from config import setup_page_config
+from config import setup_logging, setup_page_config
 from components.sidebar import render_sidebar
 from components.data_view import render_data_view
+from components.folder_search import render_folder_search
+from components.debug_panel import render_debug_panel
 from utils.session_state import initialize_session_state
+from utils.http_api import get_api_server
+from utils.prefetch import get_prefetch_scheduler
+from utils.tracing import get_metrics_server, span, trace, tracing_enabled
+from utils.warmup import get_warm_up
 
 # Load environment variables from .env file
 load_dotenv()
+setup_logging()
 
 
 def main():
@@ -17,14 +24,30 @@ def main():
     # Initialize session state variables
     initialize_session_state()
 
+    # Build clients and list the Drive tree in the background, once per server process
+    get_warm_up()
+
+    # Time this run's API calls, parsing, filtering, exports and rendering, and serve the totals
+    get_metrics_server()
+
+    # Serve the HTTP API from this process when API_PORT is set, sharing the loaded workbooks
+    get_api_server()
+
+    # Keep hot workbooks loaded and current when PREFETCH_INTERVAL_SECONDS is set
+    get_prefetch_scheduler()
+    run_trace = trace('script run')
+    run_trace.start()
+
     # Render sidebar for navigation
-    render_sidebar()
+    with span('render.sidebar'):
+        render_sidebar()
 
     # Render main data view
     if (st.session_state.selected_folder and
             st.session_state.selected_file and
             st.session_state.sheets_data):
-        render_data_view()
+        with span('render.data_view'):
+            render_data_view()
     else:
         # Instructions when no file is selected
         st.markdown("""
@@ -36,24 +59,44 @@ def main():
 
         1. Select a folder from the sidebar
         2. Choose a spreadsheet or Excel file
-        3. The app will load all sheets/tabs and display them as tabs in the main area
+        3. The app lists all sheets/tabs in the main area and loads each one when you open it
 
         ## Features:
 
         - Browse folders and files in Google Drive
         - View Google Sheets and Excel (.xls/.xlsx) files
-        - Display all sheets/tabs simultaneously as tabs
+        - Switch between all sheets/tabs, each loaded when first opened
+        - Spreadsheets with many tabs are read in one Drive export instead of many Sheets API calls
+        - Sessions opening or refreshing the same file at the same time share one load instead of each fetching it
+        - Refresh a Google Sheet to pick up changes, fetching only appended rows where possible
+        - Numbers and dates in Google Sheets are recognised and sorted, filtered and summarised as such
         - Filter data by column values on each tab
         - Search across all columns within each tab
+        - Index a whole folder and search every tab of every file in it at once
+        - Page through and sort large tabs on the server
+        - Browse very large Google Sheet tabs right away, fetching only the selected columns of the visible rows
+        - Query, group and join loaded sheets with read-only SQL
         - Download individual sheets as CSV or Excel
-        - Download the entire workbook as an Excel file
-        - View summary statistics for numeric data
+        - Download the entire workbook as an Excel file, a zip of CSV files or a zip of Parquet files
+        - View summary statistics for numeric data, with distinct counts and blank shares
+        - Optional performance panel and Prometheus metrics covering API calls, parsing, filtering, exports and rendering
+        - Headless Python API, command line and HTTP API streaming tabs as Arrow, NDJSON or Parquet
+        - Scheduled background prefetch keeping the most opened workbooks loaded and current
         """)
 
+    # Search across every spreadsheet of the selected folder
+    if st.session_state.selected_folder:
+        with span('render.folder_search'):
+            render_folder_search()
+
     # Add footer
     st.sidebar.markdown("---")
     st.sidebar.markdown("Made with ❤️ with Streamlit")
 
+    if tracing_enabled():
+        render_debug_panel(run_trace)
+    run_trace.finish()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
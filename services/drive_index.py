@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+from config import DRIVE_INDEX_TTL_SECONDS
+from services.google_service import (FOLDER_MIME_TYPE, SPREADSHEET_MIME_TYPES, get_changes_start_token,
+                                     get_google_services, list_changes, list_files, list_folders)
+from utils.resources import shared_resource
+
+logger = logging.getLogger(__name__)
+
+
+class DriveIndex:
+    """
+    In-memory index of the folder and spreadsheet listings the app has browsed
+    Listings are fetched completely once, then kept current by replaying the Drive changes feed
+    at most once per TTL, so reruns in between are served from memory without any Drive call
+    """
+
+    def __init__(self, drive_service, ttl, engine=None):
+        self.drive_service = drive_service
+        self.ttl = ttl
+        self.engine = engine
+        self._folders = {}
+        self._files = {}
+        self._names = {}
+        self._page_token = None
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def list_folders(self, parent_id):
+        """Folders within parent_id, sorted by name"""
+        return self._listing(self._folders, parent_id, list_folders)
+
+    def list_files(self, folder_id):
+        """Spreadsheet files within folder_id, sorted by name"""
+        return self._listing(self._files, folder_id, list_files)
+
+    def get_name(self, file_id):
+        """Name of an indexed file or folder, or None if it has not been listed"""
+        with self._lock:
+            return self._names.get(file_id)
+
+    def _listing(self, listings, parent_id, fetch):
+        self.refresh_if_stale()
+        with self._lock:
+            if parent_id in listings:
+                return list(listings[parent_id])
+
+        # Start following changes before the first listing so nothing made meanwhile is missed
+        self._ensure_page_token()
+        entries = fetch(self.drive_service, parent_id, engine=self.engine)
+        with self._lock:
+            listings[parent_id] = entries
+            self._names.update((entry['id'], entry['name']) for entry in entries)
+            return list(entries)
+
+    def _ensure_page_token(self):
+        with self._refresh_lock:
+            if self._page_token is None:
+                self._page_token = get_changes_start_token(self.drive_service, engine=self.engine)
+                self._checked = time.monotonic()
+
+    def refresh_if_stale(self):
+        if time.monotonic() - self._checked >= self.ttl:
+            self.refresh()
+
+    def refresh(self):
+        """Apply every Drive change since the last refresh to the indexed listings"""
+        with self._refresh_lock:
+            if self._page_token is None:
+                return
+            try:
+                changes, self._page_token = list_changes(self.drive_service, self._page_token, engine=self.engine)
+            except HttpError as e:
+                # An expired or rejected token means the index can no longer be trusted: relist lazily
+                logger.warning(f'Drive changes feed failed ({e}), dropping the folder index')
+                with self._lock:
+                    self._folders.clear()
+                    self._files.clear()
+                self._page_token = None
+                return
+            finally:
+                self._checked = time.monotonic()
+
+            with self._lock:
+                for change in changes:
+                    self._apply_change(change)
+            if changes:
+                logger.info(f'Applied {len(changes)} Drive changes to the folder index')
+
+    def _apply_change(self, change):
+        file_id = change['fileId']
+        # Drop the file everywhere first; it is re-added below wherever it now belongs
+        for listings in (self._folders, self._files):
+            for parent_id, entries in listings.items():
+                listings[parent_id] = [entry for entry in entries if entry['id'] != file_id]
+
+        file = change.get('file')
+        if change.get('removed') or not file or file.get('trashed'):
+            self._names.pop(file_id, None)
+            return
+
+        if file['mimeType'] == FOLDER_MIME_TYPE:
+            listings, entry = self._folders, {'id': file['id'], 'name': file['name']}
+        elif file['mimeType'] in SPREADSHEET_MIME_TYPES:
+            listings, entry = self._files, {'id': file['id'], 'name': file['name'], 'mimeType': file['mimeType']}
+        else:
+            return
+
+        self._names[file_id] = file['name']
+        for parent_id in file.get('parents', []):
+            if parent_id in listings:
+                listings[parent_id] = sorted(listings[parent_id] + [entry], key=lambda e: e['name'])
+
+
+@shared_resource
+def get_drive_index():
+    """Drive folder index shared by all sessions of this server"""
+    drive_service, _ = get_google_services()
+    return DriveIndex(drive_service, DRIVE_INDEX_TTL_SECONDS)
@@ -0,0 +1,148 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.errors import HttpError
+
+from utils.single_flight import raise_if_cancelled
+from utils.tracing import run_in_context
+
+logger = logging.getLogger(__name__)
+
+# Rate-limit and transient server errors worth retrying
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Upper bound for a single backoff sleep in seconds
+MAX_BACKOFF_SECONDS = 32
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available and take them. Returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class FetchEngine:
+    """
+    Runs Google API requests on a bounded thread pool
+    Each worker thread gets its own authorized httplib2 client (httplib2 is not thread-safe),
+    requests are throttled by a per-API token bucket and retried with exponential backoff
+    """
+
+    def __init__(self, credentials=None, max_workers=8, limiters=None, max_retries=5):
+        self.credentials = credentials
+        self.max_workers = max_workers
+        self.limiters = limiters or {}
+        self.max_retries = max_retries
+        self.stats = {'api_calls': 0, 'retries': 0, 'throttled_seconds': 0.0}
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch',
+                                            initializer=self._mark_worker)
+
+    def _mark_worker(self):
+        self._local.in_worker = True
+
+    def count(self, stats, key, amount=1):
+        """Add to an engine-wide counter and, when given, the caller's stats dict"""
+        with self._stats_lock:
+            self.stats[key] += amount
+            if stats is not None:
+                stats[key] = stats.get(key, 0) + amount
+
+    def http(self):
+        """Return the authorized HTTP client of the current thread, or None to use the request's own"""
+        if self.credentials is None:
+            return None
+        if getattr(self._local, 'http', None) is None:
+            # httplib2 and its auth wrapper are imported with the first client rather than with the app
+            import google_auth_httplib2
+            import httplib2
+            self._local.http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return self._local.http
+
+    def throttle(self, api, stats=None):
+        """
+        Wait for a request slot of the given API's rate limiter
+        Requests of a coalesced load that every caller has abandoned stop here with FlightCancelled
+        """
+        raise_if_cancelled()
+        limiter = self.limiters.get(api)
+        if limiter is not None:
+            waited = limiter.acquire()
+            if waited:
+                self.count(stats, 'throttled_seconds', waited)
+
+    def execute(self, request, api='sheets', stats=None):
+        """
+        Execute an API request on the current thread's HTTP client
+        Retries 429/5xx responses with exponential backoff, honouring Retry-After when present
+        """
+        for attempt in range(self.max_retries + 1):
+            self.throttle(api, stats)
+            self.count(stats, 'api_calls')
+            try:
+                return request.execute(http=self.http())
+            except HttpError as e:
+                if e.resp.status not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                    raise
+                self.count(stats, 'retries')
+                delay = backoff_delay(attempt, e.resp.get('retry-after'))
+                logger.warning(f'Retrying after HTTP {e.resp.status} in {delay:.1f}s')
+                time.sleep(delay)
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the worker pool and return its Future"""
+        return self._executor.submit(run_in_context(fn), *args, **kwargs)
+
+    def background_executor(self, max_workers, name):
+        """
+        A separate bounded pool for background jobs, so they never queue ahead of interactive fetches
+        Its threads count as workers of this engine: their own fan-outs run inline rather than on the
+        shared pool. Requests still go through this engine's rate limiters.
+        """
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name, initializer=self._mark_worker)
+
+    def map(self, fn, items):
+        """
+        Apply fn to every item concurrently and return the results in item order
+        Calls made from inside a worker run inline so nested fan-outs cannot deadlock the pool
+        """
+        items = list(items)
+        if getattr(self._local, 'in_worker', False) or len(items) <= 1:
+            return [fn(item) for item in items]
+        # A context can only be entered by one thread at a time, so each call gets its own copy
+        futures = [self._executor.submit(run_in_context(fn), item) for item in items]
+        return [future.result() for future in futures]
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Exponential backoff with full jitter, or the server's Retry-After when it sent one"""
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_BACKOFF_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(2 ** (attempt + 1), MAX_BACKOFF_SECONDS))
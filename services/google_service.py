@@ -1,20 +1,55 @@
-import streamlit as st
+import logging
 import os
 import json
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+import sys
+from urllib.parse import quote
 
+from config import (API_MAX_RETRIES, BATCH_GET_MAX_RANGES, BATCH_GET_MAX_URL_CHARS, DERIVE_WORKERS,
+                    DRIVE_QUERIES_PER_MINUTE, FETCH_MAX_WORKERS, SHEETS_READS_PER_MINUTE)
+from services.fetch_engine import FetchEngine, TokenBucket
+from utils.resources import shared_resource
+from utils.tracing import span, tracing_enabled
 
-@st.cache_resource
-def get_google_services():
+logger = logging.getLogger(__name__)
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+SPREADSHEET_MIME_TYPES = (
+    'application/vnd.google-apps.spreadsheet',
+    'application/vnd.ms-excel',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+)
+XLSX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Largest page size files().list and changes().list accept
+DRIVE_PAGE_SIZE = 1000
+
+
+def streamlit_secret(key):
+    """A Streamlit secret, or None when it is not set or outside the Streamlit app"""
+    if 'streamlit' not in sys.modules:
+        # Headless callers do not load Streamlit just to look for a secrets file
+        return None
+    import streamlit as st
+    try:
+        return st.secrets[key]
+    except Exception:
+        return None
+
+
+class CredentialsError(Exception):
+    """No service account credentials are configured"""
+
+
+@shared_resource
+def get_google_credentials():
     """
-    Authenticate with Google Drive & Sheets APIs
-    Returns a tuple of (drive_service, sheets_service)
+    Load service account credentials for the Google Drive & Sheets APIs
+    Read from Streamlit secrets in the app, otherwise from the environment, which is also where
+    headless callers read them from
     """
-    try:
-        # For deployment, you can use st.secrets
-        service_account_info = st.secrets["google_credentials"]
-    except:
+    # For deployment, you can use st.secrets
+    service_account_info = streamlit_secret("google_credentials")
+    if not service_account_info:
         # For local development
         try:
             service_account_info = json.loads(os.environ['GOOGLE_DRIVE_CREDENTIALS'])
@@ -23,10 +58,11 @@ def get_google_services():
             service_account_info = eval(os.environ.get("GOOGLE_CREDENTIALS", "{}"))
 
     if not service_account_info:
-        st.error("Google credentials not found! Please set up service account credentials.")
-        st.stop()
+        raise CredentialsError("Google credentials not found! Please set up service account credentials.")
 
-    credentials = service_account.Credentials.from_service_account_info(
+    # The Google client libraries are imported on first use, keeping them out of the app's import time
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_info(
         service_account_info,
         scopes=[
             'https://www.googleapis.com/auth/drive.readonly',
@@ -34,73 +70,309 @@ def get_google_services():
         ]
     )
 
-    drive_service = build('drive', 'v3', cache_discovery=False, credentials=credentials)
-    sheets_service = build('sheets', 'v4', cache_discovery=False, credentials=credentials)
+
+@shared_resource
+def get_google_services():
+    """
+    Authenticate with Google Drive & Sheets APIs
+    Returns a tuple of (drive_service, sheets_service)
+    Clients are built from the discovery documents bundled with google-api-python-client, so
+    building them makes no request
+    """
+    from googleapiclient.discovery import build
+    credentials = get_google_credentials()
+
+    drive_service = build('drive', 'v3', cache_discovery=False, static_discovery=True, credentials=credentials)
+    sheets_service = build('sheets', 'v4', cache_discovery=False, static_discovery=True, credentials=credentials)
 
     return drive_service, sheets_service
 
 
-def list_folders(drive_service, parent_folder_id):
-    print("Listing folders from {}".format(parent_folder_id))
-    folders = drive_service.files().list()
-    """List all folders within a parent folder"""
-    query = f"'{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+@shared_resource
+def get_fetch_engine():
+    """
+    Shared fetch engine running API calls on a bounded worker pool
+    Token buckets allow the per-minute Sheets/Drive quotas with a full minute of burst
+    """
+    return FetchEngine(
+        credentials=get_google_credentials(),
+        max_workers=FETCH_MAX_WORKERS,
+        limiters={
+            'sheets': TokenBucket(SHEETS_READS_PER_MINUTE / 60, SHEETS_READS_PER_MINUTE),
+            'drive': TokenBucket(DRIVE_QUERIES_PER_MINUTE / 60, DRIVE_QUERIES_PER_MINUTE),
+        },
+        max_retries=API_MAX_RETRIES
+    )
 
-    response = drive_service.files().list(
-        q=query,
-        spaces='drive',
-        supportsAllDrives=True,
-        includeItemsFromAllDrives=True,
-        fields='files(id, name)',
-        orderBy='name'
-    ).execute()
 
-    folders = response.get('files', [])
+@shared_resource
+def get_derive_executor():
+    """
+    Shared pool building indexes and profiles of loaded tabs, apart from the fetch engine's pool so
+    CPU-bound work never holds up API calls
+    """
+    return get_fetch_engine().background_executor(DERIVE_WORKERS, 'derive')
+
+
+def list_folders(drive_service, parent_folder_id, engine=None):
+    """List all folders within a parent folder"""
+    logger.info("Listing folders from {}".format(parent_folder_id))
+    query = f"'{parent_folder_id}' in parents and mimeType='{FOLDER_MIME_TYPE}' and trashed=false"
+    with span('drive.list_folders') as s:
+        folders = list_all_files(drive_service, query, 'id, name', engine=engine)
+        s.set(files=len(folders))
     return folders
 
 
-def list_files(drive_service, folder_id):
+def list_files(drive_service, folder_id, engine=None):
     """List all spreadsheet files in a folder"""
-    print(f'Listing files in folder {folder_id}')
-    query = f"'{folder_id}' in parents and (mimeType='application/vnd.google-apps.spreadsheet' or mimeType='application/vnd.ms-excel' or mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet') and trashed=false"
+    logger.info(f'Listing files in folder {folder_id}')
+    mime_types = ' or '.join(f"mimeType='{mime_type}'" for mime_type in SPREADSHEET_MIME_TYPES)
+    query = f"'{folder_id}' in parents and ({mime_types}) and trashed=false"
+    with span('drive.list_files') as s:
+        files = list_all_files(drive_service, query, 'id, name, mimeType', engine=engine)
+        s.set(files=len(files))
+    return files
 
-    response = drive_service.files().list(
-        q=query,
-        spaces='drive',
-        supportsAllDrives=True,
-        includeItemsFromAllDrives=True,
-        fields='files(id, name, mimeType)',
-        orderBy='name'
-    ).execute()
 
-    files = response.get('files', [])
-    return files
+def list_all_files(drive_service, query, file_fields, engine=None):
+    """Run a Drive files().list query, following nextPageToken until every match is returned"""
+    files = []
+    page_token = None
+    while True:
+        response = execute_with_retry(drive_service.files().list(
+            q=query,
+            spaces='drive',
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True,
+            pageSize=DRIVE_PAGE_SIZE,
+            pageToken=page_token,
+            fields=f'nextPageToken, files({file_fields})',
+            orderBy='name'
+        ), api='drive', engine=engine)
+        files.extend(response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return files
+
+
+def get_changes_start_token(drive_service, engine=None):
+    """Get the Drive changes feed position to track changes made from now on"""
+    response = execute_with_retry(drive_service.changes().getStartPageToken(supportsAllDrives=True),
+                                  api='drive', engine=engine)
+    return response['startPageToken']
+
+
+def list_changes(drive_service, page_token, engine=None):
+    """
+    List every Drive change since page_token
+    Returns a tuple of (changes, start token for the next call)
+    """
+    changes = []
+    while True:
+        response = execute_with_retry(drive_service.changes().list(
+            pageToken=page_token,
+            spaces='drive',
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True,
+            pageSize=DRIVE_PAGE_SIZE,
+            fields='nextPageToken, newStartPageToken, '
+                   'changes(fileId, removed, file(id, name, mimeType, parents, trashed))'
+        ), api='drive', engine=engine)
+        changes.extend(response.get('changes', []))
+        if 'newStartPageToken' in response:
+            return changes, response['newStartPageToken']
+        page_token = response['nextPageToken']
+
+
+def get_spreadsheet_properties(sheets_service, spreadsheet_id, stats=None, engine=None):
+    """
+    Get the title and grid size of every sheet of a Google spreadsheet, without any cell data
+    Returns a tuple of ({sheet name: {'rowCount', 'columnCount'}} in sheet order, file title)
+    """
+    with span('sheets.spreadsheets.get'):
+        spreadsheet = execute_with_retry(sheets_service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            fields='properties.title,sheets.properties(title,gridProperties(rowCount,columnCount))'
+        ), stats=stats, engine=engine)
+    sheet_properties = {}
+    for sheet in spreadsheet.get('sheets', []):
+        grid = sheet['properties'].get('gridProperties', {})
+        sheet_properties[sheet['properties']['title']] = {
+            'rowCount': grid.get('rowCount', 0),
+            'columnCount': grid.get('columnCount', 0),
+        }
+    return sheet_properties, spreadsheet['properties']['title']
+
+
+def execute_with_retry(request, api='sheets', stats=None, engine=None):
+    """
+    Execute an API request through the fetch engine: rate limited, with backoff on 429/5xx
+    Every attempt is counted in stats['api_calls'] when a stats dict is given
+    """
+    engine = engine or get_fetch_engine()
+    with span(f'api.{api}'):
+        return engine.execute(request, api=api, stats=stats)
+
+
+def sheet_range(sheet_name):
+    """Build an A1 range covering a whole sheet, escaping quotes in the name"""
+    escaped = sheet_name.replace("'", "''")
+    return f"'{escaped}'"
+
+
+def row_range(sheet_name, first_row, last_row):
+    """Build an A1 range covering whole rows first_row..last_row (1-based) of a sheet"""
+    return f'{sheet_range(sheet_name)}!{first_row}:{last_row}'
+
 
+def column_letter(index):
+    """A1 letters of a 0-based column index: 0 is A, 26 is AA"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
 
-def get_spreadsheet_metadata(sheets_service, spreadsheet_id):
-    """Get metadata for a Google spreadsheet (sheet names)"""
-    spreadsheet = sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-    sheets = spreadsheet.get('sheets', [])
-    sheet_names = [sheet['properties']['title'] for sheet in sheets]
-    file_title = spreadsheet['properties']['title']
-    return sheet_names, file_title
 
+def cell_range(sheet_name, first_row, last_row, first_column, last_column):
+    """Build an A1 range covering rows first_row..last_row (1-based) of columns first_column..last_column (0-based)"""
+    return f'{sheet_range(sheet_name)}!{column_letter(first_column)}{first_row}:{column_letter(last_column)}{last_row}'
 
-def get_sheet_data(sheets_service, spreadsheet_id, sheet_name):
+
+def chunk_ranges(ranges, max_ranges=BATCH_GET_MAX_RANGES, max_url_chars=BATCH_GET_MAX_URL_CHARS):
+    """Split ranges into batches that stay under the per-request range and URL length limits"""
+    chunk = []
+    chunk_chars = 0
+    for range_name in ranges:
+        encoded_chars = len('&ranges=') + len(quote(range_name, safe=''))
+        if chunk and (len(chunk) >= max_ranges or chunk_chars + encoded_chars > max_url_chars):
+            yield chunk
+            chunk = []
+            chunk_chars = 0
+        chunk.append(range_name)
+        chunk_chars += encoded_chars
+    if chunk:
+        yield chunk
+
+
+def get_sheet_data(sheets_service, spreadsheet_id, sheet_name, stats=None, engine=None):
     """Read data from a specific sheet in a Google spreadsheet"""
-    print(f'Getting data from {sheet_name}')
-    range_name = f"'{sheet_name}'"
-    result = sheets_service.spreadsheets().values().get(
-        spreadsheetId=spreadsheet_id, range=range_name).execute()
-    values = result.get('values', [])
+    logger.info(f'Getting data from {sheet_name}')
+    with span('sheets.values.get') as s:
+        result = execute_with_retry(sheets_service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id, range=sheet_range(sheet_name)), stats=stats, engine=engine)
+        values = result.get('values', [])
+        if stats is not None or tracing_enabled():
+            # Approximate payload size of the decoded JSON response
+            nbytes = len(json.dumps(result, separators=(',', ':')).encode('utf-8'))
+            s.set(rows=len(values), bytes=nbytes)
+            if stats is not None:
+                stats['bytes'] = stats.get('bytes', 0) + nbytes
 
     return values
 
 
-def get_file_details(drive_service, file_id):
+def batch_get_sheet_data(sheets_service, spreadsheet_id, sheet_names, engine=None):
+    """
+    Read several sheets of a Google spreadsheet with chunked values.batchGet calls
+    Chunks are fetched concurrently, so load time follows the slowest chunk rather than the sum
+    Returns a tuple of (values keyed by sheet name, stats with api_calls and response bytes)
+    """
+    engine = engine or get_fetch_engine()
+    values_by_sheet = {}
+    stats = {'api_calls': 0, 'bytes': 0}
+    range_to_sheet = {sheet_range(name): name for name in sheet_names}
+
+    def fetch_chunk(chunk):
+        logger.info(f'Batch getting {len(chunk)} sheets')
+        return execute_with_retry(sheets_service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id, ranges=chunk, majorDimension='ROWS'), stats=stats, engine=engine)
+
+    chunks = list(chunk_ranges(list(range_to_sheet)))
+    with span('sheets.values.batchGet', sheets=len(sheet_names), chunks=len(chunks)) as s:
+        for chunk, result in zip(chunks, engine.map(fetch_chunk, chunks)):
+            # Approximate payload size of the decoded JSON response
+            stats['bytes'] += len(json.dumps(result, separators=(',', ':')).encode('utf-8'))
+
+            # valueRanges are returned in the same order as the requested ranges
+            for range_name, value_range in zip(chunk, result.get('valueRanges', [])):
+                values_by_sheet[range_to_sheet[range_name]] = value_range.get('values', [])
+        s.set(bytes=stats['bytes'])
+
+    return values_by_sheet, stats
+
+
+def get_sheet_ranges(sheets_service, spreadsheet_id, ranges, stats=None, engine=None):
+    """Read several A1 ranges with one values.batchGet call; returns their values in request order"""
+    with span('sheets.values.batchGet', ranges=len(ranges)) as s:
+        result = execute_with_retry(sheets_service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id, ranges=ranges, majorDimension='ROWS'), stats=stats, engine=engine)
+        if stats is not None or tracing_enabled():
+            nbytes = len(json.dumps(result, separators=(',', ':')).encode('utf-8'))
+            s.set(bytes=nbytes)
+            if stats is not None:
+                stats['bytes'] = stats.get('bytes', 0) + nbytes
+    return [value_range.get('values', []) for value_range in result.get('valueRanges', [])]
+
+
+def get_file_details(drive_service, file_id, engine=None):
     """Get file details for a specific file"""
-    return drive_service.files().get(
+    return execute_with_retry(drive_service.files().get(
         fileId=file_id,
         supportsAllDrives=True,
-        fields="name"
-    ).execute()
\ No newline at end of file
+        fields="name, mimeType"
+    ), api='drive', engine=engine)
+
+
+def get_file_revision(drive_service, file_id, stats=None, engine=None):
+    """
+    Get a cheap revision identifier for a Drive file
+    Uses the file's version counter, falling back to modifiedTime
+    """
+    details = execute_with_retry(drive_service.files().get(
+        fileId=file_id,
+        supportsAllDrives=True,
+        fields="id, modifiedTime, version"
+    ), api='drive', stats=stats, engine=engine)
+    return details.get('version') or details['modifiedTime']
+
+
+def download_file(drive_service, file_id, file_buffer, stats=None, engine=None):
+    """Download a Drive file's content into file_buffer"""
+    return download_media(drive_service.files().get_media(fileId=file_id), file_buffer, 'drive.download',
+                          stats=stats, engine=engine)
+
+
+def export_file(drive_service, file_id, mime_type, file_buffer, stats=None, engine=None):
+    """
+    Export a Google Workspace file to mime_type into file_buffer
+    Drive refuses exports larger than 10 MB with a 403 HttpError
+    """
+    return download_media(drive_service.files().export_media(fileId=file_id, mimeType=mime_type), file_buffer,
+                          'drive.export', stats=stats, engine=engine)
+
+
+def download_media(request, file_buffer, span_name, stats=None, engine=None):
+    """
+    Run a media request into file_buffer on the current thread's HTTP client
+    Each chunk waits for a Drive rate limiter slot; chunk retries use the same backoff statuses
+    """
+    from googleapiclient.http import MediaIoBaseDownload
+    engine = engine or get_fetch_engine()
+    http = engine.http()
+    if http is not None:
+        request.http = http
+    downloader = MediaIoBaseDownload(file_buffer, request)
+
+    done = False
+    with span(span_name) as s:
+        while not done:
+            engine.throttle('drive', stats)
+            engine.count(stats, 'api_calls')
+            status, done = downloader.next_chunk(num_retries=engine.max_retries)
+        s.set(bytes=file_buffer.tell())
+
+    file_buffer.seek(0)
+    return file_buffer
\ No newline at end of file
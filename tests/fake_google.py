@@ -0,0 +1,393 @@
+"""
+In-process stand-in for the Drive v3 and Sheets v4 endpoints used by the app
+Behaves like the googleapiclient service objects (`service.files().list(...).execute()`), with
+injectable latency, per-minute quotas and failures so concurrency and backoff can be exercised offline:
+
+    backend = FakeGoogleBackend(latency=0.05, quota_per_minute=60)
+    folder_id = backend.add_folder('Reports')
+    backend.add_spreadsheet('Sales', folder_id, {'Q1': [['Region', 'Total'], ['EU', '10']]})
+    engine = FetchEngine(max_workers=8)
+    list_files(backend.drive_service(), folder_id, engine=engine)
+"""
+import io
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+SPREADSHEET_MIME_TYPE = 'application/vnd.google-apps.spreadsheet'
+
+# Drive returns at most this many files per page unless pageSize asks for more
+DEFAULT_PAGE_SIZE = 100
+
+# Drive refuses to export files larger than this
+EXPORT_MAX_BYTES = 10 * 1024 * 1024
+
+XLSX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+NUMBER_PATTERN = re.compile(r'-?[\d,]*\.?\d+')
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def http_error(status, message=''):
+    """Build the HttpError googleapiclient raises for a failed response"""
+    content = json.dumps({'error': {'code': status, 'message': message}}).encode('utf-8')
+    return HttpError(httplib2.Response({'status': status}), content)
+
+
+class FakeGoogleBackend:
+    """Shared state, call accounting and fault injection behind the fake Drive and Sheets services"""
+
+    def __init__(self, latency=0.0, per_cell_latency=0.0, quota_per_minute=None):
+        self.latency = latency
+        self.per_cell_latency = per_cell_latency
+        self.quota_per_minute = quota_per_minute
+        self.files = {}
+        self.spreadsheets = {}
+        self.blobs = {}
+        self.exports = {}
+        self.changes = []
+        self.calls = Counter()
+        self.max_concurrency = 0
+        self._active = 0
+        self._failures = deque()
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def add_folder(self, name, parent_id='root'):
+        return self._add_file(name, parent_id, FOLDER_MIME_TYPE)
+
+    def add_spreadsheet(self, name, parent_id, sheets):
+        """Add a Google Sheet; sheets maps tab title to its list-of-lists values"""
+        file_id = self._add_file(name, parent_id, SPREADSHEET_MIME_TYPE)
+        self.spreadsheets[file_id] = dict(sheets)
+        return file_id
+
+    def update_spreadsheet(self, file_id, sheets):
+        """Replace some tabs' values (or add tabs) and bump the file's version"""
+        self.spreadsheets[file_id].update(sheets)
+        self.exports.pop(file_id, None)
+        self.update_file(file_id)
+
+    def add_blob(self, name, parent_id, mime_type, content):
+        """Add a binary file such as an uploaded .xlsx"""
+        file_id = self._add_file(name, parent_id, mime_type)
+        self.blobs[file_id] = content
+        return file_id
+
+    def _add_file(self, name, parent_id, mime_type):
+        file_id = uuid.uuid4().hex
+        self.files[file_id] = {
+            'id': file_id,
+            'name': name,
+            'mimeType': mime_type,
+            'parents': [parent_id],
+            'trashed': False,
+            'modifiedTime': '2024-01-01T00:00:00.000Z',
+            'version': '1',
+        }
+        self._record_change(file_id)
+        return file_id
+
+    def update_file(self, file_id, **fields):
+        """Change a file's metadata (name, parents, trashed...) and bump its version"""
+        file = self.files[file_id]
+        file.update(fields)
+        file['version'] = str(int(file['version']) + 1)
+        self._record_change(file_id)
+
+    def _record_change(self, file_id):
+        self.changes.append({'fileId': file_id, 'removed': False, 'file': dict(self.files[file_id])})
+
+    def fail_next(self, count, status=503):
+        """Make the next `count` calls fail with the given HTTP status"""
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def drive_service(self):
+        return FakeDriveService(self)
+
+    def sheets_service(self):
+        return FakeSheetsService(self)
+
+    def call(self, endpoint, handler, cells=0):
+        """Account for one API call, apply quota, injected failures and latency, then run handler"""
+        with self._lock:
+            self.calls[endpoint] += 1
+            now = time.monotonic()
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            if self.quota_per_minute is not None and len(self._window) >= self.quota_per_minute:
+                self.calls['rate_limited'] += 1
+                raise http_error(429, 'Quota exceeded')
+            self._window.append(now)
+            if self._failures:
+                raise http_error(self._failures.popleft(), 'Injected failure')
+            self._active += 1
+            self.max_concurrency = max(self.max_concurrency, self._active)
+        try:
+            time.sleep(self.latency + cells * self.per_cell_latency)
+            return handler()
+        finally:
+            with self._lock:
+                self._active -= 1
+
+
+class FakeRequest:
+    """Deferred call with the execute() signature of googleapiclient.http.HttpRequest"""
+
+    def __init__(self, backend, endpoint, handler, cells=0):
+        self.backend = backend
+        self.endpoint = endpoint
+        self.handler = handler
+        self.cells = cells
+
+    def execute(self, http=None, num_retries=0):
+        return self.backend.call(self.endpoint, self.handler, self.cells)
+
+
+class FakeMediaHttp:
+    """httplib2-like transport serving ranged reads of a blob or export, as used by MediaIoBaseDownload"""
+
+    def __init__(self, backend, file_id, export_mime_type=None):
+        self.backend = backend
+        self.file_id = file_id
+        self.export_mime_type = export_mime_type
+
+    def request(self, uri, method='GET', headers=None, **kwargs):
+        if self.export_mime_type is not None:
+            return self.export()
+        content = self.backend.blobs[self.file_id]
+        match = re.match(r'bytes=(\d+)-(\d+)', (headers or {}).get('range', ''))
+        start, end = (int(match.group(1)), int(match.group(2))) if match else (0, len(content) - 1)
+        chunk = content[start:end + 1]
+        response = httplib2.Response({
+            'status': 206,
+            'content-range': f'bytes {start}-{start + len(chunk) - 1}/{len(content)}',
+        })
+        return self.backend.call('drive.files.get_media', lambda: (response, chunk))
+
+    def export(self):
+        """
+        The whole export in one response, as Drive sends exports; it is charged the latency of
+        every cell of the spreadsheet, like reading them all through the values API
+        """
+        def handler():
+            if self.export_mime_type != XLSX_MIME_TYPE:
+                raise http_error(400, f'Export to {self.export_mime_type} is not supported')
+            if self.file_id not in self.backend.exports:
+                self.backend.exports[self.file_id] = export_xlsx(self.backend.spreadsheets[self.file_id])
+            content = self.backend.exports[self.file_id]
+            if len(content) > EXPORT_MAX_BYTES:
+                raise http_error(403, 'This file is too large to be exported.')
+            return httplib2.Response({'status': 200}), content
+
+        sheets = self.backend.spreadsheets.get(self.file_id, {})
+        cells = sum(len(row) for values in sheets.values() for row in values)
+        return self.backend.call('drive.files.export', handler, cells)
+
+
+class FakeMediaRequest:
+    """Media request exposing the attributes MediaIoBaseDownload reads"""
+
+    def __init__(self, backend, file_id, export_mime_type=None):
+        self.uri = f'https://fake.googleapis.com/drive/v3/files/{file_id}' + \
+            (f'/export?mimeType={export_mime_type}' if export_mime_type else '?alt=media')
+        self.headers = {}
+        self.http = FakeMediaHttp(backend, file_id, export_mime_type)
+
+
+class FakeFilesResource:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def list(self, q='', pageSize=DEFAULT_PAGE_SIZE, pageToken=None, orderBy=None, **kwargs):
+        def handler():
+            matches = [f for f in self.backend.files.values() if _matches_query(f, q)]
+            if orderBy:
+                matches.sort(key=lambda f: f['name'])
+            start = int(pageToken or 0)
+            page = matches[start:start + pageSize]
+            response = {'files': [dict(f) for f in page]}
+            if start + pageSize < len(matches):
+                response['nextPageToken'] = str(start + pageSize)
+            return response
+
+        return FakeRequest(self.backend, 'drive.files.list', handler)
+
+    def get(self, fileId, **kwargs):
+        def handler():
+            if fileId not in self.backend.files:
+                raise http_error(404, f'File not found: {fileId}')
+            return dict(self.backend.files[fileId])
+
+        return FakeRequest(self.backend, 'drive.files.get', handler)
+
+    def get_media(self, fileId, **kwargs):
+        return FakeMediaRequest(self.backend, fileId)
+
+    def export_media(self, fileId, mimeType, **kwargs):
+        return FakeMediaRequest(self.backend, fileId, mimeType)
+
+
+class FakeChangesResource:
+    """Changes feed where a page token is simply a position in the backend's change log"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def getStartPageToken(self, **kwargs):
+        return FakeRequest(self.backend, 'drive.changes.getStartPageToken',
+                           lambda: {'startPageToken': str(len(self.backend.changes))})
+
+    def list(self, pageToken, pageSize=DEFAULT_PAGE_SIZE, **kwargs):
+        def handler():
+            start = int(pageToken)
+            page = self.backend.changes[start:start + pageSize]
+            response = {'changes': [dict(change) for change in page]}
+            if start + pageSize < len(self.backend.changes):
+                response['nextPageToken'] = str(start + pageSize)
+            else:
+                response['newStartPageToken'] = str(len(self.backend.changes))
+            return response
+
+        return FakeRequest(self.backend, 'drive.changes.list', handler)
+
+
+class FakeDriveService:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def files(self):
+        return FakeFilesResource(self.backend)
+
+    def changes(self):
+        return FakeChangesResource(self.backend)
+
+
+class FakeValuesResource:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _values(self, spreadsheet_id, range_name):
+        """Values of a whole-sheet range, a row range such as 'Sheet'!5:10 or a cell range such as 'Sheet'!B5:D10"""
+        match = re.search(r'!([A-Z]*)(\d+):([A-Z]*)(\d+)$', range_name)
+        title = range_name[:match.start()] if match else range_name
+        if title.startswith("'") and title.endswith("'"):
+            title = title[1:-1].replace("''", "'")
+        values = self.backend.spreadsheets[spreadsheet_id].get(title, [])
+        if match:
+            first_column, first_row, last_column, last_row = match.groups()
+            values = values[int(first_row) - 1:int(last_row)]
+            if first_column:
+                columns = slice(_column_index(first_column), _column_index(last_column) + 1)
+                values = [row[columns] for row in values]
+                # Like the API, trailing blank cells and rows are left out
+                values = [row[:max((i + 1 for i, value in enumerate(row) if value != ''), default=0)]
+                          for row in values]
+                while values and not values[-1]:
+                    values.pop()
+        return values
+
+    def get(self, spreadsheetId, range, **kwargs):
+        values = self._values(spreadsheetId, range)
+        return FakeRequest(self.backend, 'sheets.values.get',
+                           lambda: {'range': range, 'values': values},
+                           cells=sum(len(row) for row in values))
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        value_ranges = [{'range': r, 'values': self._values(spreadsheetId, r)} for r in ranges]
+        cells = sum(len(row) for vr in value_ranges for row in vr['values'])
+        return FakeRequest(self.backend, 'sheets.values.batchGet',
+                           lambda: {'spreadsheetId': spreadsheetId, 'valueRanges': value_ranges},
+                           cells=cells)
+
+
+class FakeSpreadsheetsResource:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, spreadsheetId, **kwargs):
+        def handler():
+            sheets = self.backend.spreadsheets[spreadsheetId]
+            return {
+                'spreadsheetId': spreadsheetId,
+                'properties': {'title': self.backend.files[spreadsheetId]['name']},
+                'sheets': [
+                    {'properties': {
+                        'title': title,
+                        'gridProperties': {
+                            'rowCount': len(values),
+                            'columnCount': max((len(row) for row in values), default=0),
+                        },
+                    }}
+                    for title, values in sheets.items()
+                ],
+            }
+
+        return FakeRequest(self.backend, 'sheets.spreadsheets.get', handler)
+
+    def values(self):
+        return FakeValuesResource(self.backend)
+
+
+class FakeSheetsService:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def spreadsheets(self):
+        return FakeSpreadsheetsResource(self.backend)
+
+
+def export_xlsx(sheets):
+    """
+    A spreadsheet as the .xlsx file Drive exports: number and date cells are written typed rather than
+    as their formatted text, and tab titles are cut to Excel's 31 characters
+    """
+    import xlsxwriter
+    buffer = io.BytesIO()
+    workbook = xlsxwriter.Workbook(buffer, {'in_memory': True})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+    for title, values in sheets.items():
+        worksheet = workbook.add_worksheet(title[:31])
+        for row_number, row in enumerate(values):
+            for column_number, value in enumerate(row):
+                if value == '':
+                    continue
+                if row_number and NUMBER_PATTERN.fullmatch(value):
+                    worksheet.write_number(row_number, column_number, float(value.replace(',', '')))
+                elif row_number and DATE_PATTERN.fullmatch(value):
+                    worksheet.write_datetime(row_number, column_number, datetime.strptime(value, '%Y-%m-%d'),
+                                             date_format)
+                else:
+                    worksheet.write_string(row_number, column_number, value)
+    workbook.close()
+    return buffer.getvalue()
+
+
+def _column_index(letters):
+    """0-based index of A1 column letters"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _matches_query(file, query):
+    """Evaluate the subset of the Drive query language the app uses"""
+    parent = re.search(r"'([^']+)' in parents", query)
+    if parent and parent.group(1) not in file['parents']:
+        return False
+    mime_types = re.findall(r"mimeType='([^']+)'", query)
+    if mime_types and file['mimeType'] not in mime_types:
+        return False
+    if 'trashed=false' in query and file['trashed']:
+        return False
+    return True
@@ -0,0 +1,130 @@
+import re
+
+import pandas as pd
+import pytest
+
+from utils.data_processing import DATE_FORMATS, NUMBER_PATTERN, append_rows, infer_column, values_to_dataframe
+
+NA = pd.NA
+NaT = pd.NaT
+
+
+@pytest.mark.parametrize('cells, dtype, expected', [
+    (['1', '2', '3'], 'int64', [1, 2, 3]),
+    (['1', '', '3'], 'Int64', [1, NA, 3]),
+    ([None, '1'], 'Int64', [NA, 1]),
+    (['1.5', '2'], 'float64', [1.5, 2.0]),
+    (['1.5', ''], 'Float64', [1.5, NA]),
+    (['1e3', '2E-2'], 'float64', [1000.0, 0.02]),
+    (['2024-01-31', ''], 'datetime64[ns]', [pd.Timestamp('2024-01-31'), NaT]),
+    (['a', 'a', 'a', 'b'], 'category', ['a', 'a', 'a', 'b']),
+    (['a', 'b', 'c'], 'string[pyarrow]', ['a', 'b', 'c']),
+    # Numbers in the sample but not further down: the column stays text
+    (['1'] * 1000 + ['x'], 'category', ['1'] * 1000 + ['x']),
+    (['2024-13-01'], 'string[pyarrow]', ['2024-13-01']),
+])
+def test_infer_column(cells, dtype, expected):
+    pd.testing.assert_series_equal(pd.Series(infer_column(cells)), pd.Series(expected, dtype=dtype))
+
+
+@pytest.mark.parametrize('cell, is_number', [
+    ('0', True),
+    ('-12', True),
+    ('3.25', True),
+    ('.5', True),
+    ('-0.5', True),
+    ('1e-3', True),
+    ('1,234', True),
+    ('12,345,678.9', True),
+    ('007', False),
+    ('00.5', False),
+    ('1,23', False),
+    ('1,2345', False),
+    ('12,34,567', False),
+    (',123', False),
+    ('1.', False),
+    ('1 000', False),
+    ('$5', False),
+    ('', False),
+])
+def test_number_pattern(cell, is_number):
+    assert bool(re.fullmatch(NUMBER_PATTERN, cell)) == is_number
+
+
+@pytest.mark.parametrize('cells, expected', [
+    (['1,234', '5'], [1234, 5]),
+    (['9223372036854775807'], [9223372036854775807]),
+    (['-9223372036854775808'], [-9223372036854775808]),
+])
+def test_numbers_parse_to_int64(cells, expected):
+    column = pd.Series(infer_column(cells))
+
+    assert column.dtype == 'int64'
+    assert column.tolist() == expected
+
+
+@pytest.mark.parametrize('cell', ['9223372036854775808', '-9223372036854775809', '123456789012345678901234567890'])
+def test_integers_beyond_int64_stay_text(cell):
+    column = pd.Series(infer_column([cell, '1']))
+
+    assert column.dtype == 'string'
+    assert column[0] == cell
+
+
+@pytest.mark.parametrize('cells, expected', [
+    (['2024-01-31 10:00'], ['2024-01-31 10:00']),
+    (['2024-01-31 10:00:05'], ['2024-01-31 10:00:05']),
+    # Month first is tried before day first, so ambiguous dates are read the US way
+    (['01/02/2024'], ['2024-01-02']),
+    (['13/02/2024'], ['2024-02-13']),
+    # The whole sample has to parse with one format
+    (['01/02/2024', '13/02/2024'], ['2024-02-01', '2024-02-13']),
+    (['31.01.2024 23:59'], ['2024-01-31 23:59']),
+])
+def test_date_formats_are_tried_in_order(cells, expected):
+    column = pd.Series(infer_column(cells))
+
+    assert column.dtype == 'datetime64[ns]'
+    assert column.tolist() == [pd.Timestamp(value) for value in expected]
+
+
+def test_month_first_formats_come_before_day_first():
+    assert DATE_FORMATS.index('%m/%d/%Y') < DATE_FORMATS.index('%d/%m/%Y')
+    assert DATE_FORMATS[0] == '%Y-%m-%d'
+
+
+SHEET = [
+    ['count', 'price', 'day', 'kind', 'code'],
+    ['1', '1.5', '2024-01-01', 'a', 'x1'],
+    ['2', '2.5', '2024-01-02', 'a', 'x2'],
+    ['3', '', '2024-01-03', 'a', 'x3'],
+    ['4', '1', '2024-01-04', 'a', 'x4'],
+]
+SHEET_DTYPES = ['int64', 'Float64', 'datetime64[ns]', 'category', 'string']
+
+
+@pytest.mark.parametrize('rows, dtypes', [
+    ([['5', '3.5', '2024-01-05', 'c', 'x5']], SHEET_DTYPES),
+    ([['1,000', '1e2', '2024-01-06', 'b', 'x6'], ['6', '2', '2024-01-07', 'a', 'x7']], SHEET_DTYPES),
+    # Blank cells turn an int64 column into Int64, and a decimal into float64, as a fresh parse would
+    ([['', '', '', '', '']], ['Int64'] + SHEET_DTYPES[1:]),
+    ([['5']], SHEET_DTYPES),
+    ([['5.5', '1', '2024-01-05', 'a', 'x5']], ['float64'] + SHEET_DTYPES[1:]),
+])
+def test_append_rows_keeps_dtypes(rows, dtypes):
+    appended = append_rows(values_to_dataframe(SHEET), rows)
+
+    assert appended.dtypes.astype(str).tolist() == dtypes
+    # Same values as parsing the whole sheet again, though text columns may be categorised differently
+    fresh = values_to_dataframe(SHEET + rows)
+    pd.testing.assert_frame_equal(appended.astype(object), fresh.astype(object))
+
+
+@pytest.mark.parametrize('rows', [
+    [['x', '1', '2024-01-05', 'a', 'x5']],
+    [['5', 'x', '2024-01-05', 'a', 'x5']],
+    [['5', '1', '7', 'a', 'x5']],
+    [['5', '1', '2024-01-05', 'a', 'x5', 'extra']],
+])
+def test_append_rows_refuses_rows_that_do_not_fit(rows):
+    assert append_rows(values_to_dataframe(SHEET), rows) is None
@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+from utils.derivation_cache import DerivationCache, artifact_nbytes, filter_state_key
+
+
+def blob(size):
+    return b'x' * size
+
+
+def test_total_bytes_follows_puts_replacements_and_evictions():
+    cache = DerivationCache(max_bytes=1000)
+
+    cache.put('a', blob(300))
+    cache.put('b', blob(200))
+    assert cache.total_bytes() == 500
+
+    cache.put('a', blob(100))
+    assert cache.total_bytes() == 300
+
+    # b is the least recently stored now that a was replaced
+    cache.put('c', blob(800))
+    assert cache.total_bytes() == 900
+    assert cache.get('b') is None
+
+
+@pytest.mark.parametrize('value, nbytes', [
+    (blob(1234), 1234),
+    (pd.DataFrame({'n': range(100)}), int(pd.DataFrame({'n': range(100)}).memory_usage(deep=True).sum())),
+    (pd.Series(['a', 'b']), int(pd.Series(['a', 'b']).memory_usage(deep=True))),
+])
+def test_artifact_nbytes(value, nbytes):
+    assert artifact_nbytes(value) == nbytes
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = DerivationCache(max_bytes=300)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, blob(100))
+
+    cache.get('a')
+    cache.put('d', blob(100))
+
+    assert [key for key in 'abcd' if cache.get(key) is not None] == ['a', 'c', 'd']
+
+
+def test_values_over_the_budget_or_their_own_cap_are_not_kept():
+    cache = DerivationCache(max_bytes=1000)
+
+    cache.put('too big', blob(1001))
+    cache.put('over cap', blob(500), max_value_bytes=400)
+    cache.put('a', blob(100))
+    cache.put('a', blob(2000))
+
+    assert cache.get('too big') is None
+    assert cache.get('over cap') is None
+    # A replacement too large to keep drops the stale value as well
+    assert cache.get('a') is None
+    assert cache.total_bytes() == 0
+
+
+def test_get_or_compute_computes_once():
+    cache = DerivationCache(max_bytes=1000)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return blob(10)
+
+    assert cache.get_or_compute('key', compute) == cache.get_or_compute('key', compute) == blob(10)
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('a, b, same', [
+    ({'x': ['1', '2'], 'y': 'text'}, {'y': 'text', 'x': ['1', '2']}, True),
+    ({}, {}, True),
+    ({'x': ['1', '2']}, {'x': ['1']}, False),
+    ({'x': ['1']}, {'x': '1'}, False),
+    ({'x': 'text'}, {'y': 'text'}, False),
+    ({2024: ['1']}, {'2024': ['1']}, True),
+])
+def test_filter_state_key(a, b, same):
+    key = filter_state_key(a)
+
+    hash(key)
+    assert (key == filter_state_key(b)) == same
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+from googleapiclient.errors import HttpError
+
+import services.fetch_engine as fetch_engine
+from services.fetch_engine import MAX_BACKOFF_SECONDS, FetchEngine, TokenBucket, backoff_delay
+from tests.fake_google import FakeGoogleBackend
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    """Retry at once, recording the delays the engine asked for"""
+    delays = []
+
+    def record(attempt, retry_after=None):
+        delays.append(backoff_delay(attempt, retry_after))
+        return 0
+    monkeypatch.setattr(fetch_engine, 'backoff_delay', record)
+    return delays
+
+
+def test_token_bucket_allows_a_burst_then_waits():
+    bucket = TokenBucket(rate=20, capacity=2)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    start = time.monotonic()
+    waited = bucket.acquire()
+    assert waited > 0
+    assert time.monotonic() - start >= 0.04
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate=100, capacity=1)
+    bucket.acquire()
+    time.sleep(0.02)
+    assert bucket.acquire() == 0
+
+
+def test_throttled_seconds_are_counted():
+    backend = FakeGoogleBackend()
+    folder_id = backend.add_folder('Reports')
+    engine = FetchEngine(max_workers=2, limiters={'drive': TokenBucket(rate=50, capacity=1)})
+    stats = {}
+    for _ in range(3):
+        engine.execute(backend.drive_service().files().get(fileId=folder_id), api='drive', stats=stats)
+    assert stats['api_calls'] == 3
+    assert stats['throttled_seconds'] > 0
+
+
+def test_backoff_delay_grows_and_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt) <= min(2 ** (attempt + 1), MAX_BACKOFF_SECONDS)
+
+
+def test_backoff_delay_honours_retry_after():
+    assert backoff_delay(0, '3') == 3
+    assert backoff_delay(0, '3600') == MAX_BACKOFF_SECONDS
+    assert 0 <= backoff_delay(0, 'Wed, 21 Oct 2015 07:28:00 GMT') <= 2
+
+
+def test_transient_errors_are_retried(no_backoff):
+    backend = FakeGoogleBackend()
+    folder_id = backend.add_folder('Reports')
+    backend.fail_next(2, status=503)
+    engine = FetchEngine(max_workers=2, max_retries=3)
+    stats = {}
+    file = engine.execute(backend.drive_service().files().get(fileId=folder_id), api='drive', stats=stats)
+    assert file['id'] == folder_id
+    assert stats == {'api_calls': 3, 'retries': 2}
+    assert len(no_backoff) == 2
+
+
+def test_rate_limit_errors_are_retried(no_backoff):
+    backend = FakeGoogleBackend()
+    folder_id = backend.add_folder('Reports')
+    backend.fail_next(1, status=429)
+    engine = FetchEngine(max_workers=2)
+    assert engine.execute(backend.drive_service().files().get(fileId=folder_id), api='drive')['id'] == folder_id
+    assert engine.stats['retries'] == 1
+
+
+def test_retries_give_up_after_max_retries(no_backoff):
+    backend = FakeGoogleBackend()
+    folder_id = backend.add_folder('Reports')
+    backend.fail_next(3, status=500)
+    engine = FetchEngine(max_workers=2, max_retries=2)
+    with pytest.raises(HttpError) as error:
+        engine.execute(backend.drive_service().files().get(fileId=folder_id), api='drive')
+    assert error.value.resp.status == 500
+    assert backend.calls['drive.files.get'] == 3
+
+
+def test_client_errors_are_not_retried(no_backoff):
+    backend = FakeGoogleBackend()
+    folder_id = backend.add_folder('Reports')
+    backend.fail_next(1, status=404)
+    engine = FetchEngine(max_workers=2)
+    with pytest.raises(HttpError):
+        engine.execute(backend.drive_service().files().get(fileId=folder_id), api='drive')
+    assert backend.calls['drive.files.get'] == 1
+    assert no_backoff == []
+
+
+def test_map_keeps_item_order_and_runs_nested_calls_inline():
+    engine = FetchEngine(max_workers=2)
+    assert engine.map(lambda i: engine.map(lambda j: i * 10 + j, range(3)), range(4)) == \
+        [[i * 10 + j for j in range(3)] for i in range(4)]
@@ -0,0 +1,72 @@
+import io
+import zipfile
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from utils.file_operations import (EXCEL_SHEET_NAME_MAX, create_download_excel, unique_name, write_csv, write_excel,
+                                   write_zip)
+
+LONG_NAME = 'Quarterly revenue by region and product line'
+
+
+@pytest.mark.parametrize('names, max_length, expected', [
+    (['Sheet', 'Other'], None, ['Sheet', 'Other']),
+    (['Sheet', 'Sheet', 'Sheet'], None, ['Sheet', 'Sheet (2)', 'Sheet (3)']),
+    # Names are compared case-insensitively, as Excel and most file systems do
+    (['Sheet', 'SHEET'], None, ['Sheet', 'SHEET (2)']),
+    (['a' * 31, 'a' * 31], 31, ['a' * 31, 'a' * 27 + ' (2)']),
+    (['Sheet (2)', 'Sheet', 'Sheet'], None, ['Sheet (2)', 'Sheet', 'Sheet (3)']),
+])
+def test_unique_name(names, max_length, expected):
+    used_names = set()
+
+    assert [unique_name(name, used_names, max_length) for name in names] == expected
+
+
+class UnseekableFile(io.RawIOBase):
+    """Write-only stream without seek or tell, like an HTTP response body"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+def test_write_excel_names_sheets_as_excel_allows():
+    df = pd.DataFrame({'name': ['a', None], 'count': [1, 2], 'day': pd.to_datetime(['2024-01-31', None])})
+    sheets = {LONG_NAME: df, LONG_NAME + ' 2': df, 'Q1/Q2: [draft]': df}
+    file = io.BytesIO()
+
+    write_excel(sheets, file)
+
+    workbook = openpyxl.load_workbook(io.BytesIO(file.getvalue()))
+    assert workbook.sheetnames == [LONG_NAME[:EXCEL_SHEET_NAME_MAX], LONG_NAME[:EXCEL_SHEET_NAME_MAX - 4] + ' (2)',
+                                   'Q1_Q2_ _draft_']
+    rows = list(workbook.worksheets[0].iter_rows(values_only=True))
+    assert rows == [('name', 'count', 'day'), ('a', 1, pd.Timestamp('2024-01-31').to_pydatetime()), (None, 2, None)]
+
+
+def test_create_download_excel_returns_the_workbook_bytes():
+    data = create_download_excel({'Sheet1': pd.DataFrame({'n': [1, 2]})}, 'Book')
+
+    assert openpyxl.load_workbook(io.BytesIO(data)).sheetnames == ['Sheet1']
+
+
+def test_write_zip_streams_one_entry_per_sheet():
+    sheets = [('Sales', pd.DataFrame({'n': [1, 2]})), ('sales', pd.DataFrame({'n': [3]})),
+              ('a/b', pd.DataFrame({'text': ['x,y']}))]
+    file = UnseekableFile()
+
+    write_zip(sheets, file, 'csv', write_csv)
+
+    with zipfile.ZipFile(io.BytesIO(bytes(file.data))) as archive:
+        assert archive.namelist() == ['Sales.csv', 'sales (2).csv', 'a_b.csv']
+        assert pd.read_csv(archive.open('sales (2).csv')).equals(pd.DataFrame({'n': [3]}))
+        assert archive.read('a_b.csv').decode('utf-8').splitlines() == ['text', '"x,y"']
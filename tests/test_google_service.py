@@ -0,0 +1,61 @@
+import pytest
+
+import services.google_service as google_service
+from config import BATCH_GET_MAX_RANGES
+from services.fetch_engine import FetchEngine
+from services.google_service import (batch_get_sheet_data, get_changes_start_token, list_changes, list_files,
+                                     list_folders)
+from tests.fake_google import FakeGoogleBackend
+
+
+@pytest.fixture
+def backend():
+    return FakeGoogleBackend()
+
+
+@pytest.fixture
+def engine():
+    return FetchEngine(max_workers=4)
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    monkeypatch.setattr(google_service, 'DRIVE_PAGE_SIZE', 2)
+
+
+def test_list_folders_follows_every_page(backend, engine, small_pages):
+    for name in ['Echo', 'Alpha', 'Delta', 'Charlie', 'Bravo']:
+        backend.add_folder(name)
+    folders = list_folders(backend.drive_service(), 'root', engine=engine)
+    assert [folder['name'] for folder in folders] == ['Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo']
+    assert backend.calls['drive.files.list'] == 3
+
+
+def test_list_files_returns_only_spreadsheets(backend, engine, small_pages):
+    folder_id = backend.add_folder('Reports')
+    for i in range(3):
+        backend.add_spreadsheet(f'Sheet {i}', folder_id, {'Tab': [['a'], ['1']]})
+    backend.add_folder('Archive', folder_id)
+    files = list_files(backend.drive_service(), folder_id, engine=engine)
+    assert [file['name'] for file in files] == ['Sheet 0', 'Sheet 1', 'Sheet 2']
+    assert backend.calls['drive.files.list'] == 2
+
+
+def test_list_changes_follows_every_page(backend, engine, small_pages):
+    drive_service = backend.drive_service()
+    start_token = get_changes_start_token(drive_service, engine=engine)
+    folder_id = backend.add_folder('Reports')
+    file_ids = [backend.add_spreadsheet(f'Sheet {i}', folder_id, {'Tab': [['a']]}) for i in range(4)]
+    changes, next_token = list_changes(drive_service, start_token, engine=engine)
+    assert [change['fileId'] for change in changes] == [folder_id] + file_ids
+    assert backend.calls['drive.changes.list'] == 3
+    assert list_changes(drive_service, next_token, engine=engine)[0] == []
+
+
+def test_batch_get_chunks_ranges_and_keeps_sheets_apart(backend, engine):
+    folder_id = backend.add_folder('Reports')
+    sheets = {f'Tab {i}': [['n'], [str(i)]] for i in range(BATCH_GET_MAX_RANGES + 5)}
+    file_id = backend.add_spreadsheet('Wide', folder_id, sheets)
+    values_by_sheet, stats = batch_get_sheet_data(backend.sheets_service(), file_id, list(sheets), engine=engine)
+    assert values_by_sheet == sheets
+    assert stats['api_calls'] == backend.calls['sheets.values.batchGet'] == 2
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.column_index import SheetIndex
+from utils.data_processing import values_to_dataframe
+
+duckdb = pytest.importorskip('duckdb')
+
+from utils.query_engine import QueryEngine  # noqa: E402
+
+SHEET = [
+    ['name', 'count', 'price', 'when', 'kind', 'notes'],
+    ['Alpha', '1', '1.5', '2024-01-31 10:00:00', 'red', 'True'],
+    ['beta', '22', '0.25', '2024-02-01 00:00:00', 'red', '٣'],
+    ['Gamma ray', '', '100', '2024-02-01 09:30:15', 'blue', 'x1'],
+    ['delta', '4', '1e-07', '', 'red', 'A.B'],
+    ['ÉCLAIR', '5', '', '2023-12-31 23:59:59', 'green', 'a+b'],
+]
+
+
+@pytest.fixture(scope='module')
+def query_engine():
+    return QueryEngine(threads=1)
+
+
+@pytest.fixture(scope='module')
+def sheet():
+    df = values_to_dataframe(SHEET)
+    # A mixed-type column, as parsed Excel tabs have, and a date-time with fractional seconds
+    df['mixed'] = pd.Series(['text', 7, 2.5, None, pd.Timestamp('2024-01-31')], dtype=object)
+    df['precise'] = pd.to_datetime(['2024-03-01 12:00:00.5', '2024-03-01 00:00:00', None, None, None],
+                                   format='ISO8601')
+    return df
+
+
+@pytest.mark.parametrize('term', [
+    'alpha', 'A', 'ray', 'éclair', '22', '1.5', '0.25', '1e-07', '100.0', 'true',
+    '2024-01-31', '2024-02-01 00:00:00', '00:00', '09:30:15', '12:00:00', '.5', 'a.b', 'a+b',
+    '00.5', '00.000', r'^\d+$', r'^(alpha|beta)$', r'\bray', '[0-9]{4}-02', r'^2\.5$', r'\.', 'a.b|^x',
+])
+def test_engines_search_the_same_rows(query_engine, sheet, term):
+    index_rows = np.flatnonzero(SheetIndex(sheet).search_mask(term))
+
+    query_rows = query_engine.filter_positions(sheet, {}, term)
+
+    assert index_rows.tolist() == query_rows.tolist()
+
+
+@pytest.mark.parametrize('column, term, rows', [
+    ('when', '2024-02', [1, 2]),
+    ('when', r'^2024-02-01 00:00:00$', [1]),
+    # Date-times are matched without fractional seconds
+    ('precise', r'^2024-03-01 12:00:00$', [0]),
+    ('count', '2', [1]),
+    ('mixed', '2.5', [2]),
+    ('kind', '^r', [0, 1, 3]),
+    # RE2 classes are ASCII-only: \d does not match the Arabic-Indic digit
+    ('notes', r'^\d$', []),
+])
+def test_engines_filter_text_the_same_rows(query_engine, sheet, column, term, rows):
+    index_rows = np.flatnonzero(SheetIndex(sheet).filter_mask({column: term}))
+
+    query_rows = query_engine.filter_positions(sheet, {column: term})
+
+    assert index_rows.tolist() == query_rows.tolist() == rows
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+from services.fetch_engine import FetchEngine
+from tests.fake_google import FakeGoogleBackend
+from utils.single_flight import FlightCancelled, SingleFlight, raise_if_cancelled
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not met in time'
+        time.sleep(0.005)
+
+
+def call_concurrently(count, fn):
+    """Start fn() on count threads; returns the threads and the results, filled in as they finish"""
+    results = [None] * count
+
+    def run(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_flight():
+    flights = SingleFlight('Load')
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return 'workbook'
+
+    threads, results = call_concurrently(5, lambda: flights.do('file', load))
+    wait_for(lambda: flights.stats['coalesced'] == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(results, key=lambda result: result[1]) == [('workbook', False)] + [('workbook', True)] * 4
+    assert flights.stats['flights'] == 1
+    assert flights.in_flight() == []
+
+
+def test_different_keys_do_not_coalesce():
+    flights = SingleFlight('Load')
+    assert flights.do('a', lambda: 1) == (1, False)
+    assert flights.do('b', lambda: 2) == (2, False)
+    assert flights.do('a', lambda: 3) == (3, False)
+    assert flights.stats['flights'] == 3
+
+
+def test_errors_are_shared_with_every_caller():
+    flights = SingleFlight('Load')
+    release = threading.Event()
+
+    def load():
+        release.wait(5)
+        raise ValueError('broken workbook')
+
+    threads, results = call_concurrently(3, lambda: flights.do('file', load))
+    wait_for(lambda: flights.stats['coalesced'] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.stats['flights'] == 1
+
+
+def test_abandoned_flight_is_cancelled():
+    flights = SingleFlight('Load', timeout=0.05)
+    stopped = threading.Event()
+
+    def load():
+        try:
+            while True:
+                raise_if_cancelled()
+                time.sleep(0.005)
+        except FlightCancelled:
+            stopped.set()
+            raise
+
+    with pytest.raises(TimeoutError):
+        flights.do('file', load)
+    assert stopped.wait(5)
+    assert flights.stats['timeouts'] == flights.stats['cancelled'] == 1
+    assert flights.in_flight() == []
+    assert flights.do('file', lambda: 'fresh') == ('fresh', False)
+
+
+def test_flight_waited_on_by_another_caller_is_not_cancelled():
+    flights = SingleFlight('Load')
+    release = threading.Event()
+    threads, results = call_concurrently(1, lambda: flights.do('file', lambda: release.wait(5) and 'workbook'))
+    wait_for(lambda: flights.in_flight() == ['file'])
+    with pytest.raises(TimeoutError):
+        flights.do('file', lambda: 'unused', timeout=0.01)
+    release.set()
+    threads[0].join()
+    assert results == [('workbook', False)]
+    assert flights.stats['cancelled'] == 0
+
+
+def test_cancelled_flight_stops_making_api_calls():
+    backend = FakeGoogleBackend(latency=0.005)
+    folder_id = backend.add_folder('Reports')
+    engine = FetchEngine(max_workers=2)
+    flights = SingleFlight('Load', timeout=0.05)
+    stopped = threading.Event()
+
+    def load():
+        try:
+            while True:
+                engine.execute(backend.drive_service().files().get(fileId=folder_id), api='drive')
+        finally:
+            stopped.set()
+
+    with pytest.raises(TimeoutError):
+        flights.do('file', load)
+    assert stopped.wait(5)
+    calls = backend.calls['drive.files.get']
+    time.sleep(0.05)
+    assert backend.calls['drive.files.get'] == calls
@@ -0,0 +1,66 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from utils.workbook_cache import WorkbookCache, decode_labels, encode_labels
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = WorkbookCache(str(tmp_path), max_bytes=2 ** 30)
+    cache.store_manifest('file', 'rev', 'Book', ['Sheet1', 'Sheet2'])
+    return cache
+
+
+def round_trip(cache, df, metadata=None):
+    cache.store_tab('file', 'rev', 'Sheet1', df, metadata)
+    return cache.load_tab('file', 'rev', 'Sheet1')
+
+
+def test_parsed_tab_reads_back_with_its_dtypes(cache):
+    df = pd.DataFrame({
+        'name': pd.array(['a', 'b', None], dtype='string[pyarrow]'),
+        'count': pd.array([1, None, 3], dtype='Int64'),
+        'price': [1.5, 2.0, None],
+        'day': pd.to_datetime(['2024-01-01', '2024-01-02', None]),
+        'kind': pd.Categorical(['x', 'y', 'x']),
+    })
+
+    pd.testing.assert_frame_equal(round_trip(cache, df, {'fingerprint': {'rows': 3}}), df)
+    assert cache.load_tab_metadata('file', 'rev', 'Sheet1') == {'fingerprint': {'rows': 3}}
+    assert cache.has_tab('file', 'rev', 'Sheet1')
+    assert not cache.has_tab('file', 'rev', 'Sheet2')
+
+
+@pytest.mark.parametrize('labels', [
+    ['a', 'b'],
+    [2023, 2024],
+    ['name', 1.5],
+    [True, 'x'],
+    [pd.Timestamp('2024-01-01'), pd.Timestamp('2024-02-01 12:30')],
+])
+def test_column_labels_read_back_with_their_types(cache, labels):
+    df = pd.DataFrame([[1, 2]], columns=labels)
+
+    encoded = encode_labels(df.columns)
+    if encoded is not None:
+        assert decode_labels(encoded) == labels
+    assert list(round_trip(cache, df).columns) == labels
+
+
+def test_mixed_type_column_reads_back_cell_for_cell(cache):
+    values = ['text', 42, 2.5, True, None, float('nan'), pd.NaT, datetime.datetime(2024, 1, 2, 3, 4, 5),
+              datetime.date(2024, 1, 2), datetime.time(12, 30), pd.Timestamp('2024-01-01 00:00:00.000000001'),
+              datetime.timedelta(days=1, microseconds=3)]
+    df = pd.DataFrame({'mixed': values, 'text': ['t'] * len(values), 'n': range(len(values))})
+
+    loaded = round_trip(cache, df)
+    pd.testing.assert_frame_equal(loaded, df)
+    assert [type(value) for value in loaded['mixed']] == [type(value) for value in values]
+
+
+def test_tab_with_cells_of_unknown_type_is_not_cached(cache):
+    df = pd.DataFrame({'mixed': ['text', 1, datetime.timezone.utc]})
+
+    assert round_trip(cache, df) is None
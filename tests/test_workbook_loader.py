@@ -0,0 +1,116 @@
+import pytest
+
+import utils.workbook_loader as workbook_loader
+from services.fetch_engine import FetchEngine
+from tests.fake_google import FakeGoogleBackend
+from utils.column_index import get_sheet_index
+from utils.data_processing import values_to_dataframe
+from utils.workbook_loader import GOOGLE_SHEETS_MIME_TYPE, load_workbook, refresh_workbook
+
+DATA = [['id', 'name', 'amount']] + [[str(i), f'name {i % 7}', f'{i}.5'] for i in range(200)]
+OTHER = [['a', 'b'], ['x', '1'], ['y', '2']]
+EDITED = [['k'], ['1'], ['2']]
+
+
+@pytest.fixture(autouse=True)
+def workbook_state(tmp_path, monkeypatch):
+    """A disk cache and workbook store of the test's own, with tabs read through the values API"""
+    monkeypatch.setattr(workbook_loader, 'WORKBOOK_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(workbook_loader, 'SHEETS_INGESTION', 'values')
+    for getter in (workbook_loader.get_workbook_cache, workbook_loader.get_workbook_store,
+                   workbook_loader.get_workbook_flights):
+        getter.clear()
+    yield
+    for getter in (workbook_loader.get_workbook_cache, workbook_loader.get_workbook_store,
+                   workbook_loader.get_workbook_flights):
+        getter.clear()
+
+
+@pytest.fixture
+def backend():
+    return FakeGoogleBackend()
+
+
+@pytest.fixture
+def engine():
+    return FetchEngine(max_workers=4)
+
+
+def open_spreadsheet(backend, engine, sheets):
+    file_id = backend.add_spreadsheet('Book', backend.add_folder('Reports'), sheets)
+    lease, load_stats = load_workbook(backend.drive_service(), backend.sheets_service(), file_id,
+                                      GOOGLE_SHEETS_MIME_TYPE, engine=engine)
+    return file_id, lease, load_stats
+
+
+def refresh(backend, engine, lease):
+    return refresh_workbook(backend.drive_service(), backend.sheets_service(), lease, engine)
+
+
+def test_refresh_of_the_same_revision_keeps_the_workbook(backend, engine):
+    file_id, lease, _ = open_spreadsheet(backend, engine, {'Data': DATA})
+    lease.workbook['sheets_data']['Data']
+    calls = sum(backend.calls.values())
+
+    new_lease, refresh_stats = refresh(backend, engine, lease)
+
+    assert new_lease is lease
+    assert refresh_stats['source'] == 'unchanged'
+    # Only the revision is checked
+    assert sum(backend.calls.values()) == calls + 1
+
+
+def test_refresh_carries_over_unchanged_tabs(backend, engine):
+    file_id, lease, _ = open_spreadsheet(backend, engine, {'Data': DATA, 'Other': OTHER})
+    data = lease.workbook['sheets_data']['Data']
+    backend.update_spreadsheet(file_id, {'Other': OTHER + [['z', '3']]})
+
+    new_lease, refresh_stats = refresh(backend, engine, lease)
+
+    assert refresh_stats['tabs'] == {'Data': 'unchanged', 'Other': 'refetch'}
+    assert new_lease.workbook['sheets_data']['Data'] is data
+    assert new_lease.workbook['tab_revisions']['Data'] == lease.workbook['revision']
+    assert new_lease.workbook['sheets_data']['Other'].equals(values_to_dataframe(OTHER + [['z', '3']]))
+
+
+def test_refresh_fetches_only_appended_rows(backend, engine):
+    file_id, lease, _ = open_spreadsheet(backend, engine, {'Data': DATA})
+    data = lease.workbook['sheets_data']['Data']
+    get_sheet_index(data).search_mask('name 3')
+    appended = [[str(i), f'new {i}', f'{i}'] for i in range(200, 210)]
+    backend.update_spreadsheet(file_id, {'Data': DATA + appended})
+
+    new_lease, refresh_stats = refresh(backend, engine, lease)
+
+    assert refresh_stats['tabs'] == {'Data': '10 rows appended'}
+    new_data = new_lease.workbook['sheets_data']['Data']
+    assert new_data.equals(values_to_dataframe(DATA + appended))
+    # The search index was extended rather than rebuilt, and finds the new rows
+    assert get_sheet_index(new_data).search_mask('new 20').sum() == 10
+    assert refresh_stats['bytes'] < len(str(DATA))
+
+    # The next refresh compares against the appended rows as well
+    backend.update_spreadsheet(file_id, {'Data': DATA + appended + [['210', 'last', '1']]})
+    _, refresh_stats = refresh(backend, engine, new_lease)
+    assert refresh_stats['tabs'] == {'Data': '1 rows appended'}
+
+
+@pytest.mark.parametrize('sheets, tab', [
+    # An edit to one of the rows sampled into the fingerprint
+    ({'Data': DATA[:29] + [['28', 'edited', '28.5']] + DATA[30:]}, 'Data'),
+    # Rows that no longer fit the columns' dtypes are fetched in full
+    ({'Data': DATA + [['text', 'x', 'y']]}, 'Data'),
+    ({'Edited': [['k'], ['1'], ['3']]}, 'Edited'),
+])
+def test_refresh_reloads_edited_tabs(backend, engine, sheets, tab):
+    file_id, lease, _ = open_spreadsheet(backend, engine, {'Data': DATA, 'Edited': EDITED})
+    for sheet_name in ('Data', 'Edited'):
+        lease.workbook['sheets_data'][sheet_name]
+    backend.update_spreadsheet(file_id, sheets)
+
+    new_lease, refresh_stats = refresh(backend, engine, lease)
+
+    assert refresh_stats['tabs'][tab] == 'reloaded'
+    assert new_lease.workbook['sheets_data'][tab].equals(values_to_dataframe(sheets[tab]))
+    untouched, = {'Data', 'Edited'} - {tab}
+    assert refresh_stats['tabs'][untouched] == 'unchanged'
@@ -0,0 +1,35 @@
+import pandas as pd
+
+from utils.lazy_workbook import LazySheets
+from utils.workbook_store import WorkbookStore, workbook_nbytes
+
+
+def frame(rows):
+    return pd.DataFrame({'name': [f'row {i}' for i in range(rows)], 'value': range(rows)})
+
+
+def lazy_workbook(name, rows):
+    sheets_data = LazySheets(['Sheet1'], lambda sheet_name: (frame(rows), {}))
+    return {'file_name': name, 'sheets_data': sheets_data}
+
+
+def test_unreferenced_workbooks_are_evicted_least_recently_used_first():
+    eager = {'file_name': 'a', 'sheets_data': {'Sheet1': frame(100)}}
+    store = WorkbookStore(max_bytes=workbook_nbytes(eager) * 2)
+    for key in ('a', 'b', 'c'):
+        store.put(key, {'file_name': key, 'sheets_data': {'Sheet1': frame(100)}}).release()
+
+    assert list(store.workbooks()) == ['b', 'c']
+
+
+def test_budget_is_rechecked_when_a_lazy_sheet_loads():
+    store = WorkbookStore(max_bytes=workbook_nbytes({'sheets_data': {'Sheet1': frame(1000)}}) * 3 // 2)
+    store.put('a', lazy_workbook('a', 1000)).release()
+    lease = store.put('b', lazy_workbook('b', 1000))
+    store.workbooks()['a']['sheets_data']['Sheet1']
+    assert list(store.workbooks()) == ['a', 'b']
+
+    # Loading b's sheet takes the store over budget: the unreferenced a goes, the leased b stays
+    lease.workbook['sheets_data']['Sheet1']
+    assert list(store.workbooks()) == ['b']
+    assert store.total_bytes() <= store.max_bytes
@@ -0,0 +1,231 @@
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Columns with fewer distinct values are searched by scanning them; above this a trigram index pays off
+TRIGRAM_MIN_VALUES = 2000
+
+# Search terms with these are RE2 regular expressions, as in DuckDB; terms without them are plain substrings
+REGEX_CHARACTERS = set('.^$*+?{}[]\\|()')
+
+# Date-times are searched as this text, by the column index and the query engine alike
+TIMESTAMP_TEXT_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class ColumnIndex:
+    """
+    Index over one column: factorised codes per row plus the lower-cased text of each distinct value
+    Value filters and substring searches are answered against the distinct values only and mapped
+    back to rows through the codes. A trigram inverted index over the distinct values is built on
+    the first search of a high-cardinality column. Blank cells never match.
+    """
+
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series)
+        self.codes = codes.astype(np.int32 if len(uniques) < 2 ** 31 else np.int64)
+        self.uniques = pd.Index(uniques)
+        self.text = search_text(uniques)
+        self._trigrams = None
+        self._lock = threading.Lock()
+
+    def rows(self, value_ids):
+        """Boolean row mask for the rows holding any of the given distinct value ids"""
+        # The extra slot stays False and is what blank cells (code -1) look up
+        hits = np.zeros(len(self.uniques) + 1, dtype=bool)
+        hits[value_ids] = True
+        return hits[self.codes]
+
+    def isin(self, values):
+        value_ids = self.uniques.get_indexer(pd.Index(list(values)).unique())
+        return self.rows(value_ids[value_ids >= 0])
+
+    def contains(self, term):
+        """Case-insensitive match of the text of each cell: substring, or RE2 regex if it has metacharacters"""
+        if REGEX_CHARACTERS.intersection(term):
+            matches = pc.match_substring_regex(pa.array(self.text, type=pa.string()), term, ignore_case=True)
+            return self.rows(np.flatnonzero(matches.to_numpy(zero_copy_only=False)))
+
+        term = term.lower()
+        if len(term) < 3 or len(self.uniques) < TRIGRAM_MIN_VALUES:
+            return self.rows(np.flatnonzero(self.text.str.contains(term, regex=False).to_numpy()))
+
+        trigrams = self.trigrams()
+        postings = sorted((trigrams.get(term[i:i + 3]) for i in range(len(term) - 2)),
+                          key=lambda ids: -1 if ids is None else len(ids))
+        if postings[0] is None:
+            return self.rows([])
+        candidates = postings[0]
+        for ids in postings[1:]:
+            candidates = np.intersect1d(candidates, ids, assume_unique=True)
+        # Every trigram present does not yet mean the term is, so candidates are verified
+        text = self.text.to_numpy()
+        return self.rows([value_id for value_id in candidates if term in text[value_id]])
+
+    def trigrams(self):
+        """Trigram -> sorted array of distinct value ids containing it, built on first use"""
+        with self._lock:
+            if self._trigrams is None:
+                self._trigrams = trigram_postings(self.text.to_numpy())
+            return self._trigrams
+
+    def extended(self, series):
+        """
+        Index over this column with the rows of series appended
+        Only the appended rows are factorised: known values keep their ids, and a trigram index
+        that was already built is extended with the new distinct values rather than rebuilt
+        """
+        series = series.reset_index(drop=True)
+        codes = self.uniques.get_indexer(series)
+        unseen = (codes < 0) & series.notna().to_numpy()
+        new_codes, new_uniques = pd.factorize(series[unseen])
+        codes[unseen] = new_codes + len(self.uniques)
+
+        index = ColumnIndex.__new__(ColumnIndex)
+        index.codes = np.concatenate([self.codes, codes.astype(self.codes.dtype)])
+        index.uniques = self.uniques.append(pd.Index(new_uniques))
+        new_text = search_text(new_uniques)
+        index.text = pd.concat([self.text, new_text], ignore_index=True)
+        index._lock = threading.Lock()
+        index._trigrams = None
+        with self._lock:
+            trigrams = self._trigrams
+        if trigrams is not None:
+            # New ids are larger than all existing ones, so appending keeps the postings sorted
+            index._trigrams = dict(trigrams)
+            for gram, ids in trigram_postings(new_text.to_numpy(), len(self.uniques)).items():
+                index._trigrams[gram] = np.concatenate([trigrams[gram], ids]) if gram in trigrams else ids
+        return index
+
+
+def search_text(uniques):
+    """
+    Lower-cased text searched for each distinct value: as astype(str), except that date-times are
+    written with TIMESTAMP_TEXT_FORMAT whatever their precision, as the query engine writes them
+    """
+    if pd.Index(uniques).dtype.kind == 'M':
+        return pd.Series(pd.Index(uniques).strftime(TIMESTAMP_TEXT_FORMAT)).str.lower()
+    return pd.Series(uniques).astype(str).str.lower()
+
+
+def trigram_postings(texts, first_id=0):
+    """Trigram -> sorted array of the ids (first_id onwards, in order) of the texts containing it"""
+    postings = {}
+    for value_id, text in enumerate(texts, start=first_id):
+        for gram in {text[i:i + 3] for i in range(len(text) - 2)}:
+            postings.setdefault(gram, []).append(value_id)
+    return {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+
+class SheetIndex:
+    """Column indexes for one loaded tab, each built the first time its column is filtered or searched"""
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self._df = weakref.ref(df)
+        self._columns = {}
+        self._warming = None
+        self._lock = threading.Lock()
+
+    def column(self, position):
+        with self._lock:
+            if position not in self._columns:
+                self._columns[position] = ColumnIndex(self._df().iloc[:, position])
+            return self._columns[position]
+
+    def _positions(self, col):
+        positions = self._df().columns.get_loc(col)
+        if isinstance(positions, slice):
+            return list(range(len(self._df().columns)))[positions]
+        if isinstance(positions, np.ndarray):
+            return list(np.flatnonzero(positions))
+        return [positions]
+
+    def filter_mask(self, filter_settings):
+        """Rows passing every filter: a list of values to keep or a text to look for, per column"""
+        mask = np.ones(self.n_rows, dtype=bool)
+        for col, values in filter_settings.items():
+            column_mask = np.zeros(self.n_rows, dtype=bool)
+            for position in self._positions(col):
+                index = self.column(position)
+                column_mask |= index.isin(values) if isinstance(values, list) else index.contains(values)
+            mask &= column_mask
+        return mask
+
+    def search_mask(self, search_term):
+        """Rows where any column contains the search term"""
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for position in range(len(self._df().columns)):
+            mask |= self.column(position).contains(search_term)
+        return mask
+
+    def extended(self, df):
+        """
+        Index for df, which is this index's DataFrame with rows appended
+        Column indexes built so far are extended, unless the column's dtype changed
+        """
+        index = SheetIndex(df)
+        old_df = self._df()
+        with self._lock:
+            columns = dict(self._columns)
+        for position, column_index in columns.items():
+            if old_df is not None and old_df.dtypes.iloc[position] == df.dtypes.iloc[position]:
+                index._columns[position] = column_index.extended(df.iloc[self.n_rows:, position])
+        return index
+
+    def warm(self):
+        """
+        Build every column index up front, for the filters
+        Trigram indexes are left to the first search of each column: they hold a Python list entry
+        per trigram of every distinct value, far more memory than the codes
+        """
+        for position in range(len(self._df().columns)):
+            self.column(position)
+
+    def warm_in_background(self, submit):
+        """
+        Warm the index through submit(fn), e.g. an executor's submit, once per index
+        Later calls, one per rerun of the app, return the first call's future
+        """
+        with self._lock:
+            if self._warming is None:
+                self._warming = submit(self.warm)
+            return self._warming
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_sheet_index(df):
+    """
+    Index for a DataFrame, built once and kept for as long as the DataFrame is alive
+    Loaded tabs are shared read-only between sessions, so every session reuses the same index
+    """
+    key = id(df)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = SheetIndex(df)
+            weakref.finalize(df, _indexes.pop, key, None)
+        return index
+
+
+def extend_sheet_index(df, appended_df):
+    """
+    Carry the index of df over to appended_df, a copy of df with rows appended, extending it in
+    place of a rebuild; does nothing when df has not been indexed
+    """
+    with _indexes_lock:
+        index = _indexes.get(id(df))
+    if index is None:
+        return
+    extended = index.extended(appended_df)
+    key = id(appended_df)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = extended
+            weakref.finalize(appended_df, _indexes.pop, key, None)
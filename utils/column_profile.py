@@ -0,0 +1,446 @@
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# Rows profiled per chunk; the profile of a tab is built in one pass over its chunks
+PROFILE_CHUNK_ROWS = 100000
+
+# HyperLogLog registers are 2 ** HLL_PRECISION bytes per column and chunk; the distinct count error is
+# about 1.6% at 12
+HLL_PRECISION = 12
+
+# t-digest centroids are kept to about this many; quantile ranks are within about 1 / TDIGEST_COMPRESSION
+TDIGEST_COMPRESSION = 200
+
+# Quantiles are exact, interpolated as describe() does, until a digest holds more values than this
+TDIGEST_EXACT_VALUES = 1000
+
+# Values tracked per column by the frequent values summary; every value is counted exactly while a
+# column has at most this many distinct values
+FREQUENT_VALUES_CAPACITY = 64
+
+# Rows of the summary statistics, as describe() names them, followed by the sketches' own
+STATISTICS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max', 'distinct', 'null %']
+
+
+class HyperLogLog:
+    """Approximate distinct count of hashed values in fixed memory; merged by taking register maxima"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        """Add 64-bit hashes of values, as from pd.util.hash_pandas_object"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        suffix_bits = 64 - self.precision
+        buckets = (hashes >> np.uint64(suffix_bits)).astype(np.intp)
+        suffixes = hashes & np.uint64((1 << suffix_bits) - 1)
+        ranks = suffix_bits - bit_length(suffixes) + 1
+        np.maximum.at(self.registers, buckets, ranks.astype(np.uint8))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small counts
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def copy(self):
+        sketch = HyperLogLog(self.precision)
+        sketch.registers = self.registers.copy()
+        return sketch
+
+
+def bit_length(values):
+    """int.bit_length of each uint64, computed on 32-bit halves that float64 holds exactly"""
+    high = np.frexp((values >> np.uint64(32)).astype(np.float64))[1]
+    low = np.frexp((values & np.uint64(0xFFFFFFFF)).astype(np.float64))[1]
+    return np.where(high > 0, high + 32, low)
+
+
+class TDigest:
+    """
+    Approximate quantiles from weighted centroids that are finer towards both tails
+    Values are added a batch at a time: centroids and new values are sorted together and merged
+    into one centroid per unit of the arcsine scale function, so adding and merging are vectorised.
+    Up to exact_values values are kept as they are, and their quantiles are exact.
+    """
+
+    def __init__(self, compression=TDIGEST_COMPRESSION, exact_values=TDIGEST_EXACT_VALUES):
+        self.compression = compression
+        self.exact_values = exact_values
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        # Whether means still holds every value, each with weight 1
+        self.exact = True
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values):
+            self.minimum = min(self.minimum, values.min())
+            self.maximum = max(self.maximum, values.max())
+            self._add(values, np.ones(len(values)), True)
+
+    def merge(self, other):
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._add(other.means, other.weights, other.exact)
+
+    def _add(self, means, weights, exact):
+        if self.exact and exact and len(self.means) + len(means) <= self.exact_values:
+            self.means = np.concatenate([self.means, means])
+            self.weights = np.concatenate([self.weights, weights])
+        else:
+            self.exact = False
+            self._compress(means, weights)
+
+    def _compress(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        left_quantiles = (cumulative - weights) / cumulative[-1]
+        scale = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * left_quantiles - 1))
+        starts = np.flatnonzero(np.r_[True, scale[1:] != scale[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q):
+        """q-quantile, interpolated between centroid centres and the exact extremes once compressed"""
+        if not len(self.weights):
+            return np.nan
+        if self.exact:
+            return float(np.quantile(self.means, q))
+        total = self.weights.sum()
+        centres = np.cumsum(self.weights) - self.weights / 2
+        return float(np.interp(q * total, np.r_[0, centres, total], np.r_[self.minimum, self.means, self.maximum]))
+
+    def copy(self):
+        digest = TDigest(self.compression, self.exact_values)
+        digest.means, digest.weights = self.means.copy(), self.weights.copy()
+        digest.minimum, digest.maximum, digest.exact = self.minimum, self.maximum, self.exact
+        return digest
+
+
+class FrequentValues:
+    """
+    Misra-Gries summary of a column's most frequent values, mergeable across partitions
+    Counts are exact, and every distinct value is present, for as long as exact is True; once more
+    than capacity values were seen, counts are lower bounds and only frequent values remain.
+    """
+
+    def __init__(self, capacity=FREQUENT_VALUES_CAPACITY):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64')
+        self.exact = True
+
+    def add(self, values):
+        self._merge(values.value_counts(sort=False))
+
+    def merge(self, other):
+        self.exact = self.exact and other.exact
+        self._merge(other.counts)
+
+    def _merge(self, counts):
+        counts = counts[counts > 0]
+        if len(self.counts):
+            counts = pd.concat([self.counts, counts.set_axis(counts.index.astype(object))])
+            counts = counts.groupby(level=0, sort=False).sum()
+        if len(counts) > self.capacity:
+            threshold = counts.nlargest(self.capacity + 1).iloc[-1]
+            counts = counts[counts > threshold] - threshold
+            self.exact = False
+        self.counts = counts.set_axis(counts.index.astype(object))
+
+    def top(self, count):
+        """The count most frequent values with their (lower bound) counts"""
+        return self.counts.nlargest(count)
+
+    def copy(self):
+        summary = FrequentValues(self.capacity)
+        summary.counts, summary.exact = self.counts.copy(), self.exact
+        return summary
+
+
+class ColumnProfile:
+    """
+    Mergeable one-pass profile of a column: rows and blanks, a distinct count, frequent values, and
+    for numeric columns exact count, mean, variance, min and max with quantiles, approximate beyond
+    TDIGEST_EXACT_VALUES values
+    Text columns are numeric when every value converts to a number, as in pd.to_numeric.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.nulls = 0
+        self.distinct = HyperLogLog()
+        self.frequent = FrequentValues()
+        # None until a value is seen, then whether every value so far was a number
+        self.numeric = None
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.digest = TDigest()
+
+    def update(self, series):
+        """Add a chunk of the column's rows"""
+        values = series.dropna()
+        self.rows += len(series)
+        self.nulls += len(series) - len(values)
+        if not len(values):
+            return
+        self.distinct.add_hashes(pd.util.hash_pandas_object(values, index=False).to_numpy())
+        self.frequent.add(values)
+        if self.numeric is not False:
+            numbers = numeric_values(values)
+            self.numeric = numbers is not None
+            if numbers is not None:
+                self._add_moments(len(numbers), numbers.mean(), ((numbers - numbers.mean()) ** 2).sum())
+                self.digest.add(numbers)
+
+    def merge(self, other):
+        """Add the profile of other rows of the same column, e.g. another chunk or partition"""
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.distinct.merge(other.distinct)
+        self.frequent.merge(other.frequent)
+        if other.numeric is False or self.numeric is False:
+            self.numeric = False
+        elif other.numeric:
+            self.numeric = True
+            self._add_moments(other.count, other.mean, other.m2)
+            self.digest.merge(other.digest)
+
+    def _add_moments(self, count, mean, m2):
+        # Chan et al.'s pairwise update keeps the variance accurate across chunks
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def statistics(self):
+        """Values of the STATISTICS rows; numeric ones are NaN for non-numeric columns"""
+        numeric = bool(self.numeric)
+        return [
+            self.count if numeric else np.nan,
+            self.mean if numeric else np.nan,
+            np.sqrt(self.m2 / (self.count - 1)) if numeric and self.count > 1 else np.nan,
+            self.digest.minimum if numeric else np.nan,
+            *([self.digest.quantile(q) for q in (0.25, 0.5, 0.75)] if numeric else [np.nan] * 3),
+            self.digest.maximum if numeric else np.nan,
+            self.distinct_count(),
+            100 * self.nulls / self.rows if self.rows else np.nan,
+        ]
+
+    def distinct_count(self):
+        """Exact while the frequent values summary holds every value, estimated beyond"""
+        return len(self.frequent.counts) if self.frequent.exact else self.distinct.count()
+
+    def copy(self):
+        profile = ColumnProfile.__new__(ColumnProfile)
+        profile.__dict__.update(self.__dict__)
+        profile.distinct, profile.frequent, profile.digest = \
+            self.distinct.copy(), self.frequent.copy(), self.digest.copy()
+        return profile
+
+
+def numeric_values(values):
+    """Non-blank values as a float64 array, or None when they are not all numbers"""
+    if values.dtype.kind in 'iuf':
+        return values.to_numpy(dtype=np.float64)
+    if values.dtype != object:
+        return None
+    try:
+        numbers = pd.to_numeric(values)
+    except (ValueError, TypeError):
+        return None
+    return numbers.to_numpy(dtype=np.float64) if numbers.dtype.kind in 'iuf' else None
+
+
+def profile_rows(df):
+    """Profiles of every column of df, by position"""
+    profiles = [ColumnProfile() for _ in range(df.shape[1])]
+    for position, profile in enumerate(profiles):
+        profile.update(df.iloc[:, position])
+    return profiles
+
+
+def profile_chunks(df, first_row=0, chunk_rows=PROFILE_CHUNK_ROWS):
+    """(start, stop, column profiles) of each chunk of df's rows, positions counted from first_row"""
+    return [(first_row + start, first_row + min(start + chunk_rows, len(df)),
+             profile_rows(df.iloc[start:start + chunk_rows]))
+            for start in range(0, len(df), chunk_rows)]
+
+
+def merge_profiles(profile_lists, width):
+    """Column profiles, by position, merged from several lists of column profiles of other rows"""
+    merged = [ColumnProfile() for _ in range(width)]
+    for profiles in profile_lists:
+        for profile, other in zip(merged, profiles):
+            profile.merge(other)
+    return merged
+
+
+class SheetProfile:
+    """
+    Column profiles of one loaded tab or filtered view, built in one streaming pass on first use
+    The profiles of each chunk of rows are kept and merged into those of the whole tab, so that
+    filtered views and appended rows reuse them.
+    """
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self._df = weakref.ref(df)
+        self._chunks = None
+        self._columns = None
+        self._building = None
+        self._lock = threading.Lock()
+
+    def _build(self):
+        # Called with the lock held
+        if self._columns is None:
+            df = self._df()
+            self._chunks = profile_chunks(df)
+            self._columns = merge_profiles([profiles for _, _, profiles in self._chunks], df.shape[1])
+
+    def columns(self):
+        """Profile of every column, by position"""
+        with self._lock:
+            self._build()
+            return self._columns
+
+    def chunks(self):
+        """(start, stop, column profiles) of each chunk of rows"""
+        with self._lock:
+            self._build()
+            return self._chunks
+
+    def column(self, col):
+        """Profile of a column by name"""
+        return self.columns()[self._df().columns.get_loc(col)]
+
+    def build(self):
+        """Profile every column now, e.g. in the background once a tab has loaded"""
+        self.columns()
+
+    def build_in_background(self, submit):
+        """
+        Profile every column through submit(fn), e.g. an executor's submit, once per DataFrame
+        Nothing is submitted once the columns are profiled; later calls return the first call's future
+        """
+        with self._lock:
+            if self._building is None and self._columns is None:
+                self._building = submit(self.build)
+            return self._building
+
+    def unique_values(self, col, max_values):
+        """A column's distinct values, or None when it has more than max_values"""
+        frequent = self.column(col).frequent
+        if not frequent.exact or len(frequent.counts) > max_values:
+            return None
+        return list(frequent.counts.index)
+
+    def describe(self, columns):
+        """
+        STATISTICS of the numeric columns, and of selected text columns that hold numbers, like
+        describe() plus distinct counts and the share of blank cells; quartiles and distinct counts
+        are approximate on large tabs. None when there are no such columns
+        """
+        df = self._df()
+        stats = {}
+        for position, profile in enumerate(self.columns()):
+            col = df.columns[position]
+            if profile.numeric and (df.dtypes.iloc[position].kind in 'iuf' or col in columns):
+                stats[col] = profile.statistics()
+        if not stats:
+            return None
+        return pd.DataFrame(stats, index=STATISTICS, dtype=float)
+
+    def subset(self, view):
+        """
+        Profile for view, a selection of this profile's rows such as a filtered view, which keeps
+        the tab's row positions as its index
+        The profiles of chunks whose rows are all selected are reused, the selected rows of other
+        chunks are profiled, and all are merged. A tab without a default RangeIndex, whose row
+        labels are not positions, has its view profiled in full.
+        """
+        profile = SheetProfile(view)
+        df = self._df()
+        index = df.index
+        if not isinstance(index, pd.RangeIndex) or index.start != 0 or index.step != 1:
+            return profile
+        positions = np.sort(view.index.to_numpy())
+        profile_lists = []
+        for start, stop, profiles in self.chunks():
+            first, last = np.searchsorted(positions, [start, stop])
+            if last - first == stop - start:
+                profile_lists.append(profiles)
+            elif last > first:
+                profile_lists.append(profile_rows(df.iloc[positions[first:last]]))
+        profile._columns = merge_profiles(profile_lists, df.shape[1])
+        return profile
+
+    def extended(self, df):
+        """
+        Profile for df, which is this profile's DataFrame with rows appended
+        Only the appended rows are profiled, as chunks of their own, and merged in, unless dtypes
+        changed or nothing was profiled yet
+        """
+        profile = SheetProfile(df)
+        old_df = self._df()
+        with self._lock:
+            chunks, columns = self._chunks, self._columns
+        if columns is None or old_df is None or not old_df.dtypes.equals(df.dtypes):
+            return profile
+        appended = profile_chunks(df.iloc[self.n_rows:], self.n_rows)
+        profile._chunks = chunks + appended
+        profile._columns = merge_profiles([columns] + [profiles for _, _, profiles in appended], df.shape[1])
+        return profile
+
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def get_sheet_profile(df):
+    """
+    Profile for a DataFrame, built once and kept for as long as the DataFrame is alive
+    Loaded tabs and cached filtered views are shared read-only between sessions, so every session
+    reuses the same profile
+    """
+    key = id(df)
+    with _profiles_lock:
+        profile = _profiles.get(key)
+        if profile is None:
+            profile = _profiles[key] = SheetProfile(df)
+            weakref.finalize(df, _profiles.pop, key, None)
+        return profile
+
+
+def extend_sheet_profile(df, appended_df):
+    """
+    Carry the profile of df over to appended_df, a copy of df with rows appended, profiling only
+    the new rows; does nothing when df has not been profiled
+    """
+    with _profiles_lock:
+        profile = _profiles.get(id(df))
+    if profile is None:
+        return
+    extended = profile.extended(appended_df)
+    key = id(appended_df)
+    with _profiles_lock:
+        if key not in _profiles:
+            _profiles[key] = extended
+            weakref.finalize(appended_df, _profiles.pop, key, None)
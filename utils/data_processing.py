@@ -1,81 +1,228 @@
+import logging
+
+import numpy as np
 import pandas as pd
-from services.google_service import get_sheet_data
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas.api.types import union_categoricals
+from utils.column_index import get_sheet_index
+from utils.column_profile import get_sheet_profile
+from utils.query_engine import get_query_engine
+from utils.tracing import span, tracing_enabled
+
+logger = logging.getLogger(__name__)
+
+# Non-blank cells per column looked at to pick its type
+TYPE_SAMPLE_ROWS = 1000
+
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+# Plain numbers as formatted by Sheets, optionally with thousands separators; no leading zeros,
+# so codes such as '007' stay text
+NUMBER_PATTERN = r'-?(?:0|[1-9]\d{0,2}(?:,\d{3})+|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?|-?0?\.\d+'
+
+# Date formats Sheets displays by default across locales, tried in order on a column sample
+DATE_FORMATS = [
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M',
+    '%m/%d/%Y', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M',
+    '%d/%m/%Y', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M',
+    '%d.%m.%Y', '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M',
+]
 
 
 def values_to_dataframe(values):
-    """Convert sheet values to DataFrame"""
+    """
+    Convert sheet values to DataFrame, with the first row as header and typed columns
+    Each column is converted once with infer_column
+    """
     if not values:
         return pd.DataFrame()
 
-    # Convert to DataFrame
-    df = pd.DataFrame(values)
-    # Set first row as header
-    df.columns = df.iloc[0]
+    header = values[0]
+    columns = value_columns(values[1:], len(header))
+    header = column_names(header, len(columns))
+
+    with span('parse.values_to_dataframe', rows=len(values) - 1, columns=len(columns)) as s:
+        df = pd.DataFrame({i: infer_column(column) for i, column in enumerate(columns)})
+        df.columns = header
+        if tracing_enabled():
+            s.set(bytes=int(df.memory_usage(index=True, deep=True).sum()))
+    return df
+
+
+def column_names(header, width=0):
+    """Column names from a header row, padded to width; blank and repeated names become Column_<n>"""
+    header = list(header) + [None] * (width - len(header))
 
     # Handle empty or duplicate column names
-    if None in df.columns or df.columns.duplicated().any():
+    if None in header or len(set(header)) < len(header):
         # Replace None with named columns
         new_cols = []
-        for i, col in enumerate(df.columns):
+        for i, col in enumerate(header):
             if col is None or col in new_cols:
                 new_cols.append(f'Column_{i + 1}')
             else:
                 new_cols.append(col)
-        df.columns = new_cols
-
-    df = df.iloc[1:].reset_index(drop=True)
-    return df
-
-
-def get_all_sheets_data(sheets_service, spreadsheet_id, sheet_names):
-    """Read all sheets from a Google Spreadsheet"""
-    print(f'Getting data from {sheet_names}')
-    sheets_data = {}
-    for sheet_name in sheet_names:
-        values = get_sheet_data(sheets_service, spreadsheet_id, sheet_name)
-        df = values_to_dataframe(values)
-        sheets_data[sheet_name] = df
-
-    return sheets_data
-
-
-def apply_filters(df, filter_settings):
-    """Apply filters to a dataframe"""
-    filtered_df = df.copy()
-    for col, values in filter_settings.items():
-        if isinstance(values, list):
-            filtered_df = filtered_df[filtered_df[col].isin(values)]
-        else:
-            # Text filter - case insensitive contains
-            filtered_df = filtered_df[
-                filtered_df[col].astype(str).str.contains(values, case=False, na=False)]
-    return filtered_df
-
-
-def apply_search(df, search_term):
-    """Apply search across all columns in a dataframe"""
-    if not search_term:
+        header = new_cols
+    return header
+
+
+def value_columns(rows, min_width=0):
+    """Ragged rows as one object array per column, padded with None to the widest row"""
+    # pandas pads the ragged rows into one column-major object grid
+    grid = pd.DataFrame(rows, dtype=object)
+    width = max(min_width, grid.shape[1])
+    return [grid[i].to_numpy() if i in grid else np.full(len(grid), None, dtype=object) for i in range(width)]
+
+
+def append_rows(df, rows):
+    """
+    Append raw Sheets API rows to a DataFrame built by values_to_dataframe, keeping its dtypes
+    Returns None when the rows do not fit the existing columns, e.g. text in a number column or
+    a row wider than the sheet, in which case the sheet has to be rebuilt from all its values
+    """
+    columns = value_columns(rows, df.shape[1])
+    if len(columns) > df.shape[1]:
+        return None
+    combined = {}
+    for i, values in enumerate(columns):
+        column = df.iloc[:, i]
+        appended = _append_column(column, values)
+        if appended is None:
+            return None
+        combined[i] = appended
+    result = pd.DataFrame(combined)
+    result.columns = df.columns
+    return result
+
+
+def _append_column(column, values):
+    """column with the cell strings in values appended, in column's dtype, or None"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return pd.Series(union_categoricals([column.array, pd.Categorical(values)]))
+    if column.dtype == 'string':
+        return pd.concat([column, pd.Series(pd.array(values, dtype=column.dtype))], ignore_index=True)
+    if column.dtype.kind not in 'iufM':
+        return pd.concat([column, pd.Series(values, dtype=object)], ignore_index=True)
+
+    if all(value is None or value == '' for value in values):
+        # Only blank cells: missing values of the column's own kind
+        new = pd.Series(pd.NaT if column.dtype.kind == 'M' else pd.NA, index=range(len(values)),
+                        dtype=column.dtype if column.dtype.kind == 'M' else
+                        ('Float64' if column.dtype.kind == 'f' else 'Int64'))
+    else:
+        new = pd.Series(infer_column(values))
+        if (new.dtype.kind == 'M') != (column.dtype.kind == 'M') or new.dtype.kind not in 'iufM':
+            return None
+    appended = pd.concat([column.reset_index(drop=True), new], ignore_index=True)
+    return appended if appended.dtype.kind in 'iufM' else None
+
+
+def infer_column(values):
+    """
+    Convert one column of Sheets API cell strings to a compact dtype
+    A sample of the non-blank cells picks the candidate type, which is then checked against the
+    whole column with Arrow compute kernels: numbers become int64/float64 (Int64/Float64 when there
+    are blank cells), dates datetime64, repetitive text categorical and other text Arrow strings.
+    Blank cells become missing values in numeric and date columns.
+    """
+    column = pa.array(values, type=pa.string(), from_pandas=True)
+    blank = pc.fill_null(pc.equal(column, ''), True)
+    cells = column.filter(pc.invert(blank))
+    sample = cells.slice(0, TYPE_SAMPLE_ROWS)
+    blank = blank.to_numpy(zero_copy_only=False)
+
+    if len(sample) and _all_match(sample, NUMBER_PATTERN):
+        numbers = _parse_numbers(cells)
+        if numbers is not None:
+            return _with_blanks(numbers, blank)
+    date_format = _date_format(sample)
+    if date_format is not None:
+        dates = pc.strptime(cells, format=date_format, unit='ns', error_is_null=True)
+        if dates.null_count == 0:
+            return _with_blanks(dates.to_numpy(), blank)
+
+    if len(pc.unique(column)) <= len(column) * CATEGORY_MAX_RATIO:
+        return column.dictionary_encode().to_pandas()
+    return pd.arrays.ArrowStringArray(column)
+
+
+def _all_match(strings, pattern):
+    return pc.all(pc.match_substring_regex(strings, f'^(?:{pattern})$')).as_py()
+
+
+def _parse_numbers(cells):
+    """Numeric values of number-like cell strings, or None if any cell is not a plain number"""
+    if not _all_match(cells, NUMBER_PATTERN):
+        return None
+    # Sheets formats large numbers with thousands separators
+    digits = pc.replace_substring(cells, ',', '')
+    try:
+        if pc.any(pc.match_substring_regex(cells, '[.eE]')).as_py():
+            return pc.cast(digits, pa.float64()).to_numpy()
+        return pc.cast(digits, pa.int64()).to_numpy()
+    except pa.ArrowInvalid:
+        # Integers too large for int64 stay text rather than lose precision as floats
+        return None
+
+
+def _date_format(sample):
+    """First of DATE_FORMATS every sampled cell parses with, or None"""
+    if not len(sample) or not _all_match(sample, r'\d.*'):
+        return None
+    for date_format in DATE_FORMATS:
+        if pc.strptime(sample, format=date_format, unit='ns', error_is_null=True).null_count == 0:
+            return date_format
+    return None
+
+
+def _with_blanks(parsed, blank):
+    """Spread values parsed from the non-blank cells back over the full column, blanks as missing"""
+    data = np.zeros(len(blank), dtype=parsed.dtype)
+    data[~blank] = parsed
+    if parsed.dtype.kind == 'M':
+        data[blank] = np.datetime64('NaT')
+        return data
+    if not blank.any():
+        return data
+    if parsed.dtype.kind == 'f':
+        return pd.arrays.FloatingArray(data, blank)
+    return pd.arrays.IntegerArray(data, blank)
+
+
+def filter_rows(df, filter_settings, search_term=''):
+    """
+    Apply filters and search together on a loaded sheet
+    With the query engine enabled both compile to one vectorised query; otherwise they are
+    answered from the sheet's column index and combined as row masks. Either way only the
+    final selection is copied.
+    """
+    if not filter_settings and not search_term:
         return df
-
-    # Search across all columns
-    mask = pd.Series(False, index=df.index)
-    for col in df.columns:
-        mask = mask | df[col].astype(str).str.contains(search_term, case=False, na=False)
-    return df[mask]
-
-
-def get_numeric_stats(df, columns):
-    """Get numeric statistics for selected columns"""
-    numeric_df = df.copy()
-    for col in columns:
-        try:
-            numeric_df[col] = pd.to_numeric(numeric_df[col])
-        except:
-            pass
-
-    # Get numeric columns
-    numeric_cols = numeric_df.select_dtypes(include=['number']).columns
-
-    if len(numeric_cols) > 0:
-        return numeric_df[numeric_cols].describe()
-    return None
\ No newline at end of file
+    query_engine = get_query_engine()
+    with span('filter', engine='duckdb' if query_engine is not None else 'index', rows=len(df)) as s:
+        if query_engine is not None:
+            filtered = df.iloc[query_engine.filter_positions(df, filter_settings, search_term)]
+        else:
+            index = get_sheet_index(df)
+            mask = index.filter_mask(filter_settings)
+            if search_term:
+                mask &= index.search_mask(search_term)
+            filtered = df[mask]
+        s.set(matches=len(filtered))
+    return filtered
+
+
+def get_numeric_stats(df, columns, base_df=None):
+    """
+    Get numeric statistics for the numeric columns, and selected text columns that hold numbers
+    Read from the column profiles built in one streaming pass over the rows: counts, mean, std,
+    min and max are exact, quartiles and distinct counts are approximate on large tabs. When df
+    is a filtered view of base_df, the profiles of base_df's row chunks are merged rather than
+    profiling df afresh.
+    """
+    with span('stats', columns=len(columns), rows=len(df)):
+        if base_df is not None and base_df is not df:
+            return get_sheet_profile(base_df).subset(df).describe(columns)
+        return get_sheet_profile(df).describe(columns)
@@ -0,0 +1,87 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from config import DERIVATION_CACHE_MAX_MB, EXPORT_SPOOL_MAX_MB
+from utils.resources import shared_resource
+
+# Export files larger than this, which were built on disk, are handed out once rather than held in memory
+EXPORT_CACHE_MAX_BYTES = EXPORT_SPOOL_MAX_MB * 2 ** 20
+
+
+class DerivationCache:
+    """
+    Bounded cache of artifacts derived from loaded sheets: filtered views, unique values,
+    summary statistics and export files
+    Keys start with the (file ID, revision) of the workbook, so a new revision never sees stale
+    artifacts; least recently used entries are evicted once the memory budget is exceeded.
+    Cached values are shared between sessions and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def get_or_compute(self, key, compute, max_value_bytes=None):
+        """Cached value for key, computing and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value, max_value_bytes)
+        return value
+
+    def put(self, key, value, max_value_bytes=None):
+        """Store value for key, unless it is larger than max_value_bytes or the whole budget"""
+        nbytes = artifact_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._total -= self._entries.pop(key)[1]
+            if nbytes > min(self.max_bytes, max_value_bytes or self.max_bytes):
+                return
+            self._entries[key] = (value, nbytes)
+            self._total += nbytes
+            while self._total > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._total -= evicted_bytes
+
+    def total_bytes(self):
+        with self._lock:
+            return self._total
+
+
+def artifact_nbytes(value):
+    """Approximate memory held by a cached artifact"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def filter_state_key(filter_settings):
+    """Hashable form of a sheet's filter settings"""
+    return tuple(sorted((str(col), tuple(values) if isinstance(values, list) else values)
+                        for col, values in filter_settings.items()))
+
+
+@shared_resource
+def get_derivation_cache():
+    """Derivation cache shared by all sessions of this server"""
+    return DerivationCache(DERIVATION_CACHE_MAX_MB * 2 ** 20)
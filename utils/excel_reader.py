@@ -0,0 +1,272 @@
+import io
+import logging
+import mmap
+import os
+import threading
+import time
+import weakref
+from datetime import date, datetime
+from itertools import islice, zip_longest
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is then not reported
+    resource = None
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+from config import EXCEL_BATCH_ROWS
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+DATE_TYPES = (date, datetime, pd.Timestamp)
+
+
+class ExcelWorkbookReader:
+    """
+    Streams sheets out of a spooled Excel file, one sheet at a time and only when asked
+    Uses calamine when it is installed, otherwise openpyxl in read-only mode over a memory map of
+    the file; rows are gathered into columnar batches instead of a full cell object model.
+    Parse time and memory are recorded per sheet in sheet_stats.
+    The spooled file is deleted when the reader is closed or garbage collected.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sheet_stats = {}
+        self._lock = threading.Lock()
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._finalizer = weakref.finalize(self, _cleanup, self._file, self._mmap, path)
+
+        if CalamineWorkbook is not None:
+            self.engine = 'calamine'
+            self._workbook = CalamineWorkbook.from_path(path)
+            self.sheet_names = list(self._workbook.sheet_names)
+        elif self._mmap[:4] == b'PK\x03\x04':
+            # .xlsx is a zip archive; openpyxl reads its parts straight from the memory map
+            import openpyxl
+            self.engine = 'openpyxl'
+            self._workbook = openpyxl.load_workbook(MappedFile(self._mmap), read_only=True, data_only=True)
+            self.sheet_names = list(self._workbook.sheetnames)
+        else:
+            # Legacy .xls without calamine falls back to pandas' default reader
+            self.engine = 'pandas'
+            self._workbook = pd.ExcelFile(self.path)
+            self.sheet_names = list(self._workbook.sheet_names)
+
+    def read_sheet(self, sheet_name):
+        """Parse one sheet into a DataFrame with the first row as header"""
+        start = time.perf_counter()
+        peak_before = _peak_rss()
+        with self._lock, span('parse.excel_sheet', engine=self.engine):
+            if self.engine == 'pandas':
+                df = pd.read_excel(self._workbook, sheet_name=sheet_name)
+            elif self.engine == 'calamine':
+                # calamine reports empty cells as ''
+                rows = self._workbook.get_sheet_by_name(sheet_name).iter_rows()
+                df = rows_to_dataframe(rows, empty_as_none=True)
+            else:
+                df = rows_to_dataframe(self._workbook[sheet_name].iter_rows(values_only=True))
+
+        self._record_stats(sheet_name, len(df), len(df.columns), int(df.memory_usage(index=True, deep=True).sum()),
+                           start, peak_before)
+        return df
+
+    def read_sheet_values(self, sheet_name):
+        """
+        Read one sheet as rows of cell text like the Sheets API returns them: numbers, dates and
+        booleans written out plainly, trailing blank cells and rows left out
+        """
+        start = time.perf_counter()
+        peak_before = _peak_rss()
+        with self._lock, span('parse.excel_sheet', engine=self.engine, values=True):
+            if self.engine == 'pandas':
+                rows = pd.read_excel(self._workbook, sheet_name=sheet_name, header=None, dtype=object) \
+                    .itertuples(index=False)
+            elif self.engine == 'calamine':
+                rows = self._workbook.get_sheet_by_name(sheet_name).iter_rows()
+            else:
+                rows = self._workbook[sheet_name].iter_rows(values_only=True)
+            values = []
+            for row in rows:
+                row = [cell_text(cell) for cell in row]
+                while row and row[-1] == '':
+                    row.pop()
+                values.append(row)
+            while values and not values[-1]:
+                values.pop()
+
+        self._record_stats(sheet_name, max(len(values) - 1, 0), max(map(len, values), default=0), None,
+                           start, peak_before)
+        return values
+
+    def _record_stats(self, sheet_name, rows, columns, nbytes, start, peak_before):
+        self.sheet_stats[sheet_name] = {
+            'engine': self.engine,
+            'rows': rows,
+            'columns': columns,
+            'seconds': time.perf_counter() - start,
+            'bytes': nbytes,
+            'peak_rss_growth': None if peak_before is None else _peak_rss() - peak_before,
+        }
+        logger.info(f"Parsed sheet {sheet_name} with {self.engine}: {rows} rows in "
+                    f"{self.sheet_stats[sheet_name]['seconds']:.2f}s")
+
+    def close(self):
+        if self.engine != 'pandas':
+            self._workbook.close()
+        self._finalizer()
+
+
+def rows_to_dataframe(rows, batch_rows=EXCEL_BATCH_ROWS, empty_as_none=False):
+    """
+    Build a DataFrame from an iterator of row tuples, first row as header
+    Rows are consumed in batches and transposed into one object array per column, so only one
+    batch of Python row tuples is alive at a time. Headers follow pd.read_excel: blank headers
+    become 'Unnamed: i' and repeated ones get a '.n' suffix.
+    With empty_as_none, empty strings are treated as blank cells.
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    if empty_as_none:
+        header = [None if name == '' else name for name in header]
+
+    column_batches = []
+    width = len(header)
+    while True:
+        batch = list(islice(rows, batch_rows))
+        if not batch:
+            break
+        columns = [np.array(column, dtype=object) for column in zip_longest(*batch)]
+        if empty_as_none:
+            for column in columns:
+                column[column == ''] = None
+        width = max(width, len(columns))
+        column_batches.append((len(batch), columns))
+
+    columns = []
+    for i in range(width):
+        parts = [batch_columns[i] if i < len(batch_columns) else np.full(length, None, dtype=object)
+                 for length, batch_columns in column_batches]
+        columns.append(np.concatenate(parts) if parts else np.array([], dtype=object))
+
+    header = list(header) + [None] * (width - len(header))
+    df = pd.DataFrame(dict(zip(range(width), columns)))
+    df.columns = excel_column_names(header)
+
+    # Read-only worksheets can report trailing blank rows and columns; pd.read_excel drops them
+    if len(df):
+        has_data = df.notna().any(axis=1).to_numpy()
+        df = df.iloc[:len(has_data) - np.argmax(has_data[::-1])] if has_data.any() else df.iloc[:0]
+    blank = [i for i, name in enumerate(header) if name is None and not df.iloc[:, i].notna().any()]
+    while blank and blank[-1] == len(df.columns) - 1:
+        df = df.iloc[:, :-1]
+        blank.pop()
+
+    return normalise_excel_types(df.infer_objects())
+
+
+def cell_text(value):
+    """A cell value as the text the Sheets API returns for it under a plain number or date format"""
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT:
+        return ''
+    if isinstance(value, (bool, np.bool_)):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (float, np.floating)) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S').removesuffix(' 00:00:00')
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def normalise_excel_types(df):
+    """
+    Match pd.read_excel dtypes: date cells become datetime64 and whole-number float columns
+    without blanks become int64 (calamine reports every number as a float)
+    """
+    for i in range(df.shape[1]):
+        column = df.iloc[:, i]
+        if column.dtype == object:
+            values = column.dropna()
+            # datetime.datetime is a subclass of datetime.date
+            if len(values) and isinstance(values.iloc[0], date) and values.map(type).isin(DATE_TYPES).all():
+                df.isetitem(i, pd.to_datetime(column))
+        elif column.dtype.kind == 'f' and len(column) and column.notna().all() and (column % 1 == 0).all():
+            df.isetitem(i, column.astype('int64'))
+    return df
+
+
+def excel_column_names(header):
+    """Name columns like pd.read_excel does for blank and duplicated headers"""
+    names = []
+    seen = {}
+    for i, name in enumerate(header):
+        name = f'Unnamed: {i}' if name is None else name
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+class MappedFile(io.RawIOBase):
+    """Seekable read-only file object over a memory map, for readers such as zipfile"""
+
+    def __init__(self, file_map):
+        self._map = file_map
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._map[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._map)
+        self._position = offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def _peak_rss():
+    """Peak resident set size of this process in bytes"""
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cleanup(file, file_map, path):
+    file_map.close()
+    file.close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -1,57 +1,194 @@
 import io
-import pandas as pd
-from googleapiclient.http import MediaIoBaseDownload
-import streamlit as st
+import os
+import re
+import tempfile
+import zipfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config import EXPORT_CHUNK_ROWS, EXPORT_SPOOL_MAX_MB
+from services.google_service import XLSX_MIME_TYPE, download_file, export_file
+from utils.tracing import span
+from utils.workbook_cache import arrow_safe_frame
 
 
-def download_excel_file(drive_service, file_id):
+def download_excel_file(drive_service, file_id, stats=None, engine=None):
     """Download Excel file from Google Drive"""
-    request = drive_service.files().get_media(fileId=file_id)
-    file_buffer = io.BytesIO()
-    downloader = MediaIoBaseDownload(file_buffer, request)
+    return download_file(drive_service, file_id, io.BytesIO(), stats=stats, engine=engine)
 
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
 
-    file_buffer.seek(0)
-    return file_buffer
+def export_google_sheet(drive_service, file_id, stats=None, engine=None):
+    """Export a Google Sheet from Google Drive as an Excel file, in one Drive call"""
+    return export_file(drive_service, file_id, XLSX_MIME_TYPE, io.BytesIO(), stats=stats, engine=engine)
 
 
-def read_excel_sheets(excel_buffer):
-    """Read all sheets from Excel file"""
-    # Read all sheets into a dict of dataframes
-    excel_file = pd.ExcelFile(excel_buffer)
-    sheet_names = excel_file.sheet_names
-
-    sheets_data = {}
-    for sheet_name in sheet_names:
-        df = pd.read_excel(excel_file, sheet_name=sheet_name)
-        sheets_data[sheet_name] = df
-
-    return sheets_data, sheet_names
+def download_excel_to_temp(drive_service, file_id, stats=None, engine=None, export=False):
+    """
+    Spool an Excel file from Google Drive to a temporary file instead of memory
+    With export, the file is a Google Sheet exported as an Excel file.
+    Returns the path of the temporary file; the caller is responsible for removing it
+    """
+    with tempfile.NamedTemporaryFile(prefix='spreadsheet-', suffix='.xlsx', delete=False) as temp_file:
+        try:
+            if export:
+                export_file(drive_service, file_id, XLSX_MIME_TYPE, temp_file, stats=stats, engine=engine)
+            else:
+                download_file(drive_service, file_id, temp_file, stats=stats, engine=engine)
+        except BaseException:
+            temp_file.close()
+            os.remove(temp_file.name)
+            raise
+        return temp_file.name
 
 
 def create_download_excel(sheets_data, file_name):
     """Create Excel file for download with multiple sheets"""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for sheet_name, df in sheets_data.items():
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-    output.seek(0)
-
-    return output
+    return spooled_export(lambda file: write_excel(sheets_data, file), 'xlsx')
 
 
 def create_download_csv(df, file_name, sheet_name):
     """Create CSV file for download"""
-    csv = df.to_csv(index=False).encode('utf-8')
-    return csv
+    return spooled_export(lambda file: write_csv(df, file), 'csv')
 
 
 def create_download_sheet_excel(df, file_name, sheet_name):
     """Create Excel file for download with a single sheet"""
-    buffer = io.BytesIO()
-    df.to_excel(buffer, index=False)
-    buffer.seek(0)
-    return buffer
\ No newline at end of file
+    return spooled_export(lambda file: write_excel({'Sheet1': df}, file), 'xlsx')
+
+
+def create_download_csv_zip(sheets_data, file_name):
+    """Create zip archive for download with one CSV file per sheet"""
+    return spooled_export(lambda file: write_zip(sheets_data.items(), file, 'csv', write_csv), 'csv.zip')
+
+
+def create_download_parquet_zip(sheets_data, file_name):
+    """Create zip archive for download with one Parquet file per sheet"""
+    return spooled_export(lambda file: write_zip(sheets_data.items(), file, 'parquet', write_parquet),
+                          'parquet.zip')
+
+
+# Excel limits worksheet names to 31 characters
+EXCEL_SHEET_NAME_MAX = 31
+
+# Whole-workbook export formats: label -> (file extension, MIME type, exporter)
+WORKBOOK_EXPORT_FORMATS = {
+    'Excel (.xlsx)': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                      create_download_excel),
+    'CSV files (.zip)': ('zip', 'application/zip', create_download_csv_zip),
+    'Parquet files (.zip)': ('zip', 'application/zip', create_download_parquet_zip),
+}
+
+
+def spooled_export(write, export_format=''):
+    """
+    Run write(file) against a spooled temporary file and return the bytes written
+    Only the writing is bounded: the file stays in memory up to EXPORT_SPOOL_MAX_MB and moves to
+    disk beyond that, but the result is the whole file as bytes, since st.download_button reads its
+    data whole either way. Callers that can take a file, like the headless exports, run the writers
+    against their own output instead; larger exports are not cached (see EXPORT_CACHE_MAX_BYTES)
+    """
+    with span('export', format=export_format) as s, \
+            tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_MB * 2 ** 20) as file:
+        write(file)
+        file.seek(0)
+        data = file.read()
+        s.set(bytes=len(data))
+        return data
+
+
+def export_rows(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Rows of a DataFrame as tuples of plain Python values, converted one chunk at a time"""
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        yield from chunk.where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+def write_excel(sheets_data, file):
+    """
+    Write sheets to an .xlsx file in xlsxwriter's constant_memory mode
+    Rows are written in order and flushed to disk as the writer moves on, so memory stays flat
+    whatever the sheet size
+    """
+    # Imported on first export rather than with the app
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(file, {
+        'constant_memory': True,
+        'nan_inf_to_errors': True,
+        'remove_timezone': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+    })
+    header_format = workbook.add_format({'bold': True, 'border': 1})
+    used_names = set()
+    for sheet_name, df in sheets_data.items():
+        worksheet = workbook.add_worksheet(unique_name(
+            re.sub(r'[\[\]:*?/\\]', '_', sheet_name)[:EXCEL_SHEET_NAME_MAX], used_names, EXCEL_SHEET_NAME_MAX))
+        worksheet.write_row(0, 0, [str(col) for col in df.columns], header_format)
+        for row, values in enumerate(export_rows(df), start=1):
+            worksheet.write_row(row, 0, values)
+    workbook.close()
+
+
+def write_csv(df, file):
+    """Write a sheet as UTF-8 CSV, encoded chunk by chunk"""
+    df.to_csv(file, index=False, encoding='utf-8', chunksize=EXPORT_CHUNK_ROWS)
+
+
+def write_parquet(df, file):
+    """Write a sheet as Parquet, one row group per chunk"""
+    frame = arrow_safe_frame(df)
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    with pq.ParquetWriter(file, schema) as writer:
+        for start in range(0, len(frame), EXPORT_CHUNK_ROWS):
+            chunk = frame.iloc[start:start + EXPORT_CHUNK_ROWS]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_arrow_stream(sheets, file):
+    """
+    Write (sheet name, DataFrame) pairs as Arrow IPC streams, one after another, each sheet's
+    name in its schema metadata under b'sheet'; record batches hold EXPORT_CHUNK_ROWS rows
+    """
+    for sheet_name, df in sheets:
+        table = pa.Table.from_pandas(arrow_safe_frame(df), preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'sheet': sheet_name.encode('utf-8')})
+        with pa.ipc.new_stream(file, table.schema) as writer:
+            writer.write_table(table, max_chunksize=EXPORT_CHUNK_ROWS)
+
+
+def write_ndjson(sheets, file, sheet_field=None):
+    """
+    Write (sheet name, DataFrame) pairs as newline-delimited JSON, one object per row, encoded
+    chunk by chunk; with sheet_field each object also names its sheet under that key
+    """
+    for sheet_name, df in sheets:
+        for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+            chunk = df.iloc[start:start + EXPORT_CHUNK_ROWS]
+            if sheet_field:
+                chunk = chunk.copy()
+                chunk.insert(0, sheet_field, sheet_name)
+            text = chunk.to_json(orient='records', lines=True, date_format='iso', force_ascii=False)
+            file.write(text.encode('utf-8') if text.endswith('\n') else (text + '\n').encode('utf-8'))
+
+
+def write_zip(sheets, file, extension, write_sheet):
+    """
+    Write one file per (sheet name, DataFrame) pair into a zip archive, streaming each straight
+    into its entry; file may be unseekable, such as an HTTP response
+    """
+    used_names = set()
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for sheet_name, df in sheets:
+            # Sheet titles may contain characters that are not valid in file names
+            entry_name = unique_name(re.sub(r'[\\/:*?"<>|]', '_', sheet_name), used_names) + f'.{extension}'
+            with archive.open(entry_name, 'w', force_zip64=True) as entry:
+                write_sheet(df, entry)
+
+
+def unique_name(name, used_names, max_length=None):
+    """name, or name with a ' (n)' suffix if already in used_names, which it is then added to"""
+    candidate, i = name, 1
+    while candidate.lower() in used_names:
+        i += 1
+        suffix = f' ({i})'
+        candidate = (name[:max_length - len(suffix)] if max_length else name) + suffix
+    used_names.add(candidate.lower())
+    return candidate
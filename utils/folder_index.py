@@ -0,0 +1,251 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import FOLDER_INDEX_PATH, FOLDER_INDEX_WORKERS
+from services.google_service import get_fetch_engine, get_file_revision, list_files
+from utils.resources import shared_resource
+from utils.tracing import run_in_context
+from utils.workbook_loader import load_workbook
+
+logger = logging.getLogger(__name__)
+
+# Rows inserted into the full-text index per executemany call
+INSERT_BATCH_ROWS = 5000
+
+# Cells of a row are joined with this separator, so search terms do not match across cells
+CELL_SEPARATOR = '\t'
+
+
+class FolderIndex:
+    """
+    Persistent full-text index over every row of every tab of the files of indexed folders
+    Rows live in an SQLite FTS5 table, with the trigram tokenizer when SQLite supports it so a
+    search matches any substring of a row, case-insensitively, like the in-sheet search; with
+    the older unicode61 tokenizer whole words are matched. Each file is replaced in a single
+    transaction together with the revision it was indexed at, so an interrupted job leaves
+    every file either fully indexed or untouched and resumes by skipping up-to-date files.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS files '
+                '(file_id TEXT PRIMARY KEY, folder_id TEXT, name TEXT, revision TEXT, rows INTEGER, indexed_at REAL)')
+            try:
+                self._connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS cells USING fts5("
+                                         "text, file_id UNINDEXED, sheet UNINDEXED, row UNINDEXED, tokenize='trigram')")
+            except sqlite3.OperationalError:
+                # SQLite before 3.34 has no trigram tokenizer
+                self._connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS cells USING fts5("
+                                         "text, file_id UNINDEXED, sheet UNINDEXED, row UNINDEXED)")
+            sql = self._connection.execute("SELECT sql FROM sqlite_master WHERE name = 'cells'").fetchone()[0]
+        self.substring_search = 'trigram' in sql
+
+    def revisions(self, folder_id):
+        """Revision each file of a folder was indexed at"""
+        with self._lock:
+            rows = self._connection.execute('SELECT file_id, revision FROM files WHERE folder_id = ?',
+                                            (folder_id,)).fetchall()
+        return dict(rows)
+
+    def add_file(self, folder_id, file_id, name, revision, sheets_data):
+        """Replace the indexed rows of a file with those of its loaded tabs; returns the row count"""
+        batches = [(sheet_name, row_texts(sheets_data[sheet_name])) for sheet_name in sheets_data]
+        total = sum(len(texts) for _, texts in batches)
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM cells WHERE file_id = ?', (file_id,))
+            for sheet_name, texts in batches:
+                for start in range(0, len(texts), INSERT_BATCH_ROWS):
+                    self._connection.executemany(
+                        'INSERT INTO cells (text, file_id, sheet, row) VALUES (?, ?, ?, ?)',
+                        ((text, file_id, sheet_name, row)
+                         for row, text in enumerate(texts[start:start + INSERT_BATCH_ROWS], start=start)))
+            self._connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                                     (file_id, folder_id, name, revision, total, time.time()))
+        return total
+
+    def remove_missing(self, folder_id, file_ids):
+        """Drop files of a folder that are no longer in it"""
+        with self._lock, self._connection:
+            indexed = [row[0] for row in self._connection.execute('SELECT file_id FROM files WHERE folder_id = ?',
+                                                                  (folder_id,))]
+            for file_id in set(indexed) - set(file_ids):
+                self._connection.execute('DELETE FROM cells WHERE file_id = ?', (file_id,))
+                self._connection.execute('DELETE FROM files WHERE file_id = ?', (file_id,))
+
+    def search(self, folder_id, term, limit=1000):
+        """
+        Rows of the folder's indexed files containing term, as dicts with file_id, file_name,
+        sheet, row (position within the tab, as in the data view) and the row's text
+        """
+        term = term.strip()
+        if not term:
+            return []
+        if self.substring_search and len(term) < 3:
+            # Trigrams need three characters; shorter terms scan the rows instead
+            condition, param = 'instr(lower(cells.text), ?) > 0', term.lower()
+        else:
+            condition, param = 'cells MATCH ?', '"' + term.replace('"', '""') + '"'
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT cells.file_id, files.name, cells.sheet, cells.row, cells.text FROM cells '
+                f'JOIN files ON files.file_id = cells.file_id WHERE files.folder_id = ? AND {condition} '
+                'ORDER BY files.name, cells.file_id, cells.sheet, cells.row LIMIT ?',
+                (folder_id, param, limit)).fetchall()
+        return [{'file_id': file_id, 'file_name': name, 'sheet': sheet, 'row': row,
+                 'text': text.replace(CELL_SEPARATOR, ' | ')}
+                for file_id, name, sheet, row, text in rows]
+
+    def folder_stats(self, folder_id):
+        """Number of indexed files and rows of a folder"""
+        with self._lock:
+            files, rows = self._connection.execute('SELECT count(*), coalesce(sum(rows), 0) FROM files '
+                                                   'WHERE folder_id = ?', (folder_id,)).fetchone()
+        return {'files': files, 'rows': rows}
+
+
+def row_texts(df):
+    """Each row of a DataFrame as one string of its cell values, blanks left empty"""
+    if len(df.columns) == 0:
+        return [''] * len(df)
+    columns = []
+    for i in range(len(df.columns)):
+        column = df.iloc[:, i]
+        text = column.astype(str).to_numpy(dtype=object)
+        text[column.isna().to_numpy()] = ''
+        columns.append(text)
+    texts = columns[0]
+    for column in columns[1:]:
+        texts = texts + CELL_SEPARATOR + column
+    return list(texts)
+
+
+class FolderIndexJob:
+    """
+    Background job indexing every spreadsheet of a folder on the folder index's own small pool
+    Files go through load_workbook, so they share the disk cache and rate limits with the app, but
+    never take the fetch engine's workers from sessions waiting on interactive fetches;
+    files already indexed at their current revision are skipped, which is also how a job
+    interrupted by a restart resumes. progress() can be polled from any session.
+    """
+
+    def __init__(self, index, drive_service, sheets_service, folder_id, executor, engine=None):
+        self.index = index
+        self.executor = executor
+        self.drive_service = drive_service
+        self.sheets_service = sheets_service
+        self.folder_id = folder_id
+        self.engine = engine or get_fetch_engine()
+        self._progress = {'total': 0, 'indexed': 0, 'skipped': 0, 'failed': 0, 'rows': 0, 'errors': {},
+                          'running': True, 'cancelled': False, 'started': time.time(), 'seconds': 0.0}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'folder-index-{folder_id}', daemon=True)
+        self._thread.start()
+
+    def progress(self):
+        with self._lock:
+            progress = dict(self._progress, errors=dict(self._progress['errors']))
+        if progress['running']:
+            progress['seconds'] = time.time() - progress['started']
+        return progress
+
+    def cancel(self):
+        """Stop after the files being indexed; the next job for the folder picks up the rest"""
+        self._cancelled.set()
+        with self._lock:
+            self._progress['cancelled'] = True
+
+    def _update(self, **counts):
+        with self._lock:
+            for key, amount in counts.items():
+                self._progress[key] += amount
+
+    def _run(self):
+        try:
+            files = list_files(self.drive_service, self.folder_id, engine=self.engine)
+            with self._lock:
+                self._progress['total'] = len(files)
+            self.index.remove_missing(self.folder_id, [file['id'] for file in files])
+            indexed_revisions = self.index.revisions(self.folder_id)
+            futures = [self.executor.submit(run_in_context(self._index_file), file, indexed_revisions.get(file['id']))
+                       for file in files]
+            for future in futures:
+                future.result()
+        except Exception as e:
+            logger.warning(f'Indexing folder {self.folder_id} failed: {e}')
+            with self._lock:
+                self._progress['errors'][self.folder_id] = str(e)
+        finally:
+            with self._lock:
+                self._progress['running'] = False
+                self._progress['seconds'] = time.time() - self._progress['started']
+            logger.info(f'Indexed folder {self.folder_id}: {self.progress()}')
+
+    def _index_file(self, file, indexed_revision):
+        if self._cancelled.is_set():
+            return
+        try:
+            revision = get_file_revision(self.drive_service, file['id'], engine=self.engine)
+            if revision == indexed_revision:
+                self._update(skipped=1)
+                return
+            lease, _ = load_workbook(self.drive_service, self.sheets_service, file['id'], file['mimeType'],
+                                     file['name'], engine=self.engine)
+            try:
+                sheets_data = lease.workbook['sheets_data']
+                if hasattr(sheets_data, 'ensure_loaded'):
+                    sheets_data.ensure_loaded()
+                rows = self.index.add_file(self.folder_id, file['id'], file['name'], lease.workbook['revision'],
+                                           sheets_data)
+            finally:
+                lease.release()
+            self._update(indexed=1, rows=rows)
+        except Exception as e:
+            # One unreadable file does not stop the folder; it is retried by the next run
+            logger.warning(f"Could not index {file['name']}: {e}")
+            with self._lock:
+                self._progress['failed'] += 1
+                self._progress['errors'][file['name']] = str(e)
+
+
+class FolderIndexService:
+    """The shared folder index and its running jobs, one per folder, sharing one bounded worker pool"""
+
+    def __init__(self, index, max_workers=FOLDER_INDEX_WORKERS):
+        self.index = index
+        self.max_workers = max_workers
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, drive_service, sheets_service, folder_id, engine=None):
+        """Start indexing a folder unless a job for it is already running; returns the job"""
+        with self._lock:
+            job = self._jobs.get(folder_id)
+            if job is None or not job.progress()['running']:
+                engine = engine or get_fetch_engine()
+                if self._executor is None:
+                    self._executor = engine.background_executor(self.max_workers, 'folder-index')
+                job = self._jobs[folder_id] = FolderIndexJob(self.index, drive_service, sheets_service,
+                                                             folder_id, self._executor, engine)
+            return job
+
+    def job(self, folder_id):
+        with self._lock:
+            return self._jobs.get(folder_id)
+
+
+@shared_resource
+def get_folder_index():
+    """Folder index service shared by all sessions of this server"""
+    return FolderIndexService(FolderIndex(FOLDER_INDEX_PATH))
@@ -0,0 +1,153 @@
+"""
+Python API over the app's loaders for batch jobs, scripts and the HTTP API, without Streamlit
+Shares the app's fetch engine, Drive index, workbook store and disk cache, so consumers get the
+same batching, rate limiting and caching as the app, in the same process or across runs:
+
+    from utils import headless
+
+    folders = headless.list_folders()
+    with headless.open_workbook(file_id) as workbook:
+        for sheet_name, df in workbook.iter_sheets():
+            ...
+        with open('workbook.arrows', 'wb') as f:
+            workbook.export(f, 'arrow')
+"""
+from config import DEFAULT_BASE_FOLDER_ID
+from services.drive_index import get_drive_index
+from services.google_service import (SPREADSHEET_MIME_TYPES, get_fetch_engine, get_file_details,
+                                     get_google_services)
+from utils.file_operations import write_arrow_stream, write_ndjson, write_parquet, write_zip
+from utils.workbook_loader import load_workbook
+
+# Key naming the sheet of each row when several sheets are streamed as NDJSON
+SHEET_FIELD = '__sheet'
+
+# Streaming export formats: name -> (MIME type of one sheet, MIME type of several sheets)
+STREAM_FORMATS = {
+    'arrow': ('application/vnd.apache.arrow.stream', 'application/vnd.apache.arrow.stream'),
+    'ndjson': ('application/x-ndjson', 'application/x-ndjson'),
+    # Parquet holds a single table, so several sheets are zipped as one Parquet file each
+    'parquet': ('application/vnd.apache.parquet', 'application/zip'),
+}
+
+
+def export_mime_type(export_format, single):
+    """MIME type of an export of one sheet (single) or several; ValueError for an unknown format"""
+    if export_format not in STREAM_FORMATS:
+        raise ValueError(f"Unknown format {export_format!r}, expected one of {', '.join(STREAM_FORMATS)}")
+    return STREAM_FORMATS[export_format][0 if single else 1]
+
+
+def list_folders(parent_id=None):
+    """Folders within parent_id, the configured base folder by default, as dicts with id and name"""
+    return get_drive_index().list_folders(parent_id or DEFAULT_BASE_FOLDER_ID)
+
+
+def list_files(folder_id):
+    """Spreadsheet files within a folder, as dicts with id, name and mimeType"""
+    return get_drive_index().list_files(folder_id)
+
+
+def open_workbook(file_id, file_type=None):
+    """
+    Open a Google Sheet or Excel file through the shared workbook store; tabs load when first read
+    file_type is the file's MIME type and is looked up when not given. Close the returned Workbook,
+    or use it as a context manager, so the store may evict it.
+    """
+    drive_service, sheets_service = get_google_services()
+    engine = get_fetch_engine()
+    file_name = ''
+    if file_type is None:
+        details = get_file_details(drive_service, file_id, engine=engine)
+        file_type, file_name = details['mimeType'], details['name']
+    if file_type not in SPREADSHEET_MIME_TYPES:
+        raise ValueError(f'{file_id} is not a Google Sheet or Excel file ({file_type})')
+    lease, load_stats = load_workbook(drive_service, sheets_service, file_id, file_type, file_name, engine=engine)
+    return Workbook(file_id, lease, load_stats, engine)
+
+
+class Workbook:
+    """A workbook opened by open_workbook, holding a lease on the shared copy until closed"""
+
+    def __init__(self, file_id, lease, load_stats, engine):
+        self.file_id = file_id
+        self.load_stats = load_stats
+        self._lease = lease
+        self._engine = engine
+        self._workbook = lease.workbook
+        self._sheets_data = lease.workbook['sheets_data']
+
+    @property
+    def file_name(self):
+        return self._workbook['file_name']
+
+    @property
+    def revision(self):
+        return self._workbook['revision']
+
+    @property
+    def sheet_names(self):
+        return list(self._workbook['sheet_names'])
+
+    @property
+    def sheet_properties(self):
+        """Grid size per tab of a Google Sheet (empty for Excel files)"""
+        return self._workbook['sheet_properties']
+
+    def sheet(self, sheet_name):
+        """A tab's DataFrame, loaded on first access; KeyError for an unknown tab"""
+        return self._sheets_data[sheet_name]
+
+    def iter_sheets(self, sheet_names=None):
+        """
+        (sheet name, DataFrame) for the given tabs, all by default, in order; the next tab is
+        fetched in the background while one is being consumed
+        """
+        sheet_names = self.check_sheet_names(sheet_names)
+        for i, sheet_name in enumerate(sheet_names):
+            if hasattr(self._sheets_data, 'prefetch'):
+                self._sheets_data.prefetch(sheet_names[i + 1:i + 2], self._engine.submit)
+            yield sheet_name, self._sheets_data[sheet_name]
+
+    def export(self, file, export_format, sheet_names=None):
+        """
+        Write tabs to a binary file object as each one loads, in one of the STREAM_FORMATS
+        A single tab is written as a plain Arrow stream, NDJSON or Parquet file. Several tabs (all by
+        default) are written as Arrow streams back to back, NDJSON rows naming their sheet under
+        SHEET_FIELD, or a zip of Parquet files. Returns the MIME type of what was written.
+        """
+        sheet_names = self.check_sheet_names(sheet_names)
+        single = len(sheet_names) == 1
+        mime_type = export_mime_type(export_format, single)
+        sheets = self.iter_sheets(sheet_names)
+        if export_format == 'arrow':
+            write_arrow_stream(sheets, file)
+        elif export_format == 'ndjson':
+            write_ndjson(sheets, file, None if single else SHEET_FIELD)
+        elif single:
+            write_parquet(self.sheet(sheet_names[0]), file)
+        else:
+            write_zip(sheets, file, 'parquet', write_parquet)
+        return mime_type
+
+    def check_sheet_names(self, sheet_names=None):
+        """The given tab names, all by default, as a list; KeyError naming any unknown tab"""
+        if sheet_names is None:
+            return self.sheet_names
+        unknown = [name for name in sheet_names if name not in self._workbook['sheet_names']]
+        if unknown:
+            raise KeyError(f"No such sheet: {', '.join(unknown)}")
+        return list(sheet_names)
+
+    def close(self):
+        """Release the lease on the shared workbook"""
+        if self._lease is not None:
+            self._lease.release()
+            self._lease = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,143 @@
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from googleapiclient.errors import HttpError
+
+from config import API_HOST, API_PORT, API_TOKEN
+from utils import headless
+from utils.resources import shared_resource
+
+logger = logging.getLogger(__name__)
+
+# Bytes gathered before a chunk of a streamed response is sent
+RESPONSE_CHUNK_BYTES = 64 * 1024
+
+
+class ChunkedResponse:
+    """Binary file object writing to an HTTP/1.1 response with chunked transfer encoding"""
+
+    def __init__(self, wfile):
+        self._wfile = wfile
+        self._buffer = bytearray()
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        if len(self._buffer) >= RESPONSE_CHUNK_BYTES:
+            self.flush()
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        if self._buffer:
+            self._wfile.write(b'%x\r\n' % len(self._buffer) + bytes(self._buffer) + b'\r\n')
+            self._buffer.clear()
+
+    def close(self):
+        """Send what is left and the final empty chunk"""
+        if not self.closed:
+            self.flush()
+            self._wfile.write(b'0\r\n\r\n')
+            self.closed = True
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    Read-only HTTP API over utils.headless:
+
+        GET /folders[?parent=ID]                        folders of the base folder or of parent
+        GET /folders/ID/files                           spreadsheet files of a folder
+        GET /workbooks/ID                               file name, revision and tab names
+        GET /workbooks/ID/export?format=F[&sheet=NAME]  tabs streamed as arrow, ndjson or parquet
+
+    Exports are streamed as each tab loads; repeat sheet= for several tabs, all by default.
+    With API_TOKEN set, requests must send it as `Authorization: Bearer <token>`.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        query = parse_qs(url.query)
+        if API_TOKEN and not hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {API_TOKEN}'):
+            self.send_json(401, {'error': 'Missing or wrong API token'})
+            return
+        try:
+            if parts == ['folders']:
+                self.send_json(200, headless.list_folders(query.get('parent', [None])[0]))
+            elif len(parts) == 3 and parts[0] == 'folders' and parts[2] == 'files':
+                self.send_json(200, headless.list_files(parts[1]))
+            elif len(parts) == 2 and parts[0] == 'workbooks':
+                with headless.open_workbook(parts[1]) as workbook:
+                    self.send_json(200, {'file_id': workbook.file_id, 'file_name': workbook.file_name,
+                                         'revision': workbook.revision, 'sheets': workbook.sheet_names})
+            elif len(parts) == 3 and parts[0] == 'workbooks' and parts[2] == 'export':
+                self.export(parts[1], query.get('format', ['ndjson'])[0], query.get('sheet'))
+            else:
+                self.send_json(404, {'error': f'No such endpoint: {url.path}'})
+        except (KeyError, ValueError) as e:
+            self.send_json(400, {'error': e.args[0] if e.args else str(e)})
+        except HttpError as e:
+            self.send_json(e.resp.status, {'error': str(e)})
+        except TimeoutError as e:
+            self.send_json(504, {'error': str(e)})
+        except Exception as e:
+            logger.warning(f'API request {self.path} failed: {e}')
+            self.send_json(500, {'error': str(e)})
+
+    def export(self, file_id, export_format, sheet_names):
+        with headless.open_workbook(file_id) as workbook:
+            # Checked before the response starts, so mistakes still get an error status
+            sheet_names = workbook.check_sheet_names(sheet_names)
+            mime_type = headless.export_mime_type(export_format, len(sheet_names) == 1)
+            self.send_response(200)
+            self.send_header('Content-Type', mime_type)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            response = ChunkedResponse(self.wfile)
+            try:
+                workbook.export(response, export_format, sheet_names)
+            except Exception as e:
+                # Too late for an error status: end the connection without the final chunk
+                logger.warning(f'Export of {file_id} failed: {e}')
+                self.close_connection = True
+                return
+            response.close()
+
+    def send_json(self, status, body):
+        data = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_api_server(host, port, block=False):
+    """Serve the HTTP API; from a daemon thread, or on the calling thread when block is set"""
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    logger.info(f'Serving the HTTP API on {host}:{server.server_address[1]}')
+    if block:
+        server.serve_forever()
+    else:
+        threading.Thread(target=server.serve_forever, name='api-server', daemon=True).start()
+    return server
+
+
+@shared_resource
+def get_api_server():
+    """
+    The HTTP API on API_HOST:API_PORT alongside the app, sharing its caches; started once per
+    server process, None when API_PORT is 0
+    """
+    if not API_PORT:
+        return None
+    return start_api_server(API_HOST, API_PORT)
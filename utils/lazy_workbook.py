@@ -0,0 +1,117 @@
+import logging
+import threading
+from collections.abc import Mapping
+
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class LazySheets(Mapping):
+    """
+    Read-only mapping of sheet name to DataFrame that materialises each sheet on first access
+    load_sheet(sheet_name) returns a (DataFrame, load stats) tuple and is called at most once per
+    sheet, even with concurrent readers. The load stats are kept in sheet_stats.
+    The optional load_many(sheet_names) returns {sheet name: (DataFrame, load stats)} for several
+    sheets at once and is used by ensure_loaded, e.g. to batch API calls.
+    on_load, when set, is called after each sheet is materialised, e.g. by a store re-checking its
+    memory budget as the workbook grows.
+    """
+
+    def __init__(self, sheet_names, load_sheet, load_many=None):
+        self._sheet_names = list(sheet_names)
+        self._load_sheet = load_sheet
+        self._load_many = load_many
+        self._frames = {}
+        self._nbytes = {}
+        self.sheet_stats = {}
+        self._locks = {name: threading.Lock() for name in self._sheet_names}
+        self._prefetching = set()
+        self._prefetch_lock = threading.Lock()
+        self.on_load = None
+
+    def __getitem__(self, sheet_name):
+        if sheet_name not in self._locks:
+            raise KeyError(sheet_name)
+        frame = self._frames.get(sheet_name)
+        if frame is not None:
+            return frame
+        with self._locks[sheet_name]:
+            if sheet_name not in self._frames:
+                with span('load.sheet'):
+                    self._set(sheet_name, *self._load_sheet(sheet_name))
+            return self._frames[sheet_name]
+
+    def __iter__(self):
+        return iter(self._sheet_names)
+
+    def __len__(self):
+        return len(self._sheet_names)
+
+    def _set(self, sheet_name, frame, sheet_stats):
+        self.sheet_stats[sheet_name] = sheet_stats
+        self._nbytes[sheet_name] = int(frame.memory_usage(index=True, deep=True).sum())
+        self._frames[sheet_name] = frame
+        if self.on_load is not None:
+            self.on_load()
+
+    def preload(self, sheet_name, frame, sheet_stats):
+        """Provide a sheet's DataFrame up front, e.g. one carried over from an earlier revision"""
+        with self._locks[sheet_name]:
+            self._set(sheet_name, frame, sheet_stats)
+
+    def is_loaded(self, sheet_name):
+        return sheet_name in self._frames
+
+    def ensure_loaded(self, sheet_names=None):
+        """Materialise the given sheets (all by default), in one load_many call when available"""
+        sheet_names = [name for name in (sheet_names or self._sheet_names) if not self.is_loaded(name)]
+        if self._load_many is None:
+            for sheet_name in sheet_names:
+                self[sheet_name]
+            return
+
+        # Locks are always taken in sheet order, so concurrent calls cannot deadlock
+        locks = [self._locks[name] for name in self._sheet_names if name in sheet_names]
+        for lock in locks:
+            lock.acquire()
+        try:
+            missing = [name for name in sheet_names if not self.is_loaded(name)]
+            if missing:
+                with span('load.sheets', sheets=len(missing)):
+                    for sheet_name, (frame, sheet_stats) in self._load_many(missing).items():
+                        self._set(sheet_name, frame, sheet_stats)
+        finally:
+            for lock in locks:
+                lock.release()
+
+    def prefetch(self, sheet_names, submit):
+        """
+        Load sheets in the background through submit(fn, *args), e.g. a fetch engine's submit
+        Sheets already being prefetched are not submitted again, so repeated calls do not tie up workers
+        """
+        with self._prefetch_lock:
+            sheet_names = [name for name in sheet_names
+                           if name in self._locks and not self.is_loaded(name) and name not in self._prefetching]
+            if not sheet_names:
+                return None
+            self._prefetching.update(sheet_names)
+
+        def done(future):
+            with self._prefetch_lock:
+                self._prefetching.difference_update(sheet_names)
+            _log_prefetch_failure(future)
+
+        future = submit(self.ensure_loaded, sheet_names)
+        future.add_done_callback(done)
+        return future
+
+    def nbytes(self):
+        """Deep memory usage of the sheets materialised so far"""
+        return sum(self._nbytes.values())
+
+
+def _log_prefetch_failure(future):
+    # A failed prefetch is retried when the sheet is actually opened
+    if future.exception() is not None:
+        logger.warning(f'Sheet prefetch failed: {future.exception()}')
@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from config import (ACCESS_STATS_PATH, PREFETCH_FILES, PREFETCH_FOLDERS, PREFETCH_INTERVAL_SECONDS,
+                    PREFETCH_MAX_FILES, PREFETCH_TOP_FILES)
+from services.drive_index import get_drive_index
+from services.google_service import get_fetch_engine, get_file_details, get_google_services
+from utils.resources import shared_resource
+from utils.tracing import span
+from utils.workbook_loader import get_workbook_store, load_workbook, refresh_workbook
+
+logger = logging.getLogger(__name__)
+
+# Days after which an open counts half as much towards a file being hot
+ACCESS_HALF_LIFE_DAYS = 7
+
+
+class AccessStats:
+    """
+    How often each file is opened, decayed over time, persisted as JSON so that a restarted
+    server, or a prefetch worker running beside it, knows which files are hot
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._files = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Read the stats saved by this or another process"""
+        try:
+            with open(self.path) as f:
+                files = json.load(f)
+        except (OSError, ValueError):
+            files = {}
+        with self._lock:
+            self._files = files
+
+    def record(self, file_id, file_type, file_name):
+        """Count an interactive open of a file"""
+        now = time.time()
+        with self._lock:
+            entry = self._files.get(file_id)
+            score = decayed_score(entry, now) if entry else 0.0
+            self._files[file_id] = {'mimeType': file_type, 'name': file_name, 'score': score + 1,
+                                    'last_opened': now}
+            files = dict(self._files)
+        self._save(files)
+
+    def hottest(self, count):
+        """The count most opened files as dicts with id, name and mimeType"""
+        now = time.time()
+        with self._lock:
+            ranked = sorted(self._files.items(), key=lambda item: decayed_score(item[1], now), reverse=True)
+        return [{'id': file_id, 'name': entry['name'], 'mimeType': entry['mimeType']}
+                for file_id, entry in ranked[:count]]
+
+    def _save(self, files):
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(files, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f'Could not save access stats: {e}')
+
+
+def decayed_score(entry, now):
+    return entry['score'] * 0.5 ** ((now - entry['last_opened']) / (ACCESS_HALF_LIFE_DAYS * 86400))
+
+
+class PrefetchScheduler:
+    """
+    Keeps hot workbooks loaded and current in the workbook store and the on-disk cache
+    Every interval, the hot files are listed (the configured files, then the most opened ones,
+    then the files of the configured folders and their subfolders, up to max_files) and each
+    is opened like an interactive open would: unchanged revisions already in memory cost one
+    revision check, a Google Sheet with an older revision in memory is refreshed, parsing only
+    appended rows where possible, and anything else is loaded in full. Files are handled
+    one at a time so interactive sessions keep most of the API quota.
+    """
+
+    def __init__(self, access_stats, interval, folder_ids=(), file_ids=(), top_files=0, max_files=50):
+        self.access_stats = access_stats
+        self.interval = interval
+        self.folder_ids = list(folder_ids)
+        self.file_ids = list(file_ids)
+        self.top_files = top_files
+        self.max_files = max_files
+        self.last_cycle = None
+        self._file_details = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Run cycles on a daemon thread until stop()"""
+        self._thread = threading.Thread(target=self.run, name='prefetch', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        """Run a cycle every interval on the calling thread until stop()"""
+        while not self._stopped.is_set():
+            try:
+                self.run_cycle()
+            except Exception as e:
+                logger.warning(f'Prefetch cycle failed: {e}')
+            self._stopped.wait(self.interval)
+
+    def hot_files(self):
+        """Files to keep loaded, as dicts with id, name and mimeType, most important first"""
+        drive_service, _ = get_google_services()
+        engine = get_fetch_engine()
+        files = []
+        for file_id in self.file_ids:
+            if file_id not in self._file_details:
+                details = get_file_details(drive_service, file_id, engine=engine)
+                self._file_details[file_id] = {'id': file_id, 'name': details['name'],
+                                               'mimeType': details['mimeType']}
+            files.append(self._file_details[file_id])
+        self.access_stats.reload()
+        files += self.access_stats.hottest(self.top_files)
+
+        drive_index = get_drive_index()
+        for folder_id in self.folder_ids:
+            files += drive_index.list_files(folder_id)
+            for folder in drive_index.list_folders(folder_id):
+                files += drive_index.list_files(folder['id'])
+
+        unique = {}
+        for file in files:
+            unique.setdefault(file['id'], file)
+        return list(unique.values())[:self.max_files]
+
+    def run_cycle(self):
+        """Bring every hot file into the caches once; returns the outcome per file"""
+        start = time.perf_counter()
+        with span('prefetch.cycle') as s:
+            outcomes = {}
+            for file in self.hot_files():
+                if self._stopped.is_set():
+                    break
+                try:
+                    outcomes[file['id']] = self.prefetch_file(file)
+                except Exception as e:
+                    # One unreadable file does not stop the cycle; it is retried by the next one
+                    logger.warning(f"Could not prefetch {file['name']}: {e}")
+                    outcomes[file['id']] = f'failed: {e}'
+            s.set(files=len(outcomes))
+        self.last_cycle = {'finished': time.time(), 'seconds': time.perf_counter() - start, 'files': outcomes}
+        logger.info(f'Prefetched {len(outcomes)} files in {self.last_cycle["seconds"]:.2f}s')
+        return outcomes
+
+    def prefetch_file(self, file):
+        """Load or re-validate one file with all its tabs; returns where it was loaded from"""
+        drive_service, sheets_service = get_google_services()
+        engine = get_fetch_engine()
+        store = get_workbook_store()
+        resident = [key for key in store.workbooks() if key[0] == file['id']]
+        old_lease = store.acquire(resident[-1]) if resident else None
+        if old_lease is not None:
+            lease, stats = refresh_workbook(drive_service, sheets_service, old_lease, engine=engine)
+        else:
+            lease, stats = load_workbook(drive_service, sheets_service, file['id'], file['mimeType'], file['name'],
+                                         engine=engine)
+        try:
+            sheets_data = lease.workbook['sheets_data']
+            if hasattr(sheets_data, 'ensure_loaded'):
+                sheets_data.ensure_loaded()
+        finally:
+            lease.release()
+        return stats.get('source', 'refreshed')
+
+
+@shared_resource
+def get_access_stats():
+    """Open counts of this server's files, shared with prefetch workers through ACCESS_STATS_PATH"""
+    return AccessStats(ACCESS_STATS_PATH)
+
+
+def create_prefetch_scheduler():
+    """A scheduler configured from the PREFETCH_* settings"""
+    return PrefetchScheduler(get_access_stats(), PREFETCH_INTERVAL_SECONDS, PREFETCH_FOLDERS, PREFETCH_FILES,
+                             PREFETCH_TOP_FILES, PREFETCH_MAX_FILES)
+
+
+@shared_resource
+def get_prefetch_scheduler():
+    """
+    The prefetch scheduler of this server process, started once; None when
+    PREFETCH_INTERVAL_SECONDS is 0
+    """
+    if not PREFETCH_INTERVAL_SECONDS:
+        return None
+    return create_prefetch_scheduler().start()
@@ -0,0 +1,193 @@
+import importlib.util
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from config import QUERY_ENGINE, QUERY_MEMORY_LIMIT_MB, QUERY_TEMP_DIR, QUERY_THREADS
+from utils.column_index import REGEX_CHARACTERS, TIMESTAMP_TEXT_FORMAT
+from utils.resources import shared_resource
+from utils.workbook_cache import arrow_safe_frame
+
+# Row position column added to every registered sheet, so query results map back to DataFrame rows
+ROW_ID = '__row_id'
+
+class QueryEngine:
+    """
+    Embedded DuckDB database over Arrow views of the loaded sheets
+    Each DataFrame is converted to an Arrow table once (zero-copy for numeric and Arrow string
+    columns) and registered per query on its own cursor, so queries from several sessions run
+    concurrently; DuckDB parallelises each query and spills to disk beyond its memory limit.
+    The database has no access to files, the network or extensions, and its settings are locked,
+    since the SQL panel runs SQL typed by any user of the app.
+    """
+
+    def __init__(self, threads=None, memory_limit_mb=None, temp_dir=None):
+        # DuckDB takes a noticeable share of the app's import time, so it is imported with the first engine
+        import duckdb
+        config = {'enable_external_access': False, 'autoinstall_known_extensions': False,
+                  'autoload_known_extensions': False}
+        if threads:
+            config['threads'] = threads
+        if memory_limit_mb:
+            config['memory_limit'] = f'{memory_limit_mb}MB'
+        if temp_dir:
+            os.makedirs(temp_dir, exist_ok=True)
+            config['temp_directory'] = temp_dir
+        # Set last: no setting can be changed after this one, by a query or otherwise
+        config['lock_configuration'] = True
+        self._connection = duckdb.connect(config=config)
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def arrow_table(self, df):
+        """Arrow copy of a DataFrame with a ROW_ID column, built once and kept while the DataFrame is alive"""
+        key = id(df)
+        with self._lock:
+            table = self._tables.get(key)
+        if table is None:
+            table = pa.Table.from_pandas(arrow_safe_frame(df), preserve_index=False)
+            table = table.append_column(ROW_ID, pa.array(np.arange(len(df), dtype=np.int64)))
+            with self._lock:
+                if key not in self._tables:
+                    self._tables[key] = table
+                    weakref.finalize(df, self._tables.pop, key, None)
+                table = self._tables[key]
+        return table
+
+    def extend_table(self, df, appended_df):
+        """
+        Build the Arrow table of appended_df, a copy of df with rows appended, from the table of df
+        and the new rows only; does nothing when df has no table or the new rows do not fit its schema
+        """
+        with self._lock:
+            table = self._tables.get(id(df))
+        if table is None:
+            return
+        schema = table.schema.remove(table.schema.get_field_index(ROW_ID))
+        try:
+            rows = pa.Table.from_pandas(arrow_safe_frame(appended_df.iloc[len(df):]), schema=schema,
+                                        preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return
+        rows = rows.append_column(ROW_ID, pa.array(np.arange(len(df), len(appended_df), dtype=np.int64)))
+        key = id(appended_df)
+        with self._lock:
+            if key not in self._tables:
+                # Chunks of the existing table are shared, not copied
+                self._tables[key] = pa.concat_tables([table, rows])
+                weakref.finalize(appended_df, self._tables.pop, key, None)
+
+    def query(self, sql, tables, params=None):
+        """
+        Run SQL over the given {table name: DataFrame or Arrow table} and return a DataFrame
+        DataFrames are registered without their ROW_ID column
+        """
+        cursor = self._connection.cursor()
+        try:
+            for name, table in tables.items():
+                if isinstance(table, pd.DataFrame):
+                    table = self.arrow_table(table)
+                    table = table.select(table.column_names[:-1])
+                cursor.register(name, table)
+            return cursor.execute(sql, params or []).df()
+        finally:
+            cursor.close()
+
+    def user_query(self, sql, tables):
+        """
+        Run a single SELECT statement typed by a user over the given tables, as query does
+        Anything else (COPY, ATTACH, SET, INSTALL, several statements...) raises ValueError.
+        """
+        import duckdb
+        statements = duckdb.extract_statements(sql)
+        if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+            raise ValueError('Only a single SELECT statement can be run')
+        return self.query(sql, tables)
+
+    def filter_positions(self, df, filter_settings, search_term=''):
+        """Positions of the rows passing the filters and search, compiled to one WHERE clause"""
+        table = self.arrow_table(df)
+        conditions, params = compile_conditions(table.schema, filter_settings, search_term)
+        if not conditions:
+            return np.arange(len(df))
+        sql = f'SELECT {quote(ROW_ID)} FROM sheet WHERE {" AND ".join(conditions)} ORDER BY {quote(ROW_ID)}'
+        return self.query(sql, {'sheet': table}, params)[ROW_ID].to_numpy()
+
+
+def compile_conditions(schema, filter_settings, search_term=''):
+    """
+    SQL conditions and parameters for a sheet's filters and search
+    Value filters become IN lists; text filters and the search are case-insensitive substring
+    matches, or RE2 regular expressions when the term has regex metacharacters, over the same cell
+    text the column index searches, so filter_rows matches the same rows with either engine
+    """
+    conditions, params = [], []
+    for col, values in filter_settings.items():
+        column = quote(str(col))
+        if isinstance(values, list):
+            text = _is_text(schema.field(str(col)).type)
+            params += [str(value) if text else _python_value(value) for value in values]
+            conditions.append(f'{column} IN ({", ".join(["?"] * len(values))})' if values else 'FALSE')
+        else:
+            condition, param = _contains(column, values, schema.field(str(col)).type)
+            conditions.append(condition)
+            params.append(param)
+
+    if search_term:
+        matches = []
+        for field in schema:
+            if field.name != ROW_ID:
+                condition, param = _contains(quote(field.name), search_term, field.type)
+                matches.append(condition)
+                params.append(param)
+        conditions.append(f'({" OR ".join(matches)})' if matches else 'FALSE')
+    return conditions, params
+
+
+def _contains(column, term, arrow_type):
+    # Cell text as the column index writes it, see column_index.search_text
+    if pa.types.is_timestamp(arrow_type):
+        text = f"strftime({column}, '{TIMESTAMP_TEXT_FORMAT}')"
+    else:
+        text = f'CAST({column} AS VARCHAR)'
+    if REGEX_CHARACTERS.intersection(term):
+        return f"regexp_matches({text}, ?, 'i')", term
+    return f'contains(lower({text}), ?)', term.lower()
+
+
+def _is_text(arrow_type):
+    return pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type) or \
+        pa.types.is_dictionary(arrow_type)
+
+
+def _python_value(value):
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def duckdb_available():
+    """Whether DuckDB is installed, checked without importing it"""
+    return importlib.util.find_spec('duckdb') is not None
+
+
+def quote(name):
+    """Quote a SQL identifier"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+@shared_resource
+def get_query_engine():
+    """
+    Query engine shared by all sessions of this server, or None when DuckDB is not installed or
+    QUERY_ENGINE is set to 'pandas'
+    """
+    if QUERY_ENGINE != 'duckdb' or not duckdb_available():
+        return None
+    return QueryEngine(threads=QUERY_THREADS, memory_limit_mb=QUERY_MEMORY_LIMIT_MB, temp_dir=QUERY_TEMP_DIR)
@@ -0,0 +1,29 @@
+import functools
+import threading
+
+
+def shared_resource(getter):
+    """
+    Cache what a getter returns once per process, for objects shared by every Streamlit session and
+    every headless caller (CLI, HTTP API, batch jobs) of the process
+    Like st.cache_resource for getters without arguments, but it also caches outside a running
+    Streamlit server. A getter that raises is called again next time; getter.clear() drops the
+    cached object.
+    """
+    lock = threading.Lock()
+    cached = []
+
+    @functools.wraps(getter)
+    def get():
+        if not cached:
+            with lock:
+                if not cached:
+                    cached.append(getter())
+        return cached[0]
+
+    def clear():
+        with lock:
+            cached.clear()
+
+    get.clear = clear
+    return get
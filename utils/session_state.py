@@ -17,10 +17,39 @@ def initialize_session_state():
         st.session_state.sheets_data = {}
     if 'sheet_names' not in st.session_state:
         st.session_state.sheet_names = []
+    if 'sheet_properties' not in st.session_state:
+        st.session_state.sheet_properties = {}
     if 'filter_columns' not in st.session_state:
         st.session_state.filter_columns = {}
     if 'file_name' not in st.session_state:
         st.session_state.file_name = ""
+    if 'workbook_lease' not in st.session_state:
+        st.session_state.workbook_lease = None
+    if 'workbook_revision' not in st.session_state:
+        st.session_state.workbook_revision = None
+    if 'load_stats' not in st.session_state:
+        st.session_state.load_stats = None
+    if 'refresh_stats' not in st.session_state:
+        st.session_state.refresh_stats = None
     if 'base_folder_id' not in st.session_state:
         # Default to configured base folder ID
-        st.session_state.base_folder_id = DEFAULT_BASE_FOLDER_ID
\ No newline at end of file
+        st.session_state.base_folder_id = DEFAULT_BASE_FOLDER_ID
+
+def release_workbook():
+    """Release the session's lease on its shared workbook so the store may evict it"""
+    if st.session_state.workbook_lease is not None:
+        st.session_state.workbook_lease.release()
+        st.session_state.workbook_lease = None
+
+
+def set_workbook(lease, load_stats):
+    """Point the session at a shared workbook, releasing the lease on the previous one"""
+    if st.session_state.workbook_lease is not lease:
+        release_workbook()
+    st.session_state.workbook_lease = lease
+    st.session_state.sheet_names = lease.workbook['sheet_names']
+    st.session_state.sheet_properties = lease.workbook['sheet_properties']
+    st.session_state.sheets_data = lease.workbook['sheets_data']
+    st.session_state.file_name = lease.workbook['file_name']
+    st.session_state.workbook_revision = lease.workbook['revision']
+    st.session_state.load_stats = load_stats
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from services.google_service import cell_range, get_sheet_ranges, row_range
+from utils.data_processing import column_names, infer_column, value_columns
+from utils.tracing import span
+
+
+def fetch_header(sheets_service, file_id, sheet_name, column_count, stats=None, engine=None):
+    """A Google Sheet tab's column names, named as values_to_dataframe names them, from its first row only"""
+    header, = get_sheet_ranges(sheets_service, file_id, [row_range(sheet_name, 1, 1)], stats=stats, engine=engine)
+    return column_names(header[0] if header else [], column_count)
+
+
+def column_runs(positions):
+    """Sorted column positions grouped into (first, last) runs of adjacent columns"""
+    runs = []
+    for position in sorted(positions):
+        if runs and position == runs[-1][1] + 1:
+            runs[-1][1] = position
+        else:
+            runs.append([position, position])
+    return [tuple(run) for run in runs]
+
+
+def fetch_window(sheets_service, file_id, sheet_name, header, columns, first_row, row_count, stats=None,
+                 engine=None):
+    """
+    Rows first_row..first_row + row_count - 1 of the given columns of a Google Sheet tab, data rows
+    counted from 0 below the header, as a DataFrame typed like values_to_dataframe types a tab
+    Only these cells are transferred: the columns are grouped into runs of adjacent columns, each
+    read as one A1 range of one values().batchGet call. Types are inferred from the window alone,
+    so they can differ from those of the whole tab. The window is shorter than row_count past the
+    last row with data.
+    """
+    positions = [header.index(column) for column in columns]
+    runs = column_runs(positions)
+    with span('load.window', columns=len(positions), rows=row_count):
+        ranges = [cell_range(sheet_name, first_row + 2, first_row + row_count + 1, first, last)
+                  for first, last in runs]
+        run_values = get_sheet_ranges(sheets_service, file_id, ranges, stats=stats, engine=engine)
+
+        # Each range leaves out its own trailing blank rows; blank cells below them are padded in
+        rows = max((len(values) for values in run_values), default=0)
+        cells = {}
+        for (first, last), values in zip(runs, run_values):
+            for offset, column in enumerate(value_columns(values, last - first + 1)):
+                padding = np.full(rows - len(column), None, dtype=object)
+                cells[first + offset] = infer_column(np.concatenate([column, padding]))
+        return pd.DataFrame({column: cells[position] for column, position in zip(columns, positions)})
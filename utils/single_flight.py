@@ -0,0 +1,116 @@
+import contextvars
+import logging
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from utils.tracing import run_in_context
+
+logger = logging.getLogger(__name__)
+
+# Cancellation event of the flight running in the current context, checked before each API call
+_cancelled = contextvars.ContextVar('flight_cancelled', default=None)
+
+
+class FlightCancelled(Exception):
+    """Raised inside a flight whose callers have all stopped waiting for it"""
+
+
+def raise_if_cancelled():
+    """Stop the current flight, if any, once nobody waits for it any more"""
+    cancelled = _cancelled.get()
+    if cancelled is not None and cancelled.is_set():
+        raise FlightCancelled('Abandoned by all callers')
+
+
+class Flight:
+    """One in-flight call and the callers waiting for its result"""
+
+    def __init__(self):
+        self.future = Future()
+        self.waiters = 0
+        self.cancelled = threading.Event()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one call whose result every caller shares
+    The call runs on its own thread while callers wait, each for at most its timeout. When every
+    caller has stopped waiting (timed out or interrupted, e.g. by a Streamlit rerun) before the call
+    finished, the flight is cancelled: API calls made by its thread raise FlightCancelled from the
+    next request or download chunk on, and the next caller starts a new flight.
+    """
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout
+        # flights: calls made; coalesced: calls avoided by joining one in flight
+        self.stats = {'flights': 0, 'coalesced': 0, 'timeouts': 0, 'cancelled': 0}
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """
+        Result of fn(), shared with concurrent callers using the same key
+        Returns a tuple of (result, shared), shared being whether another caller's flight was joined;
+        raises what fn() raised, or TimeoutError after timeout seconds (self.timeout by default, no
+        limit when None or 0)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            shared = flight is not None
+            if shared:
+                self.stats['coalesced'] += 1
+            else:
+                flight = self._flights[key] = Flight()
+                self.stats['flights'] += 1
+            flight.waiters += 1
+        if not shared:
+            threading.Thread(target=run_in_context(self._run), args=(key, flight, fn), name=f'{self.name}-flight',
+                             daemon=True).start()
+
+        timeout = timeout if timeout is not None else self.timeout
+        try:
+            return flight.future.result(timeout or None), shared
+        except FutureTimeoutError:
+            with self._lock:
+                self.stats['timeouts'] += 1
+            raise TimeoutError(f'{self.name} of {key} still running after {timeout}s') from None
+        finally:
+            self._leave(key, flight)
+
+    def _run(self, key, flight, fn):
+        _cancelled.set(flight.cancelled)
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, flight, exception=e)
+        else:
+            self._finish(key, flight, result=result)
+
+    def _finish(self, key, flight, result=None, exception=None):
+        # Under the lock, so a flight is either finished or cancelled, never both
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if exception is not None:
+                flight.future.set_exception(exception)
+            else:
+                flight.future.set_result(result)
+        if isinstance(exception, FlightCancelled):
+            logger.info(f'{self.name} of {key} cancelled')
+
+    def _leave(self, key, flight):
+        with self._lock:
+            flight.waiters -= 1
+            if flight.waiters or flight.future.done():
+                return
+            flight.cancelled.set()
+            self.stats['cancelled'] += 1
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def in_flight(self):
+        """Keys of the calls running now"""
+        with self._lock:
+            return list(self._flights)
@@ -0,0 +1,232 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_PORT, TRACE_LOG, TRACING_ENABLED
+from utils.resources import shared_resource
+
+logger = logging.getLogger(__name__)
+
+# Spans of the trace being recorded in the current context, and the depth of the innermost open span
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_depth = contextvars.ContextVar('span_depth', default=0)
+
+
+class Span:
+    """A timed section of work with numeric or text attributes, e.g. rows, bytes or api_calls"""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.seconds = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._depth_token = _depth.set(_depth.get() + 1)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        depth = _depth.get() - 1
+        _depth.reset(self._depth_token)
+        # Streamlit's st.rerun and st.stop unwind through BaseException and are not errors
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.attributes['error'] = exc_type.__name__
+        METRICS.record(self.name, self.seconds, self.attributes)
+        spans = _current_trace.get()
+        if spans is not None:
+            spans.append({'name': self.name, 'depth': depth, 'seconds': self.seconds,
+                          'thread': threading.current_thread().name, **self.attributes})
+        return False
+
+
+class NoopSpan:
+    """Stand-in returned by span() while tracing is disabled, so instrumented code costs next to nothing"""
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def tracing_enabled():
+    """Whether spans are recorded; guards attributes that are costly to compute, like deep memory usage"""
+    return TRACING_ENABLED
+
+
+def span(name, **attributes):
+    """Time a block: `with span('sheets.values.get', sheet=name) as s: ... s.set(bytes=n)`"""
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+
+class Trace:
+    """
+    Collects the spans finished in the current context from start() on, including those of work
+    handed to the fetch engine's worker threads; spans are kept in finishing order
+    Used as a context manager, or with start() and finish() around a whole script run.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self._start = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self._start
+
+    def start(self):
+        self._start = time.perf_counter()
+        return _current_trace.set(self.spans)
+
+    def finish(self):
+        """Log the trace as one JSON line when TRACE_LOG is set"""
+        if TRACE_LOG and self.spans:
+            logger.info(json.dumps({'trace': self.name, 'seconds': round(self.seconds, 6), 'spans': self.spans},
+                                   default=str))
+
+    def __enter__(self):
+        self._token = self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self._token)
+        self.finish()
+        return False
+
+
+def trace(name):
+    """Record the spans of a block, e.g. one script run, for the debug panel"""
+    return Trace(name)
+
+
+def run_in_context(fn):
+    """Wrap fn so it runs in a copy of the caller's context, carrying the current trace to another thread"""
+    if not TRACING_ENABLED:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+class Metrics:
+    """
+    Process-wide totals per span name: call count, seconds and the sum of each numeric attribute,
+    plus gauges read on demand; rendered in the Prometheus text format
+    """
+
+    def __init__(self):
+        self._spans = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, attributes):
+        with self._lock:
+            totals = self._spans.setdefault(name, {'count': 0, 'seconds': 0.0})
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            if 'error' in attributes:
+                totals['errors'] = totals.get('errors', 0) + 1
+            for key, value in attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+
+    def gauge(self, name, read):
+        """Register a gauge whose current value is read() at scrape time"""
+        with self._lock:
+            self._gauges[name] = read
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(totals) for name, totals in self._spans.items()}
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = ['# TYPE spreadsheet_explorer_span_count counter',
+                 '# TYPE spreadsheet_explorer_span_seconds counter']
+        for name, totals in sorted(self.snapshot().items()):
+            label = '{span="%s"}' % name.replace('\\', '\\\\').replace('"', '\\"')
+            for key, value in totals.items():
+                lines.append(f'spreadsheet_explorer_span_{metric_name(key)}{label} {value}')
+        with self._lock:
+            gauges = dict(self._gauges)
+        for name, read in sorted(gauges.items()):
+            try:
+                value = read()
+            except Exception as e:
+                logger.warning(f'Could not read gauge {name}: {e}')
+                continue
+            lines += [f'# TYPE spreadsheet_explorer_{name} gauge', f'spreadsheet_explorer_{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+def metric_name(key):
+    """Prometheus-safe metric name for a span attribute"""
+    return ''.join(c if c.isalnum() else '_' for c in key).lower()
+
+
+METRICS = Metrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('', '/metrics'):
+            self.send_error(404)
+            return
+        body = METRICS.prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not worth a log line each
+        pass
+
+
+def start_metrics_server(port):
+    """Serve /metrics on the given port from a daemon thread; returns the server"""
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f'Serving metrics on port {server.server_address[1]}')
+    return server
+
+
+@shared_resource
+def get_metrics_server():
+    """
+    The /metrics endpoint on METRICS_PORT, started once per server process, with gauges for the
+    shared caches, the fetch engine and coalesced workbook loads; None when METRICS_PORT is 0
+    """
+    if not METRICS_PORT:
+        return None
+    # Imported here: these modules are themselves instrumented with this one
+    from services.google_service import get_fetch_engine
+    from utils.derivation_cache import get_derivation_cache
+    from utils.workbook_loader import get_workbook_flights, get_workbook_store
+
+    store, cache, engine = get_workbook_store(), get_derivation_cache(), get_fetch_engine()
+    METRICS.gauge('workbook_store_bytes', store.total_bytes)
+    METRICS.gauge('derivation_cache_bytes', cache.total_bytes)
+    for key in engine.stats:
+        METRICS.gauge(f'fetch_engine_{key}_total', lambda key=key: engine.stats[key])
+    flights = get_workbook_flights()
+    for key in flights.stats:
+        METRICS.gauge(f'workbook_load_{key}_total', lambda key=key: flights.stats[key])
+    METRICS.gauge('workbook_loads_in_flight', lambda: len(flights.in_flight()))
+    return start_metrics_server(METRICS_PORT)
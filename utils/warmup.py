@@ -0,0 +1,66 @@
+import importlib
+import logging
+import threading
+import time
+
+from config import DEFAULT_BASE_FOLDER_ID, WARM_UP_ON_START
+from utils.resources import shared_resource
+
+logger = logging.getLogger(__name__)
+
+# Modules imported on first use rather than with the app, imported ahead of that use by the warm-up
+LAZY_MODULES = ['google.oauth2.service_account', 'googleapiclient.discovery', 'googleapiclient.http',
+                'google_auth_httplib2', 'xlsxwriter', 'openpyxl', 'python_calamine']
+
+# Folders under the base folder whose file listings are fetched by the warm-up, in name order
+WARM_UP_FOLDERS = 5
+
+
+def warm_up():
+    """
+    Pay the one-off costs of a fresh server process ahead of the sessions that would wait on them
+    Imports the lazily imported modules, builds the Google clients, fetch engine and query engine,
+    and lists the base folder and the files of its first folders into the shared Drive index.
+    Each step is independent: one that fails is logged and left to run when first needed.
+    """
+    # Imported here: the getters pull in most of the app, which imports this module
+    from services.drive_index import get_drive_index
+    from services.google_service import get_fetch_engine, get_google_services
+    from utils.query_engine import get_query_engine
+
+    start = time.perf_counter()
+    for name in LAZY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            # Optional modules that are not installed
+            pass
+
+    for step in (get_google_services, get_fetch_engine, get_query_engine):
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f'Warm-up step {step.__name__} failed: {e}')
+
+    if DEFAULT_BASE_FOLDER_ID:
+        try:
+            drive_index = get_drive_index()
+            folders = drive_index.list_folders(DEFAULT_BASE_FOLDER_ID)
+            engine = get_fetch_engine()
+            engine.map(drive_index.list_files, [folder['id'] for folder in folders[:WARM_UP_FOLDERS]])
+        except Exception as e:
+            logger.warning(f'Warm-up of the Drive index failed: {e}')
+    logger.info(f'Warm-up finished in {time.perf_counter() - start:.2f}s')
+
+
+@shared_resource
+def get_warm_up():
+    """
+    Start the warm-up once per server process, on a daemon thread so the first script run renders
+    meanwhile; returns the thread, or None when WARM_UP_ON_START is off
+    """
+    if not WARM_UP_ON_START:
+        return None
+    thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,309 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+
+# Parquet schema metadata key holding a tab's own metadata
+TAB_METADATA_KEY = b'spreadsheet_explorer'
+
+# Parquet schema metadata key holding a tab's column labels, which Parquet stores as strings
+COLUMN_LABELS_KEY = b'spreadsheet_explorer_columns'
+
+# Parquet schema metadata key listing a tab's mixed-type columns, stored as text plus a type code per cell
+MIXED_COLUMNS_KEY = b'spreadsheet_explorer_mixed'
+
+
+class WorkbookCache:
+    """
+    On-disk cache of parsed workbooks shared by all sessions (and processes) on the host
+    Each entry is a directory keyed by (file ID, revision) holding a manifest and one Parquet file
+    per cached tab; tabs may be added one at a time as they are first loaded. Entries are evicted
+    least-recently-used once the cache exceeds max_bytes
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _entry_dir(self, file_id, revision):
+        digest = hashlib.sha1(f'{file_id}:{revision}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest)
+
+    def get_manifest(self, file_id, revision):
+        """Return the manifest of a cached workbook revision and mark it as recently used, or None"""
+        manifest_path = os.path.join(self._entry_dir(file_id, revision), MANIFEST_FILE)
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            os.utime(manifest_path)
+        except (OSError, ValueError):
+            return None
+        return manifest
+
+    def _tab_path(self, file_id, revision, manifest, sheet_name):
+        return os.path.join(self._entry_dir(file_id, revision), f"{manifest['sheet_names'].index(sheet_name)}.parquet")
+
+    def load_tab(self, file_id, revision, sheet_name, manifest=None):
+        """Read one cached tab, or None when it is not cached"""
+        manifest = manifest or self.get_manifest(file_id, revision)
+        if manifest is None or sheet_name not in manifest['sheet_names']:
+            return None
+        try:
+            table = pq.read_table(self._tab_path(file_id, revision, manifest, sheet_name))
+        except (OSError, pa.ArrowInvalid):
+            return None
+        schema_metadata = table.schema.metadata or {}
+        mixed = json.loads(schema_metadata[MIXED_COLUMNS_KEY]) if MIXED_COLUMNS_KEY in schema_metadata else None
+        if mixed is not None:
+            n_columns = table.num_columns - len(mixed['columns'])
+            codes = [table.column(n_columns + i).to_numpy() for i in range(len(mixed['columns']))]
+            table = table.select(range(n_columns))
+        df = table.to_pandas()
+        if mixed is not None:
+            for position, column_codes in zip(mixed['columns'], codes):
+                df.isetitem(position, untag_values(df.iloc[:, position].to_numpy(), column_codes, mixed['types']))
+        if COLUMN_LABELS_KEY in schema_metadata:
+            df.columns = decode_labels(json.loads(schema_metadata[COLUMN_LABELS_KEY]))
+        # Parquet only records 'string'; restore the Arrow-backed storage the sheet was built with
+        for i in np.flatnonzero((df.dtypes == 'string').to_numpy()):
+            df.isetitem(i, df.iloc[:, i].astype('string[pyarrow]'))
+        return df
+
+    def has_tab(self, file_id, revision, sheet_name):
+        """Whether a tab of a workbook revision is cached"""
+        manifest = self.get_manifest(file_id, revision) if self.enabled else None
+        if manifest is None or sheet_name not in manifest['sheet_names']:
+            return False
+        return os.path.exists(self._tab_path(file_id, revision, manifest, sheet_name))
+
+    def load_tab_metadata(self, file_id, revision, sheet_name, manifest=None):
+        """The metadata stored with a cached tab, or None"""
+        manifest = manifest or self.get_manifest(file_id, revision)
+        if manifest is None or sheet_name not in manifest['sheet_names']:
+            return None
+        try:
+            schema_metadata = pq.read_schema(self._tab_path(file_id, revision, manifest, sheet_name)).metadata
+        except (OSError, pa.ArrowInvalid):
+            return None
+        if not schema_metadata or TAB_METADATA_KEY not in schema_metadata:
+            return None
+        return json.loads(schema_metadata[TAB_METADATA_KEY])
+
+    def store_manifest(self, file_id, revision, file_name, sheet_names, sheet_properties=None):
+        """Record a workbook revision's tab names (and grid sizes) so its tabs can be cached one at a time"""
+        if not self.enabled:
+            return
+        entry_dir = self._entry_dir(file_id, revision)
+        manifest_path = os.path.join(entry_dir, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            return
+        manifest = {'file_id': file_id, 'revision': revision, 'file_name': file_name,
+                    'sheet_names': list(sheet_names), 'sheet_properties': sheet_properties or {}}
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            self._write_atomic(manifest_path, lambda path: _write_json(path, manifest))
+        except OSError as e:
+            logger.warning(f'Could not cache workbook {file_id}: {e}')
+
+    def store_tab(self, file_id, revision, sheet_name, df, metadata=None):
+        """
+        Write one tab of a workbook revision whose manifest is stored, then evict over the size cap
+        metadata is an optional JSON-serialisable dict kept in the Parquet footer, see load_tab_metadata
+        """
+        if not self.enabled:
+            return
+        manifest = self.get_manifest(file_id, revision)
+        if manifest is None or sheet_name not in manifest['sheet_names']:
+            return
+        tab_path = self._tab_path(file_id, revision, manifest, sheet_name)
+        if os.path.exists(tab_path):
+            return
+        try:
+            tagged, mixed = tag_mixed_columns(df)
+            table = pa.Table.from_pandas(arrow_safe_frame(tagged), preserve_index=False)
+            schema_metadata = dict(table.schema.metadata or {})
+            if mixed is not None:
+                schema_metadata[MIXED_COLUMNS_KEY] = json.dumps(mixed).encode('utf-8')
+            if metadata is not None:
+                schema_metadata[TAB_METADATA_KEY] = json.dumps(metadata).encode('utf-8')
+            labels = encode_labels(df.columns)
+            if labels is not None:
+                schema_metadata[COLUMN_LABELS_KEY] = json.dumps(labels).encode('utf-8')
+            table = table.replace_schema_metadata(schema_metadata)
+            self._write_atomic(tab_path, lambda path: pq.write_table(table, path))
+        except OSError as e:
+            # The entry may have been evicted meanwhile
+            logger.warning(f'Could not cache sheet {sheet_name} of {file_id}: {e}')
+            return
+        except (ValueError, TypeError, pa.ArrowException) as e:
+            # pyarrow raises ArrowInvalid/ArrowTypeError for columns it cannot represent, and other
+            # ArrowExceptions (e.g. ArrowNotImplementedError) for types Parquet cannot store; mixed columns
+            # holding cells of a type tag_mixed_columns cannot restore raise TypeError. Caching is
+            # best-effort, so the tab is just not cached
+            logger.warning(f'Could not convert sheet {sheet_name} of {file_id} to Parquet: {e}')
+            return
+        self.evict()
+
+    def _write_atomic(self, path, write):
+        """Write through a temporary file and rename it, so readers never see partial files"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def evict(self):
+        """Remove least-recently-used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                entry_dir = os.path.join(self.cache_dir, name)
+                manifest_path = os.path.join(entry_dir, MANIFEST_FILE)
+                if name.startswith('.') or not os.path.exists(manifest_path):
+                    continue
+                try:
+                    size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+                    entries.append((os.path.getmtime(manifest_path), size, entry_dir))
+                except OSError:
+                    # Evicted by another process meanwhile
+                    continue
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def arrow_safe_frame(df):
+    """
+    Make a DataFrame writable as Parquet: string column names and no mixed-type object columns
+    Mixed object columns (common in Excel data) keep their nulls and have every other value stringified
+    """
+    df = df.copy(deep=False)
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns[df.dtypes == object]:
+        values = df[col].dropna()
+        if len(values) and values.map(type).nunique() > 1:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+# Cell types a mixed-type column can hold in the cache: (name, type, text of a value, value of the text)
+CELL_TYPES = [
+    ('none', type(None), lambda value: '', lambda text: None),
+    ('nat', type(pd.NaT), lambda value: '', lambda text: pd.NaT),
+    ('str', str, str, str),
+    ('bool', bool, str, lambda text: text == 'True'),
+    ('int', int, str, int),
+    ('float', float, str, float),
+    ('numpy.bool', np.bool_, str, lambda text: np.bool_(text == 'True')),
+    ('numpy.int64', np.int64, str, np.int64),
+    ('numpy.float64', np.float64, str, np.float64),
+    ('timestamp', pd.Timestamp, lambda value: value.isoformat(), pd.Timestamp),
+    ('datetime', datetime.datetime, lambda value: value.isoformat(), datetime.datetime.fromisoformat),
+    ('date', datetime.date, lambda value: value.isoformat(), datetime.date.fromisoformat),
+    ('time', datetime.time, lambda value: value.isoformat(), datetime.time.fromisoformat),
+    ('timedelta', datetime.timedelta, lambda value: str(value // datetime.timedelta(microseconds=1)),
+     lambda text: datetime.timedelta(microseconds=int(text))),
+]
+_CELL_TYPE_CODES = {cell_type: code for code, (_, cell_type, _, _) in enumerate(CELL_TYPES)}
+
+
+def tag_mixed_columns(df):
+    """
+    Store mixed-type object columns as text plus a type code per cell, so cached tabs read back as parsed
+    Returns the frame with those columns as text and their codes appended as int8 columns, and the
+    metadata untag_values needs, or (df, None) when there are no mixed columns. Raises TypeError for
+    cells of a type not in CELL_TYPES.
+    """
+    positions = [position for position in np.flatnonzero((df.dtypes == object).to_numpy())
+                 if df.iloc[:, position].dropna().map(type).nunique() > 1]
+    if not positions:
+        return df, None
+    df = df.copy(deep=False)
+    codes = []
+    for position in positions:
+        values = df.iloc[:, position]
+        try:
+            column_codes = np.array([_CELL_TYPE_CODES[type(value)] for value in values], dtype=np.int8)
+        except KeyError as e:
+            raise TypeError(f'Cannot cache cells of type {e.args[0].__name__}')
+        df.isetitem(position, [CELL_TYPES[code][2](value) for code, value in zip(column_codes, values)])
+        codes.append(column_codes)
+    codes = pd.DataFrame({f'__cell_types_{position}__': column_codes
+                          for position, column_codes in zip(positions, codes)}, index=df.index)
+    mixed = {'columns': [int(position) for position in positions], 'types': [name for name, *_ in CELL_TYPES]}
+    return pd.concat([df, codes], axis=1), mixed
+
+
+def untag_values(texts, codes, type_names):
+    """Values of a mixed-type column from its text and type codes, see tag_mixed_columns"""
+    parsers = {name: parse for name, _, _, parse in CELL_TYPES}
+    values = np.empty(len(texts), dtype=object)
+    for code in np.unique(codes):
+        parse = parsers[type_names[code]]
+        for row in np.flatnonzero(codes == code):
+            values[row] = parse(texts[row])
+    return values
+
+
+def encode_labels(labels):
+    """
+    Column labels as JSON, non-string labels tagged with their type, or None when they are all
+    strings (or of a type not kept) and the Parquet column names already hold them
+    """
+    encoded = []
+    for label in labels:
+        if isinstance(label, str):
+            encoded.append(label)
+        elif isinstance(label, (bool, np.bool_)):
+            encoded.append({'bool': bool(label)})
+        elif isinstance(label, (int, np.integer)):
+            encoded.append({'int': int(label)})
+        elif isinstance(label, (float, np.floating)):
+            encoded.append({'float': float(label)})
+        elif isinstance(label, (datetime.date, np.datetime64)):
+            encoded.append({'timestamp': pd.Timestamp(label).isoformat()})
+        else:
+            return None
+    return None if all(isinstance(label, str) for label in encoded) else encoded
+
+
+def decode_labels(encoded):
+    """Column labels written by encode_labels"""
+    labels = []
+    for label in encoded:
+        if isinstance(label, dict):
+            (kind, value), = label.items()
+            label = pd.Timestamp(value) if kind == 'timestamp' else value
+        labels.append(label)
+    return labels
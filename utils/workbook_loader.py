@@ -0,0 +1,501 @@
+import logging
+import os
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+from config import (SHEETS_EXPORT_MAX_CELLS, SHEETS_EXPORT_MIN_TABS, SHEETS_INGESTION, WORKBOOK_CACHE_DIR,
+                    WORKBOOK_CACHE_MAX_MB, WORKBOOK_LOAD_TIMEOUT_SECONDS, WORKBOOK_STORE_MAX_MB)
+from services.google_service import (batch_get_sheet_data, chunk_ranges, get_fetch_engine, get_file_revision,
+                                     get_sheet_data, get_sheet_ranges, get_spreadsheet_properties, row_range)
+from utils.column_index import extend_sheet_index
+from utils.column_profile import extend_sheet_profile
+from utils.data_processing import append_rows, values_to_dataframe
+from utils.excel_reader import ExcelWorkbookReader
+from utils.file_operations import download_excel_to_temp
+from utils.lazy_workbook import LazySheets
+from utils.query_engine import get_query_engine
+from utils.resources import shared_resource
+from utils.single_flight import SingleFlight
+from utils.tracing import span
+from utils.workbook_cache import WorkbookCache
+from utils.workbook_store import WorkbookStore
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_SHEETS_MIME_TYPE = 'application/vnd.google-apps.spreadsheet'
+
+# Rows of a loaded tab sampled into its fingerprint and re-read on refresh to check the tab was only appended to
+REFRESH_PROBE_ROWS = 8
+
+
+@shared_resource
+def get_workbook_cache():
+    """On-disk workbook cache shared by all sessions of this server"""
+    return WorkbookCache(WORKBOOK_CACHE_DIR, WORKBOOK_CACHE_MAX_MB * 1024 * 1024)
+
+
+@shared_resource
+def get_workbook_store():
+    """In-memory workbook store shared by all sessions of this server process"""
+    return WorkbookStore(WORKBOOK_STORE_MAX_MB * 1024 * 1024)
+
+
+@shared_resource
+def get_workbook_flights():
+    """
+    Opens and refreshes in flight in this server process, keyed by (file ID, revision, mode), so
+    that concurrent sessions share one instead of each fetching the same workbook
+    """
+    return SingleFlight('Workbook load', WORKBOOK_LOAD_TIMEOUT_SECONDS)
+
+
+def load_workbook(drive_service, sheets_service, file_id, file_type, file_name='', engine=None):
+    """
+    Open a Google Sheet or Excel file; tab data is only loaded when a tab is first accessed
+    The Drive revision is checked first (one files().get call); a revision already resident in
+    the shared workbook store is reused as is. Otherwise only the tab names (and grid sizes for
+    Google Sheets) are fetched, or read from the on-disk cache, and each tab is later read from
+    the disk cache or fetched from Google and cached. Sessions opening the same revision at the
+    same time share one open, and so one workbook whose tabs each load once.
+    Returns a tuple of (lease on the shared workbook, load_stats); lease.workbook is a dict with
+    sheet_names, sheet_properties, sheets_data, file_name and revision
+    """
+    with span('load.workbook') as s:
+        start = time.perf_counter()
+        store = get_workbook_store()
+        load_stats = {'api_calls': 0, 'bytes': 0}
+        revision = get_file_revision(drive_service, file_id, stats=load_stats, engine=engine)
+
+        lease = store.acquire((file_id, revision))
+        if lease is not None:
+            load_stats.update(source='shared memory', seconds=time.perf_counter() - start)
+            s.set(source='shared memory')
+            return lease, load_stats
+
+        mode = 'google_sheets' if file_type == GOOGLE_SHEETS_MIME_TYPE else 'excel'
+        (workbook, open_stats), shared = get_workbook_flights().do(
+            (file_id, revision, mode),
+            lambda: open_workbook(drive_service, sheets_service, file_id, file_type, file_name, revision, engine))
+        if shared:
+            # The API calls were made, and counted, by the session that started the open
+            load_stats['source'] = f"{open_stats['source']}, shared with a concurrent open"
+        else:
+            load_stats = dict(open_stats, api_calls=load_stats['api_calls'] + open_stats['api_calls'],
+                              bytes=load_stats['bytes'] + open_stats['bytes'])
+
+        load_stats['seconds'] = time.perf_counter() - start
+        s.set(source=load_stats['source'], api_calls=load_stats['api_calls'], bytes=load_stats['bytes'],
+              coalesced=int(shared))
+        logger.info(f"Opened {file_id}@{revision} from {load_stats['source']} in {load_stats['seconds']:.2f}s")
+        return store.put((file_id, revision), workbook), load_stats
+
+
+def open_workbook(drive_service, sheets_service, file_id, file_type, file_name, revision, engine=None):
+    """
+    Open one revision of a Google Sheet or Excel file
+    Returns a tuple of (workbook dict as kept in the workbook store, open_stats)
+    """
+    cache = get_workbook_cache()
+    open_stats = {'api_calls': 0, 'bytes': 0}
+    if file_type == GOOGLE_SHEETS_MIME_TYPE:
+        sheets_data, file_name, sheet_properties = open_google_spreadsheet(sheets_service, file_id, revision, cache,
+                                                                           open_stats, engine, drive_service)
+    else:
+        sheets_data, file_name, sheet_properties = open_excel_workbook(drive_service, file_id, revision, file_name,
+                                                                       cache, open_stats, engine)
+    return {
+        'sheet_names': list(sheets_data),
+        'sheet_properties': sheet_properties,
+        'sheets_data': sheets_data,
+        'file_name': file_name,
+        'revision': revision,
+        'file_type': file_type,
+    }, open_stats
+
+
+def sheets_ingestion(sheet_properties):
+    """
+    'export' or 'values': how to fetch the tabs of a Google Sheet with the given grid sizes
+    Follows SHEETS_INGESTION, choosing by tab count and grid cells when it is 'auto'. Parsing an
+    export takes longer than parsing values, so it is only picked when it saves Sheets read quota:
+    one Drive call in place of a values().batchGet per BATCH_GET_MAX_RANGES tabs.
+    """
+    if SHEETS_INGESTION != 'auto':
+        return SHEETS_INGESTION
+    cells = sum(properties['rowCount'] * properties['columnCount'] for properties in sheet_properties.values())
+    return 'export' if len(sheet_properties) >= SHEETS_EXPORT_MIN_TABS and cells <= SHEETS_EXPORT_MAX_CELLS \
+        else 'values'
+
+
+def open_google_spreadsheet(sheets_service, file_id, revision, cache, load_stats, engine=None, drive_service=None):
+    """
+    Open a Google Sheet whose tabs are fetched only when first accessed
+    Sheet names and grid sizes come from the disk cache manifest or one spreadsheets().get call.
+    Single tabs are fetched with values().get, several at once with chunked values().batchGet.
+    Given a drive_service, and when sheets_ingestion picks it, tabs are instead parsed from one
+    Drive export of the whole spreadsheet as .xlsx, made when the first tab is opened; cells are
+    written out as plain text and parsed like fetched values. Should the export fail (Drive refuses
+    exports over 10 MB), the remaining tabs are fetched with values().get.
+    Returns a tuple of (LazySheets, file_name, sheet_properties)
+    """
+    manifest = cache.get_manifest(file_id, revision) if cache.enabled else None
+    if manifest is None:
+        sheet_properties, file_name = get_spreadsheet_properties(sheets_service, file_id, stats=load_stats,
+                                                                 engine=engine)
+        cache.store_manifest(file_id, revision, file_name, list(sheet_properties), sheet_properties)
+        load_stats['source'] = 'Google Sheets API'
+    else:
+        sheet_properties, file_name = manifest.get('sheet_properties', {}), manifest['file_name']
+        load_stats['source'] = 'disk cache'
+    sheet_names = manifest['sheet_names'] if manifest else list(sheet_properties)
+
+    def load_cached(sheet_name):
+        start = time.perf_counter()
+        df = cache.load_tab(file_id, revision, sheet_name) if cache.enabled else None
+        if df is not None:
+            metadata = cache.load_tab_metadata(file_id, revision, sheet_name) or {}
+            return df, {'source': 'disk cache', 'seconds': time.perf_counter() - start,
+                        'fingerprint': metadata.get('fingerprint')}
+        return None
+
+    def load_sheet(sheet_name):
+        cached = load_cached(sheet_name)
+        if cached is not None:
+            return cached
+        return load_values(sheet_name)
+
+    def load_values(sheet_name):
+        start = time.perf_counter()
+        sheet_stats = {'source': 'Google Sheets API', 'api_calls': 0, 'bytes': 0}
+        values = get_sheet_data(sheets_service, file_id, sheet_name, stats=sheet_stats, engine=engine)
+        df = values_to_dataframe(values)
+        sheet_stats['seconds'] = time.perf_counter() - start
+        sheet_stats['fingerprint'] = values_fingerprint(values)
+        cache.store_tab(file_id, revision, sheet_name, df, {'fingerprint': sheet_stats['fingerprint']})
+        return df, sheet_stats
+
+    def load_many(names):
+        loaded = {}
+        for sheet_name in names:
+            cached = load_cached(sheet_name)
+            if cached is not None:
+                loaded[sheet_name] = cached
+        missing = [name for name in names if name not in loaded]
+        if missing:
+            start = time.perf_counter()
+            values_by_sheet, batch_stats = batch_get_sheet_data(sheets_service, file_id, missing, engine=engine)
+            seconds = time.perf_counter() - start
+            for sheet_name in missing:
+                values = values_by_sheet.get(sheet_name, [])
+                df = values_to_dataframe(values)
+                fingerprint = values_fingerprint(values)
+                cache.store_tab(file_id, revision, sheet_name, df, {'fingerprint': fingerprint})
+                loaded[sheet_name] = (df, {'source': f'Google Sheets API (batch of {len(missing)})',
+                                           'seconds': seconds, 'fingerprint': fingerprint})
+        return loaded
+
+    if drive_service is None or sheets_ingestion(sheet_properties) != 'export':
+        return LazySheets(sheet_names, load_sheet, load_many), file_name, sheet_properties
+
+    spooled = SpooledExcelFile(drive_service, file_id, engine, export=True)
+    pending = set(sheet_names)
+    export_failed = []
+
+    def load_exported(sheet_name):
+        cached = load_cached(sheet_name)
+        if cached is not None:
+            return cached
+        if not export_failed:
+            try:
+                reader = spooled.reader()
+                # Excel shortens tab names to 31 characters; the export keeps the tab order
+                if len(reader.sheet_names) != len(sheet_names):
+                    raise ValueError(f'{len(reader.sheet_names)} tabs exported, {len(sheet_names)} expected')
+            except (HttpError, ValueError) as e:
+                logger.warning(f'Export of {file_id} failed, reading its tabs with the Sheets API: {e}')
+                export_failed.append(e)
+        if export_failed:
+            return load_values(sheet_name)
+
+        start = time.perf_counter()
+        exported_name = reader.sheet_names[sheet_names.index(sheet_name)]
+        # Cells as the Sheets API would return them, so the tab gets the same headers, dtypes and
+        # fingerprint as one fetched with values().get
+        values = reader.read_sheet_values(exported_name)
+        df = values_to_dataframe(values)
+        sheet_stats = dict(reader.sheet_stats[exported_name], source='Drive export',
+                           seconds=time.perf_counter() - start, fingerprint=values_fingerprint(values),
+                           bytes=int(df.memory_usage(index=True, deep=True).sum()))
+        cache.store_tab(file_id, revision, sheet_name, df, {'fingerprint': sheet_stats['fingerprint']})
+        # Drop the spooled export once every tab is in memory
+        pending.discard(sheet_name)
+        if not pending:
+            spooled.close()
+        return df, sheet_stats
+
+    if manifest is None:
+        load_stats['source'] = 'Drive export'
+    return LazySheets(sheet_names, load_exported), file_name, sheet_properties
+
+
+def values_fingerprint(values, first_row=0, probes=None):
+    """
+    Compact description of a tab's raw values, re-read on refresh to check the loaded rows are
+    unchanged: the row count and REFRESH_PROBE_ROWS sampled rows, from the header to the last row
+    values may be the rows from first_row on only, with probes the rows sampled above first_row
+    by an earlier fingerprint; the sampled rows nearest to the even spread are then kept.
+    """
+    rows = first_row + len(values)
+    earlier = sorted(int(row) for row in probes or {})
+    sampled = {}
+    targets = {round(i * (rows - 1) / (REFRESH_PROBE_ROWS - 1)) for i in range(REFRESH_PROBE_ROWS)} if rows else set()
+    for target in sorted(targets):
+        if target >= first_row:
+            sampled[str(target)] = values[target - first_row]
+        elif earlier:
+            nearest = min(earlier, key=lambda row: abs(row - target))
+            sampled[str(nearest)] = probes[str(nearest)]
+    return {'rows': rows, 'probes': sampled}
+
+
+def refresh_workbook(drive_service, sheets_service, lease, engine=None):
+    """
+    Bring a loaded workbook up to its latest Drive revision, re-fetching as little as possible
+    Only the revision is checked (one files().get call) when the file has not changed. For a
+    changed Google Sheet, one batched values().batchGet re-reads, for each tab already in memory,
+    the rows sampled in its fingerprint plus the rows below the loaded ones up to the tab's new
+    grid height. When the sampled rows are unchanged, a tab with no new rows keeps its DataFrame
+    and cached views, and new rows are parsed and appended to the existing DataFrame, together
+    with its search index, profile and query table. Only tabs whose sampled rows changed are
+    fetched in full, and kept when they parse to the same DataFrame. Edits confined to rows that
+    are not sampled go unnoticed until the tab is reloaded. Tabs whose grid width changed or that
+    are not loaded yet are fetched in full when next opened. Excel files are reloaded.
+    Returns a tuple of (lease on the latest revision, refresh_stats with the outcome per tab)
+    """
+    start = time.perf_counter()
+    engine = engine or get_fetch_engine()
+    store = get_workbook_store()
+    file_id, old_revision = lease.key
+    old_workbook = lease.workbook
+    refresh_stats = {'api_calls': 0, 'bytes': 0, 'tabs': {}}
+    revision = get_file_revision(drive_service, file_id, stats=refresh_stats, engine=engine)
+
+    new_lease = lease if revision == old_revision else store.acquire((file_id, revision))
+    if new_lease is not None:
+        refresh_stats.update(revision=revision, seconds=time.perf_counter() - start,
+                             source='unchanged' if new_lease is lease else 'shared memory')
+        if new_lease is not lease:
+            lease.release()
+        return new_lease, refresh_stats
+
+    file_type = old_workbook.get('file_type')
+    if file_type != GOOGLE_SHEETS_MIME_TYPE or not isinstance(old_workbook['sheets_data'], LazySheets) or \
+            not old_workbook['sheet_properties']:
+        # Excel workbooks have no rows to compare, nor Google Sheets without grid sizes: they are
+        # reloaded in full (lazily), each the way it was opened
+        new_lease, load_stats = load_workbook(drive_service, sheets_service, file_id, file_type,
+                                              old_workbook['file_name'], engine)
+        lease.release()
+        refresh_stats.update(load_stats, revision=revision, seconds=time.perf_counter() - start,
+                             tabs={name: 'reloaded' for name in new_lease.workbook['sheet_names']})
+        return new_lease, refresh_stats
+
+    # Sessions refreshing the same workbook at the same time share one refresh
+    (workbook, tab_stats), shared = get_workbook_flights().do(
+        (file_id, revision, ('refresh', old_revision)),
+        lambda: refresh_google_spreadsheet(drive_service, sheets_service, file_id, old_workbook, revision, engine))
+    if shared:
+        refresh_stats.update(source='shared with a concurrent refresh', tabs=dict(tab_stats['tabs']))
+    else:
+        refresh_stats.update(tab_stats, api_calls=refresh_stats['api_calls'] + tab_stats['api_calls'],
+                             bytes=refresh_stats['bytes'] + tab_stats['bytes'])
+    refresh_stats.update(revision=revision, seconds=time.perf_counter() - start)
+    logger.info(f"Refreshed {file_id}@{old_revision} to {revision} in {refresh_stats['seconds']:.2f}s: "
+                f"{refresh_stats['tabs']}")
+    new_lease = store.put((file_id, revision), workbook)
+    lease.release()
+    return new_lease, refresh_stats
+
+
+def refresh_google_spreadsheet(drive_service, sheets_service, file_id, old_workbook, revision, engine):
+    """
+    Open a newer revision of a loaded Google Sheet, carrying over the tabs that are unchanged or
+    only had rows appended, as described for refresh_workbook
+    Returns a tuple of (workbook dict as kept in the workbook store, refresh_stats)
+    """
+    cache = get_workbook_cache()
+    old_revision = old_workbook['revision']
+    old_sheets = old_workbook['sheets_data']
+    refresh_stats = {'api_calls': 0, 'bytes': 0, 'tabs': {}}
+    sheets_data, file_name, sheet_properties = open_google_spreadsheet(sheets_service, file_id, revision, cache,
+                                                                       refresh_stats, engine, drive_service)
+    old_tab_revisions = old_workbook.get('tab_revisions', {})
+    tab_revisions = {}
+
+    candidates = {}
+    for sheet_name in sheets_data:
+        old_properties = old_workbook['sheet_properties'].get(sheet_name)
+        properties = sheet_properties[sheet_name]
+        fingerprint = old_sheets.sheet_stats[sheet_name].get('fingerprint') \
+            if old_sheets.is_loaded(sheet_name) else None
+        if fingerprint is None or 'probes' not in fingerprint or \
+                old_properties['columnCount'] != properties['columnCount'] or \
+                properties['rowCount'] < fingerprint['rows']:
+            refresh_stats['tabs'][sheet_name] = 'refetch'
+            continue
+        candidates[sheet_name] = fingerprint
+
+    # The sampled rows of every candidate tab and the rows below its loaded ones, in one batch
+    ranges = {}
+    for sheet_name, fingerprint in candidates.items():
+        ranges[sheet_name] = [row_range(sheet_name, int(row) + 1, int(row) + 1) for row in fingerprint['probes']]
+        if sheet_properties[sheet_name]['rowCount'] > fingerprint['rows']:
+            ranges[sheet_name].append(row_range(sheet_name, fingerprint['rows'] + 1,
+                                                sheet_properties[sheet_name]['rowCount']))
+    requested = [range_name for sheet_ranges in ranges.values() for range_name in sheet_ranges]
+    chunks = list(chunk_ranges(requested))
+    fetched = {}
+    for chunk, chunk_values in zip(chunks, engine.map(
+            lambda chunk: get_sheet_ranges(sheets_service, file_id, chunk, stats=refresh_stats, engine=engine),
+            chunks)):
+        fetched.update(zip(chunk, chunk_values))
+
+    query_engine = get_query_engine()
+    changed = []
+    for sheet_name, fingerprint in candidates.items():
+        df = old_sheets[sheet_name]
+        probes = fingerprint['probes']
+        probed = [fetched[range_name] for range_name in ranges[sheet_name]]
+        # A probed row comes back as a one-row list, or empty when the row is blank
+        if any((rows[0] if rows else []) != probes[row] for row, rows in zip(probes, probed)):
+            changed.append(sheet_name)
+            continue
+        appended_rows = probed[len(probes)] if len(probed) > len(probes) else []
+        if not appended_rows:
+            sheets_data.preload(sheet_name, df, dict(old_sheets.sheet_stats[sheet_name]))
+            tab_revisions[sheet_name] = old_tab_revisions.get(sheet_name, old_revision)
+            refresh_stats['tabs'][sheet_name] = 'unchanged'
+            cache.store_tab(file_id, revision, sheet_name, df, {'fingerprint': fingerprint})
+            continue
+
+        appended_df = append_rows(df, appended_rows)
+        if appended_df is None:
+            # The new rows do not fit the columns' dtypes
+            changed.append(sheet_name)
+            continue
+        new_fingerprint = values_fingerprint(appended_rows, fingerprint['rows'], probes)
+        extend_sheet_index(df, appended_df)
+        extend_sheet_profile(df, appended_df)
+        if query_engine is not None:
+            query_engine.extend_table(df, appended_df)
+        sheets_data.preload(sheet_name, appended_df, {'source': 'Google Sheets API (appended rows)',
+                                                      'fingerprint': new_fingerprint})
+        refresh_stats['tabs'][sheet_name] = f'{len(appended_rows)} rows appended'
+        cache.store_tab(file_id, revision, sheet_name, appended_df, {'fingerprint': new_fingerprint})
+
+    values_by_sheet = {}
+    if changed:
+        values_by_sheet, batch_stats = batch_get_sheet_data(sheets_service, file_id, changed, engine=engine)
+        refresh_stats['api_calls'] += batch_stats['api_calls']
+        refresh_stats['bytes'] += batch_stats['bytes']
+    for sheet_name in changed:
+        df = old_sheets[sheet_name]
+        values = values_by_sheet.get(sheet_name, [])
+        new_df = values_to_dataframe(values)
+        new_fingerprint = values_fingerprint(values)
+        if new_df.equals(df):
+            # The same cells written out differently, as when the tab was read from a Drive export:
+            # the loaded tab is kept, with the fingerprint the next refresh compares against
+            sheets_data.preload(sheet_name, df, dict(old_sheets.sheet_stats[sheet_name], fingerprint=new_fingerprint))
+            tab_revisions[sheet_name] = old_tab_revisions.get(sheet_name, old_revision)
+            refresh_stats['tabs'][sheet_name] = 'unchanged'
+        else:
+            df = new_df
+            sheets_data.preload(sheet_name, df, {'source': 'Google Sheets API', 'fingerprint': new_fingerprint})
+            refresh_stats['tabs'][sheet_name] = 'reloaded'
+        cache.store_tab(file_id, revision, sheet_name, df, {'fingerprint': new_fingerprint})
+
+    return {
+        'sheet_names': list(sheets_data),
+        'sheet_properties': sheet_properties,
+        'sheets_data': sheets_data,
+        'file_name': file_name,
+        'revision': revision,
+        'file_type': GOOGLE_SHEETS_MIME_TYPE,
+        # Tabs carried over unchanged keep their revision, so views derived from them stay cached
+        'tab_revisions': tab_revisions,
+    }, refresh_stats
+
+
+class SpooledExcelFile:
+    """
+    Downloads an Excel file, or exports a Google Sheet as one, to a temporary file at most once and
+    hands out its streaming reader
+    """
+
+    def __init__(self, drive_service, file_id, engine=None, export=False):
+        self.drive_service = drive_service
+        self.file_id = file_id
+        self.engine = engine
+        self.export = export
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def reader(self, stats=None):
+        with self._lock:
+            if self._reader is None:
+                stats = stats if stats is not None else {}
+                path = download_excel_to_temp(self.drive_service, self.file_id, stats=stats, engine=self.engine,
+                                              export=self.export)
+                stats['bytes'] = stats.get('bytes', 0) + os.path.getsize(path)
+                self._reader = ExcelWorkbookReader(path)
+            return self._reader
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+
+def open_excel_workbook(drive_service, file_id, revision, file_name, cache, load_stats, engine=None):
+    """
+    Open an Excel workbook whose sheets are materialised only when first accessed
+    Each sheet comes from the disk cache when present, otherwise it is parsed from a spooled
+    download (made at most once) and cached. The download is made up front only when the
+    sheet names are not cached yet.
+    Returns a tuple of (LazySheets, file_name, sheet_properties); Excel grid sizes are not known
+    before parsing, so sheet_properties is empty
+    """
+    spooled = SpooledExcelFile(drive_service, file_id, engine)
+    manifest = cache.get_manifest(file_id, revision) if cache.enabled else None
+    if manifest is None:
+        sheet_names = spooled.reader(load_stats).sheet_names
+        cache.store_manifest(file_id, revision, file_name, sheet_names)
+        load_stats['source'] = 'Drive download'
+    else:
+        sheet_names, file_name = manifest['sheet_names'], manifest['file_name']
+        load_stats['source'] = 'disk cache'
+
+    pending = set(sheet_names)
+
+    def load_sheet(sheet_name):
+        start = time.perf_counter()
+        df = cache.load_tab(file_id, revision, sheet_name, manifest) if manifest else None
+        if df is not None:
+            sheet_stats = {'source': 'disk cache', 'seconds': time.perf_counter() - start}
+        else:
+            reader = spooled.reader()
+            df = reader.read_sheet(sheet_name)
+            sheet_stats = dict(reader.sheet_stats[sheet_name], source='Excel parse')
+            cache.store_tab(file_id, revision, sheet_name, df)
+
+        # Drop the spooled download once every sheet is in memory
+        pending.discard(sheet_name)
+        if not pending:
+            spooled.close()
+        return df, sheet_stats
+
+    return LazySheets(sheet_names, load_sheet), file_name, {}
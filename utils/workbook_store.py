@@ -0,0 +1,114 @@
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class WorkbookStore:
+    """
+    Process-wide store holding one shared copy of each (file ID, revision) workbook
+    Sessions hold leases rather than their own DataFrames; the shared frames must be treated as
+    read-only. Unreferenced workbooks stay resident until the memory budget forces them out,
+    least recently used first.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def acquire(self, key):
+        """Take a lease on a resident workbook, or return None when it is not resident"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry['refs'] += 1
+            self._entries.move_to_end(key)
+            return WorkbookLease(self, key, entry['workbook'])
+
+    def put(self, key, workbook):
+        """
+        Add a workbook and take a lease on it
+        If another session stored the same revision first, its copy is shared and this one dropped
+        """
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = {'workbook': workbook, 'refs': 0, 'nbytes': workbook_nbytes(workbook)}
+                # Lazy workbooks grow past the budget as their sheets load, not only when stored
+                if hasattr(workbook['sheets_data'], 'on_load'):
+                    workbook['sheets_data'].on_load = self.evict
+                logger.info(f"Stored workbook {key} ({self._entries[key]['nbytes'] / 2 ** 20:.1f} MB resident)")
+            lease = self.acquire(key)
+            self.evict()
+            return lease
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['refs'] > 0:
+                entry['refs'] -= 1
+            self.evict()
+
+    def evict(self):
+        """Drop unreferenced workbooks, least recently used first, until within the memory budget"""
+        with self._lock:
+            total = self.total_bytes()
+            for key in list(self._entries):
+                if total <= self.max_bytes:
+                    break
+                entry = self._entries[key]
+                if entry['refs'] == 0:
+                    del self._entries[key]
+                    total -= self._nbytes(entry)
+                    logger.info(f'Evicted workbook {key} from memory')
+            if total > self.max_bytes:
+                logger.warning(f'Workbook store over budget: {total / 2 ** 20:.1f} MB held by active sessions')
+
+    def _nbytes(self, entry):
+        # Lazy workbooks grow as their sheets load, so they are measured on every call
+        if hasattr(entry['workbook']['sheets_data'], 'nbytes'):
+            return workbook_nbytes(entry['workbook'])
+        return entry['nbytes']
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(self._nbytes(entry) for entry in self._entries.values())
+
+    def workbooks(self):
+        """Snapshot of the resident workbooks by (file ID, revision)"""
+        with self._lock:
+            return {key: entry['workbook'] for key, entry in self._entries.items()}
+
+    def resident_bytes(self):
+        """Resident bytes and lease count per (file ID, revision)"""
+        with self._lock:
+            return {key: {'file_name': entry['workbook']['file_name'], 'bytes': self._nbytes(entry),
+                          'refs': entry['refs']}
+                    for key, entry in self._entries.items()}
+
+
+class WorkbookLease:
+    """
+    A session's reference to a shared workbook
+    Released explicitly when the session switches files, or when the lease is garbage collected
+    together with an expired session's state
+    """
+
+    def __init__(self, store, key, workbook):
+        self.key = key
+        self.workbook = workbook
+        self._finalizer = weakref.finalize(self, store.release, key)
+
+    def release(self):
+        self._finalizer()
+
+
+def workbook_nbytes(workbook):
+    """Deep memory usage of all tabs of a workbook, or of the tabs loaded so far for lazy workbooks"""
+    sheets_data = workbook['sheets_data']
+    if hasattr(sheets_data, 'nbytes'):
+        return sheets_data.nbytes()
+    return int(sum(df.memory_usage(index=True, deep=True).sum() for df in sheets_data.values()))